@@ -0,0 +1,288 @@
+"""
+Admission control for response submission and analytics.
+
+Submissions are checked against token buckets per survey and per client IP
+and then wait for one of a fixed number of database write slots. Anything over
+the limits is rejected before touching MongoDB, so one spammed survey cannot use
+up the write capacity shared by every other survey.
+
+Write slots and analytics work (stats, response pages, exports) are scheduled
+together by a WorkloadScheduler. Each workload class has its own concurrency
+limit, both share WORKLOAD_MAX_CONCURRENCY slots, and when slots free up
+waiting submissions are admitted ahead of waiting analytics.
+
+The per-client limit is only applied when the client address can be trusted
+(TRUST_FORWARDED_FOR or CLIENTS_CONNECT_DIRECTLY); behind a proxy the peer
+address is the proxy's, shared by every respondent.
+
+Buckets live in memory by default. Setting RATE_LIMIT_REDIS_URL shares them
+between processes through Redis (requires the ``redis`` package).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# A rate of 0 disables that limiter
+RATE_LIMIT_SURVEY_PER_SECOND = float(os.environ.get("RATE_LIMIT_SURVEY_PER_SECOND", "50"))
+RATE_LIMIT_SURVEY_BURST = float(os.environ.get("RATE_LIMIT_SURVEY_BURST", "200"))
+RATE_LIMIT_CLIENT_PER_SECOND = float(os.environ.get("RATE_LIMIT_CLIENT_PER_SECOND", "2"))
+RATE_LIMIT_CLIENT_BURST = float(os.environ.get("RATE_LIMIT_CLIENT_BURST", "20"))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL")
+MAX_INFLIGHT_WRITES = int(os.environ.get("MAX_INFLIGHT_WRITES", "64"))
+WRITE_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("WRITE_QUEUE_TIMEOUT_SECONDS", "0.5"))
+MAX_INFLIGHT_ANALYTICS = int(os.environ.get("MAX_INFLIGHT_ANALYTICS", "8"))
+ANALYTICS_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ANALYTICS_QUEUE_TIMEOUT_SECONDS", "10"))
+# Slots shared by all workload classes; analytics only gets what submissions leave over
+WORKLOAD_MAX_CONCURRENCY = int(os.environ.get("WORKLOAD_MAX_CONCURRENCY", str(MAX_INFLIGHT_WRITES)))
+# Only enable behind a proxy that sets X-Forwarded-For itself
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# Set when clients connect straight to this server, so the peer address is the respondent's own
+CLIENTS_CONNECT_DIRECTLY = os.environ.get("CLIENTS_CONNECT_DIRECTLY", "false").lower() == "true"
+# Per-client buckets need a trustworthy client address. Behind an ingress or proxy every request comes
+# from the proxy, so all respondents would share one bucket and be rejected together. The per-client
+# limiter is therefore off unless TRUST_FORWARDED_FOR or CLIENTS_CONNECT_DIRECTLY is set.
+CLIENT_ADDRESS_TRUSTED = TRUST_FORWARDED_FOR or CLIENTS_CONNECT_DIRECTLY
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucketLimiter:
+    """In-memory token buckets, least recently used keys evicted beyond ``max_keys``."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def acquire(self, key: str) -> float:
+        """Take a token; return 0 when allowed, otherwise the seconds until one is available."""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisTokenBucketLimiter:
+    """Token buckets shared between processes, updated atomically by a Lua script."""
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, redis, prefix: str, rate: float, burst: float):
+        self.prefix = prefix
+        self.rate = rate
+        self.burst = burst
+        self._script = redis.register_script(self.SCRIPT)
+
+    async def acquire(self, key: str) -> float:
+        try:
+            return float(await self._script(keys=[f"{self.prefix}:{key}"], args=[self.rate, self.burst]))
+        except Exception:
+            # Fail open: losing the shared limiter must not take submissions down with it
+            metrics.inc("admission.limiter_errors")
+            logger.warning("Shared rate limiter unavailable", exc_info=True)
+            return 0.0
+
+
+def client_ip(request) -> Optional[str]:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else None
+
+
+def build_limiter(name: str, rate: float, burst: float, redis=None):
+    if rate <= 0:
+        return None
+    if redis is not None:
+        return RedisTokenBucketLimiter(redis, f"ratelimit:{name}", rate, burst)
+    return TokenBucketLimiter(rate, burst)
+
+
+class WorkloadScheduler:
+    """Concurrency slots shared by workload classes, granted to waiters in priority order."""
+
+    def __init__(self, capacity: int, limits: Dict[str, int], priorities: Dict[str, int]):
+        self.capacity = capacity
+        self.limits = limits
+        # Lower numbers go first
+        self.priorities = priorities
+        self.inflight = {workload: 0 for workload in limits}
+        self.queued = {workload: 0 for workload in limits}
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def _can_run(self, workload: str) -> bool:
+        return sum(self.inflight.values()) < self.capacity and self.inflight[workload] < self.limits[workload]
+
+    def _wake(self) -> None:
+        blocked = []
+        while self._waiters and sum(self.inflight.values()) < self.capacity:
+            waiter = heapq.heappop(self._waiters)
+            workload, future = waiter[2], waiter[3]
+            if future.done():
+                continue
+            if self.inflight[workload] >= self.limits[workload]:
+                blocked.append(waiter)
+                continue
+            self.inflight[workload] += 1
+            future.set_result(None)
+        for waiter in blocked:
+            heapq.heappush(self._waiters, waiter)
+
+    async def acquire(self, workload: str, timeout: Optional[float] = None) -> bool:
+        """Take a slot; return whether it had to wait. Raises asyncio.TimeoutError after ``timeout``."""
+        # Waiters left over after _wake cannot run, so a newcomer that can does not jump the queue
+        if self._can_run(workload):
+            self.inflight[workload] += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (self.priorities[workload], next(self._order), workload, future))
+        self.queued[workload] += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            # The slot may have been granted just as the wait ended
+            if future.done() and not future.cancelled():
+                self.release(workload)
+            raise
+        finally:
+            self.queued[workload] -= 1
+        return True
+
+    def release(self, workload: str) -> None:
+        self.inflight[workload] -= 1
+        self._wake()
+
+
+class AdmissionController:
+    def __init__(self, survey_limiter=None, client_limiter=None, max_inflight_writes: int = MAX_INFLIGHT_WRITES,
+                 queue_timeout: float = WRITE_QUEUE_TIMEOUT_SECONDS,
+                 max_inflight_analytics: int = MAX_INFLIGHT_ANALYTICS,
+                 analytics_queue_timeout: float = ANALYTICS_QUEUE_TIMEOUT_SECONDS,
+                 max_concurrency: int = WORKLOAD_MAX_CONCURRENCY):
+        self.survey_limiter = survey_limiter
+        self.client_limiter = client_limiter
+        self.queue_timeout = queue_timeout
+        self.analytics_queue_timeout = analytics_queue_timeout
+        self.scheduler = WorkloadScheduler(
+            max_concurrency,
+            limits={"ingest": max_inflight_writes, "analytics": max_inflight_analytics},
+            priorities={"ingest": 0, "analytics": 1},
+        )
+        metrics.gauge("admission.inflight_writes", lambda: self.scheduler.inflight["ingest"])
+        metrics.gauge("admission.queued_writes", lambda: self.scheduler.queued["ingest"])
+        metrics.gauge("admission.inflight_analytics", lambda: self.scheduler.inflight["analytics"])
+        metrics.gauge("admission.queued_analytics", lambda: self.scheduler.queued["analytics"])
+
+    async def check_rate(self, survey_id: str, client_ip: Optional[str]) -> None:
+        if self.survey_limiter is not None:
+            wait = await self.survey_limiter.acquire(survey_id)
+            if wait > 0:
+                metrics.inc("admission.rejected.survey_rate")
+                raise AdmissionRejected("Too many responses for this survey", wait)
+        if self.client_limiter is not None and client_ip:
+            wait = await self.client_limiter.acquire(client_ip)
+            if wait > 0:
+                metrics.inc("admission.rejected.client_rate")
+                raise AdmissionRejected("Too many responses from this client", wait)
+
+    async def acquire(self, workload: str) -> None:
+        """Take a slot for ``workload``, raising AdmissionRejected when none frees up in time."""
+        if workload == "ingest":
+            timeout, queued, rejected = self.queue_timeout, "admission.queued", "admission.rejected.concurrency"
+        else:
+            timeout = self.analytics_queue_timeout
+            queued, rejected = "admission.analytics_queued", "admission.rejected.analytics_concurrency"
+        try:
+            if await self.scheduler.acquire(workload, timeout):
+                metrics.inc(queued)
+        except asyncio.TimeoutError:
+            metrics.inc(rejected)
+            raise AdmissionRejected("Server is busy", timeout)
+
+    def release(self, workload: str) -> None:
+        self.scheduler.release(workload)
+
+    @asynccontextmanager
+    async def write_slot(self) -> AsyncIterator[None]:
+        """Hold one of the write slots, waiting at most ``queue_timeout`` for it."""
+        await self.acquire("ingest")
+        try:
+            yield
+        finally:
+            self.release("ingest")
+
+    @asynccontextmanager
+    async def analytics_slot(self) -> AsyncIterator[None]:
+        """Hold one of the analytics slots, waiting at most ``analytics_queue_timeout`` for it."""
+        await self.acquire("analytics")
+        try:
+            yield
+        finally:
+            self.release("analytics")
+
+
+def build_admission_controller(client_address_trusted: bool = CLIENT_ADDRESS_TRUSTED) -> AdmissionController:
+    redis = None
+    if RATE_LIMIT_REDIS_URL:
+        import redis.asyncio as aioredis
+
+        redis = aioredis.from_url(RATE_LIMIT_REDIS_URL)
+    client_rate = RATE_LIMIT_CLIENT_PER_SECOND
+    if client_rate > 0 and not client_address_trusted:
+        logger.warning(
+            "Per-client rate limit disabled: set TRUST_FORWARDED_FOR behind a proxy that sets X-Forwarded-For, "
+            "or CLIENTS_CONNECT_DIRECTLY when there is no proxy"
+        )
+        client_rate = 0
+    return AdmissionController(
+        survey_limiter=build_limiter("survey", RATE_LIMIT_SURVEY_PER_SECOND, RATE_LIMIT_SURVEY_BURST, redis),
+        client_limiter=build_limiter("client", client_rate, RATE_LIMIT_CLIENT_BURST, redis),
+    )
@@ -0,0 +1,187 @@
+"""
+Cold storage of old responses in Parquet files.
+
+Responses older than ARCHIVE_AFTER_DAYS are moved out of MongoDB into
+per-survey, per-month Parquet partitions on local disk:
+
+    ARCHIVE_DIR/survey_id=<id>/month=<YYYY-MM>/part-<hash>.parquet
+    ARCHIVE_DIR/survey_id=<id>/month=<YYYY-MM>/part-<hash>.summary.json
+
+Each part has a summary with its response count and serialized per-question
+stats, so stats over archived data never read the Parquet files themselves.
+Part names are derived from the archived documents, so re-running a batch that
+was written but not yet deleted from MongoDB overwrites the same part instead of
+duplicating it.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from stats import StatsAccumulator
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", Path(__file__).parent / "archive"))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "50000"))
+# 0 disables the periodic job; `cli.py archive` can still be run by hand or from cron
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("ARCHIVE_INTERVAL_SECONDS", "0"))
+ARCHIVE_READ_BATCH_ROWS = 10000
+
+
+def survey_archive_dir(survey_id: str, root: Path = ARCHIVE_DIR) -> Path:
+    return root / f"survey_id={survey_id}"
+
+
+def write_part(survey: Dict[str, Any], month: str, responses: List[Dict[str, Any]], root: Path = ARCHIVE_DIR) -> Path:
+    """Write one Parquet part and its summary; returns the part path."""
+    digest = hashlib.sha1(
+        f"{responses[0]['id']}:{responses[-1]['id']}:{len(responses)}".encode("utf-8")
+    ).hexdigest()[:16]
+    directory = survey_archive_dir(survey["id"], root) / f"month={month}"
+    directory.mkdir(parents=True, exist_ok=True)
+    part = directory / f"part-{digest}.parquet"
+    summary_path = directory / f"part-{digest}.summary.json"
+
+    frame = pd.DataFrame({
+        "id": [r["id"] for r in responses],
+        "survey_id": [r["survey_id"] for r in responses],
+        "submitted_at": pd.to_datetime([r["submitted_at"] for r in responses]),
+        # Answers stay JSON so parts written before a survey edit remain readable
+        "responses": [json.dumps(r.get("responses", {}), default=str) for r in responses],
+    })
+    stats = StatsAccumulator(survey.get("questions", [])).add_all(responses)
+    summary = {
+        "count": len(responses),
+        "first_submitted_at": responses[0]["submitted_at"].isoformat(),
+        "last_submitted_at": responses[-1]["submitted_at"].isoformat(),
+        "stats": stats.to_state(),
+    }
+
+    # Readers only consider parts that have a summary, so it is renamed into place last
+    tmp_part = part.with_suffix(".parquet.tmp")
+    frame.to_parquet(
+        tmp_part, index=False, compression="zstd", coerce_timestamps="us", allow_truncated_timestamps=True
+    )
+    tmp_summary = summary_path.with_suffix(".json.tmp")
+    tmp_summary.write_text(json.dumps(summary))
+    os.replace(tmp_part, part)
+    os.replace(tmp_summary, summary_path)
+    return part
+
+
+def read_summaries(survey_id: str, root: Path = ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    directory = survey_archive_dir(survey_id, root)
+    if not directory.exists():
+        return []
+    return [json.loads(path.read_text()) for path in sorted(directory.glob("month=*/part-*.summary.json"))]
+
+
+def load_archived_stats(survey: Dict[str, Any], root: Path = ARCHIVE_DIR) -> StatsAccumulator:
+    """Exact stats over all archived responses of a survey, merged from part summaries."""
+    stats = StatsAccumulator(survey.get("questions", []))
+    for summary in read_summaries(survey["id"], root):
+        stats.merge_state(summary["stats"])
+    return stats
+
+
+def iter_archived_responses(survey_id: str, root: Path = ARCHIVE_DIR) -> Iterator[Dict[str, Any]]:
+    """Archived responses of a survey, oldest partition first, read in bounded batches."""
+    directory = survey_archive_dir(survey_id, root)
+    if not directory.exists():
+        return
+    # Part names are hashes, so parts within a month are ordered by their first submission
+    summary_paths = sorted(
+        directory.glob("month=*/part-*.summary.json"),
+        key=lambda path: (path.parent.name, json.loads(path.read_text())["first_submitted_at"]),
+    )
+    for summary_path in summary_paths:
+        part = summary_path.with_name(summary_path.name.replace(".summary.json", ".parquet"))
+        for batch in pq.ParquetFile(part).iter_batches(batch_size=ARCHIVE_READ_BATCH_ROWS):
+            columns = batch.to_pydict()
+            for response_id, owner, submitted_at, answers in zip(
+                columns["id"], columns["survey_id"], columns["submitted_at"], columns["responses"]
+            ):
+                yield {
+                    "id": response_id,
+                    "survey_id": owner,
+                    "submitted_at": submitted_at,
+                    "responses": json.loads(answers),
+                }
+
+
+def remove_survey_archive(survey_id: str, root: Path = ARCHIVE_DIR) -> None:
+    shutil.rmtree(survey_archive_dir(survey_id, root), ignore_errors=True)
+
+
+async def archive_survey(
+    db, survey: Dict[str, Any], cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE, root: Path = ARCHIVE_DIR
+) -> int:
+    """Move responses of ``survey`` submitted before ``cutoff`` into Parquet; returns the number moved."""
+    moved = 0
+    query = {"survey_id": survey["id"], "submitted_at": {"$lt": cutoff}}
+    while True:
+        batch = await db.responses.find(query).sort([("submitted_at", 1), ("_id", 1)]).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return moved
+
+        months: Dict[str, List[Dict[str, Any]]] = {}
+        for response in batch:
+            months.setdefault(response["submitted_at"].strftime("%Y-%m"), []).append(response)
+        for month, responses in months.items():
+            await asyncio.to_thread(write_part, survey, month, responses, root)
+
+        # Only delete once the parts are on disk
+        await db.responses.delete_many({"_id": {"$in": [response["_id"] for response in batch]}})
+        moved += len(batch)
+        if len(batch) < batch_size:
+            return moved
+
+
+async def archive_old_responses(db, days: int = ARCHIVE_AFTER_DAYS, root: Path = ARCHIVE_DIR) -> Dict[str, int]:
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    survey_ids = await db.responses.distinct("survey_id", {"submitted_at": {"$lt": cutoff}})
+    moved = {}
+    for survey_id in survey_ids:
+        survey = await db.surveys.find_one({"id": survey_id})
+        if survey is None:
+            # Orphans are purged, not archived
+            continue
+        moved[survey_id] = await archive_survey(db, survey, cutoff, root=root)
+    return moved
+
+
+class ArchiveScheduler:
+    def __init__(self, db, interval: float = ARCHIVE_INTERVAL_SECONDS):
+        self.db = db
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                moved = await archive_old_responses(self.db)
+                if moved:
+                    logger.info("Archived old responses: %s", moved)
+            except Exception:
+                logger.exception("Archiving old responses failed")
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
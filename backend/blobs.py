@@ -0,0 +1,142 @@
+"""
+Large free-text answers kept out of the response documents.
+
+Stats scans, response pages and the working set all pay for every byte of
+a response document, though hardly anything reads the full text of long
+answers. When a response is stored in MongoDB, each string answer longer than
+ANSWER_BLOB_MIN_BYTES is moved into the ``answer_blobs`` collection, and the
+response keeps a compact reference in its place::
+
+    {"blob_id": "<response id>:<question id>", "preview": "<first characters>", "length": <characters>}
+
+The full text is loaded only when a client asks for it, and by exports, which
+expand the references one batch at a time. Blob ids are derived from the
+response, so storing the same response twice (e.g. a spool replay) rewrites
+the same blob. Blobs are written before their response; when the response is
+then rejected (e.g. as a duplicate submission), its blobs are deleted again.
+"""
+
+import copy
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 0 keeps every answer inline
+ANSWER_BLOB_MIN_BYTES = int(os.environ.get("ANSWER_BLOB_MIN_BYTES", "2048"))
+ANSWER_PREVIEW_CHARS = int(os.environ.get("ANSWER_PREVIEW_CHARS", "200"))
+
+BLOB_INDEX_KEYS = [("survey_id", 1)]
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, dict) and "blob_id" in value
+
+
+def offload_answers(
+    response: Dict[str, Any], min_bytes: int = ANSWER_BLOB_MIN_BYTES, preview_chars: int = ANSWER_PREVIEW_CHARS
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Split out long answers: returns the response to store (a copy when changed) and its blob documents."""
+    if min_bytes <= 0:
+        return response, []
+    blobs = []
+    answers = response.get("responses", {})
+    for question_id, answer in answers.items():
+        # Encoding is only needed when the answer could be long enough (UTF-8 takes at most 4 bytes a character)
+        if isinstance(answer, str) and len(answer) * 4 > min_bytes and len(answer.encode("utf-8")) > min_bytes:
+            blobs.append({
+                "_id": f"{response['id']}:{question_id}",
+                "survey_id": response["survey_id"],
+                "response_id": response["id"],
+                "question_id": question_id,
+                "text": answer,
+            })
+    if not blobs:
+        return response, []
+
+    stored = copy.copy(response)
+    stored["responses"] = dict(answers)
+    for blob in blobs:
+        text = blob["text"]
+        stored["responses"][blob["question_id"]] = {
+            "blob_id": blob["_id"],
+            "preview": text[:preview_chars],
+            "length": len(text),
+        }
+    return stored, blobs
+
+
+def offload_batch(responses: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    stored, blobs = [], []
+    for response in responses:
+        document, response_blobs = offload_answers(response)
+        stored.append(document)
+        blobs.extend(response_blobs)
+    return stored, blobs
+
+
+async def store_blobs(db, blobs: List[Dict[str, Any]]) -> None:
+    """Write blobs before the responses referring to them, so a stored reference always resolves."""
+    if not blobs:
+        return
+    await db.answer_blobs.bulk_write(
+        [ReplaceOne({"_id": blob["_id"]}, blob, upsert=True) for blob in blobs], ordered=False
+    )
+    metrics.inc("answer_blobs_stored", len(blobs))
+
+
+async def discard_blobs(db, responses: List[Dict[str, Any]]) -> None:
+    """Delete the blobs of stored copies in ``responses`` whose insert was rejected.
+
+    A rejected response whose id is stored after all is a replay of that very
+    response and shares its blobs, so those are kept. Best effort: a blob left
+    behind only wastes space.
+    """
+    response_ids = [
+        response["id"] for response in responses
+        if any(is_blob_ref(answer) for answer in response.get("responses", {}).values())
+    ]
+    if not response_ids:
+        return
+    try:
+        stored = {doc["id"] async for doc in db.responses.find({"id": {"$in": response_ids}}, {"_id": 0, "id": 1})}
+        orphaned = [response_id for response_id in response_ids if response_id not in stored]
+        if orphaned:
+            result = await db.answer_blobs.delete_many({"response_id": {"$in": orphaned}})
+            metrics.inc("answer_blobs_discarded", result.deleted_count)
+    except PyMongoError:
+        logger.exception("Could not delete the answer blobs of %d rejected responses", len(response_ids))
+
+
+def apply_blobs(responses: List[Dict[str, Any]], texts: Dict[str, str]) -> None:
+    """Replace references in ``responses`` (in place) by the full texts in ``texts``, keyed by blob id."""
+    for response in responses:
+        answers = response.get("responses", {})
+        for question_id, answer in answers.items():
+            if is_blob_ref(answer) and answer["blob_id"] in texts:
+                answers[question_id] = texts[answer["blob_id"]]
+
+
+async def expand_answers(db, responses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Load the full text of every referenced answer in ``responses`` with one query."""
+    blob_ids = [
+        answer["blob_id"]
+        for response in responses
+        for answer in response.get("responses", {}).values()
+        if is_blob_ref(answer)
+    ]
+    if blob_ids:
+        cursor = db.answer_blobs.find({"_id": {"$in": blob_ids}}, {"text": 1})
+        apply_blobs(responses, {blob["_id"]: blob["text"] async for blob in cursor})
+    return responses
+
+
+async def load_blob(db, blob_id: str, **find_options) -> Optional[str]:
+    blob = await db.answer_blobs.find_one({"_id": blob_id}, {"text": 1}, **find_options)
+    return None if blob is None else blob["text"]
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Command line tools for the survey backend.
+
+Run from the backend directory so the .env file is picked up:
+
+    python cli.py seed --surveys 10 --responses 1000000
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv(Path(__file__).parent / ".env")
+
+from archive import ARCHIVE_AFTER_DAYS, archive_old_responses
+from blobs import expand_answers
+from models import Question, QuestionOption, Survey, default_templates
+from purge import PURGE_BATCH_DELAY_SECONDS, PURGE_BATCH_SIZE, find_orphaned_survey_ids, purge_survey_data
+from sketches import SketchStore
+from stats import StatsAccumulator
+from storage import MongoStore, SqliteStore, SurveyStore
+
+cli = typer.Typer(help="Maintenance and benchmarking tools for the survey backend.")
+
+
+def get_database(mongo_url: Optional[str], db_name: Optional[str]):
+    client = AsyncIOMotorClient(mongo_url or os.environ["MONGO_URL"])
+    return client, client[db_name or os.environ["DB_NAME"]]
+
+
+# Synthetic data generation
+FIRST_NAMES = ["alex", "sam", "jordan", "taylor", "morgan", "casey", "riley", "jamie", "avery", "quinn"]
+EMAIL_DOMAINS = ["example.com", "mail.test", "corp.example", "inbox.test"]
+TEXT_FRAGMENTS = [
+    "Great experience overall",
+    "The checkout process was slow",
+    "Support answered quickly",
+    "Would like more payment options",
+    "Pricing is a bit high",
+    "The mobile app keeps logging me out",
+    "Loved the new dashboard",
+    "Documentation could be clearer",
+    "Delivery arrived earlier than expected",
+    "Nothing to add",
+]
+EXTRA_QUESTION_TYPES = ["rating", "multiple_choice", "checkbox", "text", "email", "phone"]
+
+
+def build_extra_question(rng: random.Random, index: int, options_per_question: int) -> Question:
+    question_type = EXTRA_QUESTION_TYPES[index % len(EXTRA_QUESTION_TYPES)]
+    question = Question(type=question_type, title=f"Generated question {index + 1}", required=rng.random() < 0.5)
+    if question_type in ("multiple_choice", "checkbox"):
+        question.options = [
+            QuestionOption(text=f"Choice {n + 1}", value=f"choice_{n + 1}") for n in range(options_per_question)
+        ]
+    elif question_type == "rating":
+        question.min_rating = 1
+        question.max_rating = rng.choice([5, 7, 10])
+    return question
+
+
+def build_answer_generator(question: Question, rng: random.Random) -> Callable[[random.Random], Any]:
+    """Build a generator producing answers that honour the question's constraints."""
+    values = [option.value for option in question.options or []]
+
+    if question.type == "rating":
+        low = question.min_rating if question.min_rating is not None else 1
+        high = question.max_rating if question.max_rating is not None else 5
+        ratings = list(range(low, high + 1))
+        # Ratings cluster in the upper-middle of the scale, like real feedback does
+        peak = low + (high - low) * 0.7
+        weights = [1.0 / (1.0 + abs(r - peak)) ** 2 for r in ratings]
+        return lambda r: r.choices(ratings, weights)[0]
+
+    if question.type == "multiple_choice" and values:
+        # Zipf-like popularity with a per-survey ordering
+        ranked = values[:]
+        rng.shuffle(ranked)
+        weights = [1.0 / (rank + 1) for rank in range(len(ranked))]
+        return lambda r: r.choices(ranked, weights)[0]
+
+    if question.type == "checkbox" and values:
+        probabilities = [rng.uniform(0.1, 0.7) for _ in values]
+
+        def checkbox_answer(r: random.Random) -> List[str]:
+            picked = [value for value, p in zip(values, probabilities) if r.random() < p]
+            return picked or [r.choice(values)]
+
+        return checkbox_answer
+
+    if question.type == "email":
+        return lambda r: f"{r.choice(FIRST_NAMES)}.{r.randrange(100000)}@{r.choice(EMAIL_DOMAINS)}"
+
+    if question.type == "phone":
+        return lambda r: f"+1-555-{r.randrange(100, 1000)}-{r.randrange(10000):04d}"
+
+    def text_answer(r: random.Random) -> str:
+        return ". ".join(r.sample(TEXT_FRAGMENTS, r.randint(1, 3)))
+
+    return text_answer
+
+
+def build_surveys(
+    rng: random.Random, count: int, categories: List[str], extra_questions: int, options_per_question: int
+) -> List[Survey]:
+    templates = default_templates()
+    if categories:
+        templates = [t for t in templates if t.template_category in categories]
+        if not templates:
+            raise typer.BadParameter(f"No built-in templates in categories {categories}")
+
+    surveys = []
+    for n in range(count):
+        template = templates[n % len(templates)]
+        questions = [Question(**q.dict(exclude={"id"})) for q in template.questions]
+        questions += [build_extra_question(rng, i, options_per_question) for i in range(extra_questions)]
+        surveys.append(
+            Survey(
+                title=f"{template.title} (seed {n + 1})",
+                description=template.description,
+                questions=questions,
+            )
+        )
+    return surveys
+
+
+def build_response_factory(survey: Survey, rng: random.Random, optional_rate: float, days: int, skew: float):
+    generators = [(q.id, q.required, build_answer_generator(q, rng)) for q in survey.questions]
+    now = datetime.utcnow()
+    span = timedelta(days=days).total_seconds()
+
+    def make_response(r: random.Random) -> Dict[str, Any]:
+        answers = {}
+        for question_id, required, generate in generators:
+            if required or r.random() < optional_rate:
+                answers[question_id] = generate(r)
+        # Beta(1, skew) puts most responses close to "now" with a long tail into the past
+        age = span * r.betavariate(1.0, skew)
+        return {
+            "id": str(uuid.uuid4()),
+            "survey_id": survey.id,
+            "responses": answers,
+            "submitted_at": now - timedelta(seconds=age),
+        }
+
+    return make_response
+
+
+async def insert_responses(
+    db, factories, total: int, batch_size: int, concurrency: int, seed: Optional[int], report_every: float
+) -> None:
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    inserted = 0
+    started = time.perf_counter()
+    last_report = started
+    tasks: List[asyncio.Task] = []
+    failures: List[BaseException] = []
+
+    async def insert_batch(batch: List[Dict[str, Any]]) -> None:
+        nonlocal inserted, last_report
+        try:
+            await db.responses.insert_many(batch, ordered=False)
+        except Exception as e:
+            failures.append(e)
+            return
+        finally:
+            semaphore.release()
+        inserted += len(batch)
+        now = time.perf_counter()
+        if now - last_report >= report_every:
+            last_report = now
+            rate = inserted / (now - started)
+            typer.echo(f"  {inserted:,}/{total:,} responses ({rate:,.0f} docs/s)")
+
+    remaining = total
+    # Stop generating batches after the first failure; the ones in flight still finish
+    while remaining > 0 and not failures:
+        size = min(batch_size, remaining)
+        remaining -= size
+        # Spread each batch across the surveys so every survey grows at the same pace
+        batch = [rng.choice(factories)(rng) for _ in range(size)]
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(insert_batch(batch)))
+
+    await asyncio.gather(*tasks)
+    if failures:
+        typer.echo(f"{len(failures)} batches failed after inserting {inserted:,} responses: {failures[0]!r}", err=True)
+        raise typer.Exit(code=1)
+
+    elapsed = time.perf_counter() - started
+    typer.echo(
+        f"Inserted {inserted:,} responses in {elapsed:.1f}s "
+        f"({inserted / elapsed if elapsed else 0:,.0f} docs/s, batch={batch_size}, concurrency={concurrency})"
+    )
+
+
+@cli.command()
+def seed(
+    surveys: int = typer.Option(5, help="Number of surveys to create."),
+    responses: int = typer.Option(100_000, help="Total number of responses to insert across all surveys."),
+    category: List[str] = typer.Option([], help="Only clone built-in templates in this category (repeatable)."),
+    extra_questions: int = typer.Option(0, help="Generated questions appended to every survey."),
+    options_per_question: int = typer.Option(5, help="Options for generated choice/checkbox questions."),
+    optional_rate: float = typer.Option(0.6, min=0.0, max=1.0, help="Probability of answering an optional question."),
+    days: int = typer.Option(90, min=1, help="Spread submissions over this many days."),
+    skew: float = typer.Option(3.0, min=1.0, help="Recency skew of submission times (1 = uniform)."),
+    batch_size: int = typer.Option(5_000, min=1, help="Documents per insert_many call."),
+    concurrency: int = typer.Option(8, min=1, help="insert_many batches in flight at once."),
+    random_seed: Optional[int] = typer.Option(None, "--seed", help="Random seed for reproducible data."),
+    report_every: float = typer.Option(5.0, help="Seconds between progress reports."),
+    mongo_url: Optional[str] = typer.Option(None, help="Defaults to MONGO_URL."),
+    db_name: Optional[str] = typer.Option(None, help="Defaults to DB_NAME."),
+):
+    """Create surveys from the built-in templates and fill them with synthetic responses."""
+    rng = random.Random(random_seed)
+    created = build_surveys(rng, surveys, category, extra_questions, options_per_question)
+    factories = [build_response_factory(s, rng, optional_rate, days, skew) for s in created]
+
+    async def run():
+        client, db = get_database(mongo_url, db_name)
+        try:
+            await db.surveys.insert_many([s.dict() for s in created])
+            typer.echo(f"Created {len(created)} surveys")
+            for s in created:
+                typer.echo(f"  {s.id}  {s.title} ({len(s.questions)} questions)")
+            await insert_responses(db, factories, responses, batch_size, concurrency, random_seed, report_every)
+        finally:
+            client.close()
+
+    asyncio.run(run())
+
+
+@cli.command("purge-orphans")
+def purge_orphans(
+    dry_run: bool = typer.Option(False, help="Only list orphaned survey ids."),
+    batch_size: int = typer.Option(PURGE_BATCH_SIZE, min=1, help="Documents per delete_many call."),
+    delay: float = typer.Option(PURGE_BATCH_DELAY_SECONDS, min=0.0, help="Seconds to sleep between batches."),
+    mongo_url: Optional[str] = typer.Option(None, help="Defaults to MONGO_URL."),
+    db_name: Optional[str] = typer.Option(None, help="Defaults to DB_NAME."),
+):
+    """Find data belonging to surveys that no longer exist and delete it."""
+
+    async def run():
+        client, db = get_database(mongo_url, db_name)
+        try:
+            orphans = await find_orphaned_survey_ids(db)
+            typer.echo(f"Found {len(orphans)} deleted surveys with leftover data")
+            for survey_id in orphans:
+                typer.echo(f"  {survey_id}")
+                if not dry_run:
+                    deleted = await purge_survey_data(db, [survey_id], batch_size, delay)
+                    typer.echo("    " + ", ".join(f"{name}: {count:,}" for name, count in deleted.items()))
+        finally:
+            client.close()
+
+    asyncio.run(run())
+
+
+@cli.command("rebuild-sketches")
+def rebuild_sketches(
+    survey_id: List[str] = typer.Option([], help="Only rebuild these surveys (repeatable); defaults to all."),
+    batch_size: int = typer.Option(1_000, min=1, help="Responses read (and long answers expanded) per batch."),
+    mongo_url: Optional[str] = typer.Option(None, help="Defaults to MONGO_URL."),
+    db_name: Optional[str] = typer.Option(None, help="Defaults to DB_NAME."),
+):
+    """Recompute free-text answer sketches from stored responses, e.g. after seeding."""
+
+    async def run():
+        client, db = get_database(mongo_url, db_name)
+        store = SketchStore(db)
+        query = {"is_template": False}
+        if survey_id:
+            query["id"] = {"$in": survey_id}
+        try:
+            async for survey in db.surveys.find(query):
+                await db.survey_sketches.delete_many({"survey_id": survey["id"]})
+                count = 0
+                cursor = db.responses.find({"survey_id": survey["id"]}).batch_size(batch_size)
+                while True:
+                    batch = await cursor.to_list(batch_size)
+                    if not batch:
+                        break
+                    # Long answers are stored as blob references; sketch their full text as submitted
+                    for response in await expand_answers(db, batch):
+                        store.observe(survey, response)
+                    count += len(batch)
+                await store.flush()
+                typer.echo(f"  {survey['id']}  {count:,} responses")
+        finally:
+            client.close()
+
+    asyncio.run(run())
+
+
+@cli.command()
+def archive(
+    days: int = typer.Option(ARCHIVE_AFTER_DAYS, min=1, help="Archive responses older than this many days."),
+    mongo_url: Optional[str] = typer.Option(None, help="Defaults to MONGO_URL."),
+    db_name: Optional[str] = typer.Option(None, help="Defaults to DB_NAME."),
+):
+    """Move old responses from MongoDB into per-survey Parquet partitions."""
+
+    async def run():
+        client, db = get_database(mongo_url, db_name)
+        try:
+            started = time.perf_counter()
+            moved = await archive_old_responses(db, days)
+            for survey_id, count in moved.items():
+                typer.echo(f"  {survey_id}  {count:,} responses")
+            typer.echo(f"Archived {sum(moved.values()):,} responses in {time.perf_counter() - started:.1f}s")
+        finally:
+            client.close()
+
+    asyncio.run(run())
+
+
+async def benchmark_store(
+    store: SurveyStore, survey: Survey, make_response, responses: int, concurrency: int, reads: int, seed: Optional[int]
+) -> Dict[str, float]:
+    """Seconds taken by each core operation against one store."""
+    rng = random.Random(seed)
+    timings = {}
+    await store.ensure_indexes()
+    await store.insert_surveys([survey.dict()])
+    documents = [make_response(rng) for _ in range(responses)]
+
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def insert(document):
+        async with semaphore:
+            await store.insert_response(document)
+
+    await asyncio.gather(*(insert(document) for document in documents))
+    timings["insert_response"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(reads):
+        await store.get_survey(survey.id)
+    timings["get_survey"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for page in range(reads):
+        await store.list_responses(survey.id, (page % 10) * 100, 100)
+    timings["list_responses"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await store.count_responses(survey.id)
+    await store.response_stats(survey.dict(), StatsAccumulator(survey.dict()["questions"]))
+    timings["response_stats"] = time.perf_counter() - started
+    return timings
+
+
+@cli.command("benchmark-storage")
+def benchmark_storage(
+    backend: List[str] = typer.Option(["sqlite", "mongo"], help="Backends to compare (repeatable)."),
+    responses: int = typer.Option(10_000, min=1, help="Responses inserted one by one, as submissions are."),
+    concurrency: int = typer.Option(16, min=1, help="Submissions in flight at once."),
+    reads: int = typer.Option(1_000, min=1, help="Repetitions of each read operation."),
+    random_seed: Optional[int] = typer.Option(None, "--seed", help="Random seed for reproducible data."),
+    mongo_url: Optional[str] = typer.Option(None, help="Defaults to MONGO_URL."),
+):
+    """Compare storage backends on the core API operations, each against a fresh, throwaway database."""
+    rng = random.Random(random_seed)
+    survey = build_surveys(rng, 1, [], 0, 5)[0]
+    make_response = build_response_factory(survey, rng, 0.6, 90, 3.0)
+
+    async def run_backend(name: str) -> Dict[str, float]:
+        if name == "sqlite":
+            with tempfile.TemporaryDirectory() as directory:
+                store = SqliteStore(Path(directory) / "benchmark.db")
+                try:
+                    return await benchmark_store(store, survey, make_response, responses, concurrency, reads, random_seed)
+                finally:
+                    await store.close()
+        if name == "mongo":
+            client, db = get_database(mongo_url, f"survey_benchmark_{uuid.uuid4().hex[:8]}")
+            try:
+                return await benchmark_store(MongoStore(db), survey, make_response, responses, concurrency, reads, random_seed)
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+        raise typer.BadParameter(f"Unknown backend {name!r}")
+
+    results = {name: asyncio.run(run_backend(name)) for name in backend}
+    counts = {"insert_response": responses, "get_survey": reads, "list_responses": reads, "response_stats": 1}
+    typer.echo(f"{'operation':<16}" + "".join(f"{name:>22}" for name in results))
+    for operation, count in counts.items():
+        cells = "".join(
+            f" {timings[operation]:>9.2f}s {count / timings[operation]:>8,.0f}/s" for timings in results.values()
+        )
+        typer.echo(f"{operation:<16}{cells}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,256 @@
+"""
+Negotiated response compression.
+
+``CompressionMiddleware`` compresses JSON, CSV and other text responses with
+the first encoding in COMPRESSION_ENCODINGS that the client accepts. Bodies
+smaller than COMPRESSION_MIN_BYTES are sent as they are. Streaming responses,
+such as CSV exports, are compressed chunk by chunk, and each chunk is flushed
+so the client receives it straight away. Responses that already have a
+``Content-Encoding`` pass through untouched. Server-Sent Events and binary
+formats are never compressed.
+
+``PayloadCache`` keeps hot, rarely changing payloads (the template catalogue
+and survey definitions) serialized and pre-compressed with every encoding, so
+they are not re-encoded on every request. Entries are keyed by a version, such
+as ``updated_at``, so a stale payload is never served.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import brotli
+import zstandard
+
+from metrics import metrics
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+    if encoding.strip()
+]
+PAYLOAD_CACHE_SIZE = int(os.environ.get("PAYLOAD_CACHE_SIZE", "1000"))
+
+# Fast levels for per-request compression; pre-compressed payloads are encoded once, so they use the best
+GZIP_LEVEL, BROTLI_QUALITY, ZSTD_LEVEL = 6, 4, 3
+PRECOMPRESS_GZIP_LEVEL, PRECOMPRESS_BROTLI_QUALITY, PRECOMPRESS_ZSTD_LEVEL = 9, 11, 19
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "application/xml", "image/svg+xml", "text/")
+# Events must reach the client as they happen; intermediaries buffer compressed streams
+NEVER_COMPRESSED_TYPES = ("text/event-stream",)
+
+
+class GzipEncoder:
+    def __init__(self, level: int = GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + self._compressor.flush() if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+ENCODERS: Dict[str, Callable[[], Any]] = {"gzip": GzipEncoder, "br": BrotliEncoder, "zstd": ZstdEncoder}
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    """One-shot compression at the pre-compression levels."""
+    if encoding == "gzip":
+        return gzip.compress(data, PRECOMPRESS_GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=PRECOMPRESS_BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=PRECOMPRESS_ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unknown encoding {encoding!r}")
+
+
+def negotiate(accept_encoding: Optional[str], encodings: List[str] = COMPRESSION_ENCODINGS) -> Optional[str]:
+    """The first of ``encodings`` the Accept-Encoding header allows, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    for encoding in encodings:
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    if _header(headers, b"content-encoding") is not None:
+        return False
+    content_type = (_header(headers, b"content-type") or "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(NEVER_COMPRESSED_TYPES)
+
+
+def with_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return [*headers, (b"vary", b"Accept-Encoding")]
+    if "accept-encoding" in vary.lower() or vary.strip() == "*":
+        return headers
+    merged = f"{vary}, Accept-Encoding".encode("latin-1")
+    return [(key, merged if key.lower() == b"vary" else value) for key, value in headers]
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_BYTES, encodings: List[str] = COMPRESSION_ENCODINGS):
+        unknown = set(encodings) - set(ENCODERS)
+        if unknown:
+            raise ValueError(f"Unknown compression encodings {sorted(unknown)}")
+        self.app = app
+        self.min_size = min_size
+        self.encodings = encodings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(_header(scope["headers"], b"accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether it is worth compressing
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = list(start.get("headers", []))
+                if not compressible(headers):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers = with_vary(headers)
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send({**start, "headers": headers})
+                    await send(message)
+                    return
+
+                encoder = ENCODERS[encoding]()
+                headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                metrics.inc(f"responses_compressed_{encoding}")
+                if not more_body:
+                    compressed = encoder.compress(body, flush=False) + encoder.finish()
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start, "headers": headers})
+
+            if more_body:
+                chunk = encoder.compress(body, flush=True)
+            else:
+                chunk = encoder.compress(body, flush=False) + encoder.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class Payload:
+    """A JSON body serialized once, with a pre-compressed copy per encoding."""
+
+    def __init__(self, body: bytes, encodings: List[str] = COMPRESSION_ENCODINGS, min_size: int = COMPRESSION_MIN_BYTES):
+        self.body = body
+        self.encoded = {encoding: compress(encoding, body) for encoding in encodings} if len(body) >= min_size else {}
+
+    def select(self, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """The body to send for an Accept-Encoding header, and its encoding (None for identity)."""
+        encoding = negotiate(accept_encoding, list(self.encoded))
+        return (self.body, None) if encoding is None else (self.encoded[encoding], encoding)
+
+
+class PayloadCache:
+    """LRU of payloads keyed by name and version; a new version replaces the old payload."""
+
+    def __init__(self, max_size: int = PAYLOAD_CACHE_SIZE):
+        self.max_size = max_size
+        self._payloads: "OrderedDict[str, Tuple[Any, Payload]]" = OrderedDict()
+
+    async def get(self, key: str, version: Any, build: Callable[[], Any]) -> Payload:
+        """The payload for ``key`` at ``version``; ``build()`` returns the JSON-ready content on a miss."""
+        cached = self._payloads.get(key)
+        if cached is not None and cached[0] == version:
+            self._payloads.move_to_end(key)
+            metrics.inc("payload_cache_hits")
+            return cached[1]
+
+        metrics.inc("payload_cache_misses")
+        # Serializing and compressing at the best levels takes a while; keep it off the event loop
+        payload = await asyncio.to_thread(self._encode, build)
+        self._payloads[key] = (version, payload)
+        self._payloads.move_to_end(key)
+        if len(self._payloads) > self.max_size:
+            self._payloads.popitem(last=False)
+        return payload
+
+    @staticmethod
+    def _encode(build: Callable[[], Any]) -> Payload:
+        content = build()
+        return Payload(json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8"))
+
+    def discard(self, key: str) -> None:
+        self._payloads.pop(key, None)
@@ -0,0 +1,165 @@
+"""
+Streaming export of survey responses.
+
+Parquet exports have one typed column per question: ratings are integers,
+checkbox answers are lists of strings and ``submitted_at`` is a timestamp, so
+downstream loads need no re-parsing. Rows are read from the Motor cursor (after
+any archived partitions) one row group at a time and each finished row group is
+sent to the client straight away, so memory stays bounded by the row group size
+no matter how many responses the survey has.
+"""
+
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from archive import iter_archived_responses
+from blobs import expand_answers
+
+EXPORT_ROW_GROUP_SIZE = int(os.environ.get("EXPORT_ROW_GROUP_SIZE", "50000"))
+
+ARROW_TYPES = {
+    "rating": pa.int64(),
+    "checkbox": pa.list_(pa.string()),
+}
+
+
+def export_columns(questions: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Column name per question: its title, suffixed when titles repeat."""
+    seen: Dict[str, int] = {}
+    columns = []
+    for question in questions:
+        name = question["title"] or question["id"]
+        if name in seen or name in ("id", "submitted_at"):
+            seen[name] = seen.get(name, 0) + 1
+            name = f"{name} ({seen[name]})"
+        else:
+            seen[name] = 0
+        columns.append((name, question))
+    return columns
+
+
+def parquet_schema(columns: List[Tuple[str, Dict[str, Any]]]) -> pa.Schema:
+    fields = [pa.field("id", pa.string()), pa.field("submitted_at", pa.timestamp("us"))]
+    for name, question in columns:
+        fields.append(pa.field(
+            name,
+            ARROW_TYPES.get(question["type"], pa.string()),
+            metadata={"question_id": question["id"], "question_type": question["type"]},
+        ))
+    return pa.schema(fields)
+
+
+def typed_answer(question_type: str, value: Any) -> Any:
+    """Coerce a stored answer to its column type; anything that does not fit becomes null."""
+    if value is None or value == "" or value == []:
+        return None
+    if question_type == "rating":
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+    if question_type == "checkbox":
+        return [str(v) for v in value] if isinstance(value, list) else None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+def responses_to_table(
+    schema: pa.Schema, columns: List[Tuple[str, Dict[str, Any]]], responses: List[Dict[str, Any]]
+) -> pa.Table:
+    data: Dict[str, List[Any]] = {
+        "id": [r["id"] for r in responses],
+        "submitted_at": [r["submitted_at"] for r in responses],
+    }
+    for name, question in columns:
+        question_id, question_type = question["id"], question["type"]
+        data[name] = [typed_answer(question_type, r.get("responses", {}).get(question_id)) for r in responses]
+    return pa.Table.from_pydict(data, schema=schema)
+
+
+class StreamSink:
+    """Write-only file object whose contents are handed out as they are written."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buffer.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = self.buffer.getvalue()
+        self.buffer = io.BytesIO()
+        return data
+
+
+async def iter_response_batches(db, survey_id: str, batch_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """All responses of a survey, oldest first: archived partitions, then MongoDB, long answers expanded."""
+    archived = iter_archived_responses(survey_id)
+    while True:
+        batch = await asyncio.to_thread(list, itertools.islice(archived, batch_size))
+        if not batch:
+            break
+        yield await expand_answers(db, batch)
+
+    cursor = db.responses.find({"survey_id": survey_id}, {"_id": 0}).sort("submitted_at", 1).batch_size(batch_size)
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            break
+        yield await expand_answers(db, batch)
+
+
+async def stream_parquet(db, survey: Dict[str, Any], row_group_size: int = EXPORT_ROW_GROUP_SIZE) -> AsyncIterator[bytes]:
+    columns = export_columns(survey.get("questions", []))
+    schema = parquet_schema(columns)
+    sink = StreamSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    try:
+        async for batch in iter_response_batches(db, survey["id"], row_group_size):
+            table = responses_to_table(schema, columns, batch)
+            await asyncio.to_thread(writer.write_table, table, row_group_size)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+async def stream_csv(db, survey: Dict[str, Any], batch_size: int = EXPORT_ROW_GROUP_SIZE) -> AsyncIterator[bytes]:
+    columns = export_columns(survey.get("questions", []))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Response ID", "Submitted At"] + [name for name, _ in columns])
+    async for batch in iter_response_batches(db, survey["id"], batch_size):
+        for response in batch:
+            answers = response.get("responses", {})
+            row = [response["id"], response["submitted_at"].isoformat()]
+            for _, question in columns:
+                answer = answers.get(question["id"])
+                row.append(", ".join(map(str, answer)) if isinstance(answer, list) else ("" if answer is None else answer))
+            writer.writerow(row)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,81 @@
+"""
+Server-side paging for the responses grid.
+
+One ``$facet`` aggregation returns the requested page, the number of matching
+responses and per-question facet counts, so the grid never has to load every
+response into the browser. The grid covers responses still in MongoDB; archived
+ones are only reachable through stats and exports.
+"""
+
+import re
+from typing import Any, Dict, List
+
+# Question types whose answers are counted per value
+FACET_QUESTION_TYPES = ("multiple_choice", "checkbox", "rating")
+MAX_GRID_PAGE_SIZE = 500
+
+
+def grid_sort_key(survey: Dict[str, Any], sort_by: str) -> str:
+    """Field to sort on: ``submitted_at`` or the answer to one of the survey's questions."""
+    if sort_by == "submitted_at":
+        return sort_by
+    if any(question["id"] == sort_by for question in survey.get("questions", [])):
+        return f"responses.{sort_by}"
+    raise ValueError(f"Cannot sort by {sort_by!r}")
+
+
+def grid_pipeline(
+    survey: Dict[str, Any], skip: int, limit: int, sort_key: str, direction: int, text: str = ""
+) -> List[Dict[str, Any]]:
+    questions = survey.get("questions", [])
+    pipeline: List[Dict[str, Any]] = [{"$match": {"survey_id": survey["id"]}}]
+    if text:
+        # Case-insensitive substring match on any answer; list answers match per element, long answers by preview
+        pattern = {"$regex": re.escape(text), "$options": "i"}
+        pipeline += [
+            {"$addFields": {"_answers": {"$objectToArray": "$responses"}}},
+            {"$match": {"$or": [{"_answers.v": pattern}, {"_answers.v.preview": pattern}]}},
+        ]
+
+    facets: Dict[str, List[Dict[str, Any]]] = {
+        "items": [
+            {"$sort": {sort_key: direction, "_id": direction}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "_answers": 0}},
+        ],
+        "total": [{"$count": "count"}],
+        "answered": [{"$group": {
+            "_id": None,
+            # Facet output names cannot hold arbitrary question ids, so questions are numbered
+            **{
+                f"q{index}": {"$sum": {"$cond": [{"$eq": [{"$type": f"$responses.{question['id']}"}, "missing"]}, 0, 1]}}
+                for index, question in enumerate(questions)
+            },
+        }}],
+    }
+    for index, question in enumerate(questions):
+        if question["type"] not in FACET_QUESTION_TYPES:
+            continue
+        field = f"$responses.{question['id']}"
+        stages: List[Dict[str, Any]] = [{"$match": {f"responses.{question['id']}": {"$exists": True}}}]
+        if question["type"] == "checkbox":
+            stages.append({"$unwind": field})
+        stages.append({"$group": {"_id": field, "count": {"$sum": 1}}})
+        facets[f"values_q{index}"] = stages
+
+    return pipeline + [{"$facet": facets}]
+
+
+def grid_result(survey: Dict[str, Any], doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape the single ``$facet`` output document for the API."""
+    total = doc["total"][0]["count"] if doc["total"] else 0
+    answered = doc["answered"][0] if doc["answered"] else {}
+    facets = {}
+    for index, question in enumerate(survey.get("questions", [])):
+        facet: Dict[str, Any] = {"answered": answered.get(f"q{index}", 0)}
+        if question["type"] in FACET_QUESTION_TYPES:
+            values = sorted(doc.get(f"values_q{index}", []), key=lambda item: item["count"], reverse=True)
+            facet["values"] = {str(item["_id"]): item["count"] for item in values if item["_id"] is not None}
+        facets[question["id"]] = facet
+    return {"items": doc["items"], "total": total, "facets": facets}
@@ -0,0 +1,52 @@
+"""
+Idempotent response submission.
+
+Clients send an ``Idempotency-Key`` header with each submission and reuse it
+when retrying. The key is stored on the response document under a unique
+index on (survey_id, idempotency_key), so a retry racing the original can never
+create a second document. Recently seen keys are also remembered in memory,
+which answers the common immediate retry without touching the database.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_CACHE_SECONDS = float(os.environ.get("IDEMPOTENCY_CACHE_SECONDS", "600"))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+IDEMPOTENCY_INDEX_KEYS = [("survey_id", 1), ("idempotency_key", 1)]
+IDEMPOTENCY_INDEX_OPTIONS = {
+    "name": "survey_idempotency_key",
+    "unique": True,
+    "partialFilterExpression": {"idempotency_key": {"$type": "string"}},
+}
+
+
+class RecentResponses:
+    """Bounded, time-limited map of (survey id, key) to the stored response."""
+
+    def __init__(self, max_size: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_CACHE_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._responses: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, survey_id: str, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._responses.get((survey_id, key))
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._responses[(survey_id, key)]
+            return None
+        return entry[1]
+
+    def put(self, survey_id: str, key: str, response: Dict[str, Any]) -> None:
+        self._responses[(survey_id, key)] = (time.monotonic(), response)
+        self._responses.move_to_end((survey_id, key))
+        if len(self._responses) > self.max_size:
+            self._responses.popitem(last=False)
+
+
+recent_responses = RecentResponses()
@@ -0,0 +1,234 @@
+"""
+Live response stats for dashboards, streamed as Server-Sent Events.
+
+All dashboards watching a survey share one channel. The channel computes the
+stats once when the first viewer connects and then folds in each new response
+as it arrives, either from a MongoDB change stream or, where change streams are
+unavailable (standalone servers), from responses submitted through this
+process. Viewers receive a snapshot on connect followed by coalesced deltas
+carrying only the questions that changed, so the cost per new response does
+not grow with the number of open dashboards.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from pymongo.errors import OperationFailure
+
+from archive import load_archived_stats
+from stats import StatsAccumulator
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATS_INTERVAL_SECONDS = float(os.environ.get("LIVE_STATS_INTERVAL_SECONDS", "0.5"))
+LIVE_STATS_HEARTBEAT_SECONDS = float(os.environ.get("LIVE_STATS_HEARTBEAT_SECONDS", "15"))
+LIVE_STATS_QUEUE_SIZE = int(os.environ.get("LIVE_STATS_QUEUE_SIZE", "100"))
+
+# Responses submitted this close to the snapshot may be seen by both the scan and the feed
+SNAPSHOT_OVERLAP = timedelta(seconds=30)
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def close_queue(queue: asyncio.Queue) -> None:
+    """Tell a subscriber to stop, discarding whatever it has not read yet."""
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(None)
+
+
+class StatsChannel:
+    def __init__(self, broker: "LiveStatsBroker", survey: Dict[str, Any]):
+        self.broker = broker
+        self.survey = survey
+        self.survey_id = survey["id"]
+        self.version = survey.get("updated_at")
+        self.stats = StatsAccumulator(survey.get("questions", []))
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.dirty: Set[str] = set()
+        self.changed = False
+        self.uses_change_stream = False
+        self.ready = asyncio.Event()
+        # Responses fed in while the snapshot scan is still running
+        self.pending: List[Dict[str, Any]] = []
+        # Ids of recently submitted responses already counted by the snapshot scan
+        self.recent_ids: Set[str] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "total_responses": self.stats.total_responses,
+            "survey_title": self.survey["title"],
+            "question_stats": self.stats.question_stats(),
+        }
+
+    def apply(self, response: Dict[str, Any]) -> None:
+        if not self.ready.is_set():
+            self.pending.append(response)
+            return
+        if response.get("id") in self.recent_ids:
+            self.recent_ids.discard(response["id"])
+            return
+        self.dirty |= self.stats.add(response.get("responses", {}))
+        self.changed = True
+
+    def broadcast(self, message: str) -> None:
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A viewer that cannot keep up is disconnected and reconnects with a fresh snapshot
+                self.subscribers.discard(queue)
+                close_queue(queue)
+
+    def flush(self) -> None:
+        if not self.changed:
+            return
+        delta = {
+            "total_responses": self.stats.total_responses,
+            "question_stats": self.stats.question_stats(question_ids=self.dirty),
+        }
+        self.dirty = set()
+        self.changed = False
+        self.broadcast(format_event("delta", delta))
+
+    async def load_snapshot(self) -> None:
+        # Archived responses are no longer in MongoDB; their part summaries start the count, as in /responses/stats
+        self.stats = await asyncio.to_thread(load_archived_stats, self.survey)
+        cutoff = datetime.utcnow() - SNAPSHOT_OVERLAP
+        cursor = self.broker.db.responses.find(
+            {"survey_id": self.survey_id}, {"_id": 0, "id": 1, "responses": 1, "submitted_at": 1}
+        )
+        async for response in cursor:
+            self.stats.add(response.get("responses", {}))
+            if response.get("submitted_at") and response["submitted_at"] >= cutoff:
+                self.recent_ids.add(response["id"])
+        self.ready.set()
+        pending, self.pending = self.pending, []
+        for response in pending:
+            self.apply(response)
+
+    async def watch(self) -> None:
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.survey_id": self.survey_id}}]
+        stream = self.broker.db.responses.watch(pipeline)
+        try:
+            # Opens the cursor, which fails straight away on servers without an oplog
+            first = await stream.try_next()
+        except OperationFailure as e:
+            logger.info("Change streams unavailable for live stats (%s); using in-process feed", e)
+            self.broker.change_streams_supported = False
+            await stream.close()
+            await self.load_snapshot()
+            return
+
+        try:
+            self.broker.change_streams_supported = True
+            self.uses_change_stream = True
+            await self.load_snapshot()
+            if first is not None:
+                self.apply(first["fullDocument"])
+            async for change in stream:
+                self.apply(change["fullDocument"])
+        finally:
+            await stream.close()
+
+    async def run(self) -> None:
+        if self.broker.change_streams_supported is False:
+            watcher = None
+            await self.load_snapshot()
+        else:
+            watcher = asyncio.create_task(self.watch())
+        try:
+            while True:
+                await asyncio.sleep(LIVE_STATS_INTERVAL_SECONDS)
+                if watcher is not None and watcher.done() and watcher.exception():
+                    raise watcher.exception()
+                self.flush()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    def close(self) -> None:
+        self.closed = True
+        if self.broker.channels.get(self.survey_id) is self:
+            del self.broker.channels[self.survey_id]
+        if self.task is not None:
+            self.task.cancel()
+        # Wake viewers still waiting for the snapshot so they see the close
+        self.ready.set()
+        for queue in self.subscribers:
+            close_queue(queue)
+        self.subscribers.clear()
+
+
+class LiveStatsBroker:
+    def __init__(self, db):
+        self.db = db
+        self.channels: Dict[str, StatsChannel] = {}
+        # None until the first channel finds out whether the server supports change streams
+        self.change_streams_supported: Optional[bool] = None
+
+    def channel_for(self, survey: Dict[str, Any]) -> StatsChannel:
+        channel = self.channels.get(survey["id"])
+        if channel is not None and not channel.closed and channel.version != survey.get("updated_at"):
+            # Questions changed; rebuild the stats for the new definition
+            channel.close()
+            channel = None
+        if channel is None or channel.closed:
+            channel = StatsChannel(self, survey)
+            self.channels[survey["id"]] = channel
+            channel.task = asyncio.create_task(channel.run())
+            channel.task.add_done_callback(lambda task, c=channel: self._channel_done(c, task))
+        return channel
+
+    def _channel_done(self, channel: StatsChannel, task: asyncio.Task) -> None:
+        if self.channels.get(channel.survey_id) is channel:
+            del self.channels[channel.survey_id]
+        if not task.cancelled() and task.exception():
+            logger.error("Live stats channel for survey %s failed", channel.survey_id, exc_info=task.exception())
+            channel.close()
+
+    def publish(self, response: Dict[str, Any]) -> None:
+        """Feed a newly stored response to channels not backed by a change stream."""
+        channel = self.channels.get(response["survey_id"])
+        if channel is not None and not channel.uses_change_stream:
+            channel.apply(response)
+
+    async def stream(self, survey: Dict[str, Any], request) -> AsyncIterator[str]:
+        channel = self.channel_for(survey)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_STATS_QUEUE_SIZE)
+        channel.subscribers.add(queue)
+        try:
+            await channel.ready.wait()
+            if channel.closed:
+                return
+            # Deltas broadcast before the snapshot are already part of it
+            while not queue.empty():
+                queue.get_nowait()
+            yield format_event("snapshot", channel.snapshot())
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), LIVE_STATS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            channel.subscribers.discard(queue)
+            if not channel.subscribers and not channel.closed:
+                channel.close()
+
+    def close(self) -> None:
+        for channel in list(self.channels.values()):
+            channel.close()
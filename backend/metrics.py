@@ -0,0 +1,30 @@
+"""
+Process-local operational metrics.
+
+Counters are incremented in place; gauges are callables evaluated when the
+metrics are read, so reporting a queue depth costs nothing until someone asks.
+"""
+
+from collections import defaultdict
+from typing import Callable, Dict
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def gauge(self, name: str, read: Callable[[], float]) -> None:
+        self.gauges[name] = read
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            "counters": dict(self.counters),
+            "gauges": {name: read() for name, read in self.gauges.items()},
+        }
+
+
+metrics = Metrics()
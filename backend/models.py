@@ -0,0 +1,223 @@
+"""
+Pydantic models of the survey API and the built-in templates.
+
+Kept free of import side effects (no clients, stores or background tasks), so
+command line tools and tests can use them without importing the server.
+"""
+
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+# Upper bound on surveys fetched or cloned by one batch request
+MAX_BATCH_SURVEYS = int(os.environ.get("MAX_BATCH_SURVEYS", "10000"))
+
+# Survey Models
+class QuestionOption(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    text: str
+    value: str
+
+class Question(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    type: str  # text, multiple_choice, rating, checkbox, email, phone
+    title: str
+    description: Optional[str] = None
+    required: bool = False
+    options: Optional[List[QuestionOption]] = None  # For multiple choice/checkbox
+    min_rating: Optional[int] = None  # For rating questions
+    max_rating: Optional[int] = None  # For rating questions
+
+class Survey(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    title: str
+    description: Optional[str] = None
+    questions: List[Question]
+    is_template: bool = False
+    template_category: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SurveyCreate(BaseModel):
+    title: str
+    description: Optional[str] = None
+    questions: List[Question]
+    is_template: bool = False
+    template_category: Optional[str] = None
+
+class QuestionUpdate(BaseModel):
+    id: str
+    type: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    required: Optional[bool] = None
+    options: Optional[List[QuestionOption]] = None
+    min_rating: Optional[int] = None
+    max_rating: Optional[int] = None
+
+class QuestionInsert(BaseModel):
+    question: Question
+    position: Optional[int] = Field(default=None, ge=0)  # Appended when omitted
+
+class SurveyPatch(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    template_category: Optional[str] = None
+    update_questions: List[QuestionUpdate] = []
+    add_questions: List[QuestionInsert] = []
+    remove_questions: List[str] = []
+    question_order: Optional[List[str]] = None  # Listed ids first, the rest keep their order
+
+class BulkSurveyCreate(BaseModel):
+    titles: List[str] = Field(min_length=1, max_length=MAX_BATCH_SURVEYS)
+
+class SurveyResponse(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    survey_id: str
+    responses: Dict[str, Any]  # question_id -> response
+    submitted_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SurveyResponseCreate(BaseModel):
+    survey_id: str
+    responses: Dict[str, Any]
+
+# Default templates
+def default_templates() -> List[Survey]:
+    # Customer Feedback Template
+    customer_feedback = Survey(
+        title="Customer Feedback Survey",
+        description="Collect valuable feedback from your customers",
+        is_template=True,
+        template_category="Customer Service",
+        questions=[
+            Question(
+                type="rating",
+                title="How would you rate our service?",
+                description="Rate from 1 to 5",
+                required=True,
+                min_rating=1,
+                max_rating=5
+            ),
+            Question(
+                type="multiple_choice",
+                title="How did you hear about us?",
+                required=True,
+                options=[
+                    QuestionOption(text="Social Media", value="social_media"),
+                    QuestionOption(text="Search Engine", value="search_engine"),
+                    QuestionOption(text="Word of Mouth", value="word_of_mouth"),
+                    QuestionOption(text="Advertisement", value="advertisement"),
+                    QuestionOption(text="Other", value="other")
+                ]
+            ),
+            Question(
+                type="text",
+                title="What can we improve?",
+                description="Please share your suggestions",
+                required=False
+            ),
+            Question(
+                type="email",
+                title="Email (optional)",
+                description="We may contact you for follow-up",
+                required=False
+            )
+        ]
+    )
+    
+    # Employee Satisfaction Template
+    employee_satisfaction = Survey(
+        title="Employee Satisfaction Survey",
+        description="Measure employee satisfaction and engagement",
+        is_template=True,
+        template_category="HR",
+        questions=[
+            Question(
+                type="rating",
+                title="How satisfied are you with your current role?",
+                required=True,
+                min_rating=1,
+                max_rating=5
+            ),
+            Question(
+                type="multiple_choice",
+                title="What motivates you most at work?",
+                required=True,
+                options=[
+                    QuestionOption(text="Career Growth", value="career_growth"),
+                    QuestionOption(text="Compensation", value="compensation"),
+                    QuestionOption(text="Work-Life Balance", value="work_life_balance"),
+                    QuestionOption(text="Team Environment", value="team_environment"),
+                    QuestionOption(text="Recognition", value="recognition")
+                ]
+            ),
+            Question(
+                type="checkbox",
+                title="What benefits are most important to you?",
+                required=False,
+                options=[
+                    QuestionOption(text="Health Insurance", value="health_insurance"),
+                    QuestionOption(text="Remote Work", value="remote_work"),
+                    QuestionOption(text="Professional Development", value="professional_development"),
+                    QuestionOption(text="Flexible Hours", value="flexible_hours"),
+                    QuestionOption(text="Retirement Plans", value="retirement_plans")
+                ]
+            ),
+            Question(
+                type="text",
+                title="Additional comments or suggestions",
+                required=False
+            )
+        ]
+    )
+    
+    # Event Feedback Template
+    event_feedback = Survey(
+        title="Event Feedback Survey",
+        description="Gather feedback about your event",
+        is_template=True,
+        template_category="Events",
+        questions=[
+            Question(
+                type="rating",
+                title="How would you rate the overall event?",
+                required=True,
+                min_rating=1,
+                max_rating=5
+            ),
+            Question(
+                type="multiple_choice",
+                title="Which session did you find most valuable?",
+                required=True,
+                options=[
+                    QuestionOption(text="Opening Keynote", value="opening_keynote"),
+                    QuestionOption(text="Panel Discussion", value="panel_discussion"),
+                    QuestionOption(text="Workshop", value="workshop"),
+                    QuestionOption(text="Networking Session", value="networking"),
+                    QuestionOption(text="Closing Remarks", value="closing_remarks")
+                ]
+            ),
+            Question(
+                type="text",
+                title="What topics would you like to see in future events?",
+                required=False
+            ),
+            Question(
+                type="multiple_choice",
+                title="Would you recommend this event to others?",
+                required=True,
+                options=[
+                    QuestionOption(text="Definitely", value="definitely"),
+                    QuestionOption(text="Probably", value="probably"),
+                    QuestionOption(text="Maybe", value="maybe"),
+                    QuestionOption(text="Probably Not", value="probably_not"),
+                    QuestionOption(text="Definitely Not", value="definitely_not")
+                ]
+            )
+        ]
+    )
+    
+    return [customer_feedback, employee_satisfaction, event_feedback]
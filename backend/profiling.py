@@ -0,0 +1,170 @@
+"""
+On-demand profiling of individual requests.
+
+Added to the app only when PROFILING_ENABLED is set, so it costs nothing
+otherwise. A request is profiled when it carries the PROFILING_HEADER with the
+value of PROFILING_TOKEN, or is picked by PROFILING_SAMPLE_RATE. Without a token
+the header is ignored, so anonymous clients cannot force profiling runs.
+Profiled responses get an ``X-Profile-Id`` header naming the file written to
+PROFILING_DIR, which keeps the newest PROFILING_MAX_FILES profiles:
+
+* ``sampling`` mode samples the event loop thread's stack every
+  PROFILING_INTERVAL_MS and writes ``<id>.collapsed``, one ``frame;frame;... count``
+  line per stack, ready for flamegraph.pl or speedscope.
+* ``cprofile`` mode runs cProfile and writes ``<id>.prof`` for pstats or snakeviz.
+
+Both observe the event loop thread, so work of other requests running
+concurrently shows up too. Only one request is profiled at a time.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILING_MODE = os.environ.get("PROFILING_MODE", "sampling")
+PROFILING_HEADER = os.environ.get("PROFILING_HEADER", "X-Profile")
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_MS = float(os.environ.get("PROFILING_INTERVAL_MS", "1"))
+PROFILING_DIR = Path(os.environ.get("PROFILING_DIR", Path(__file__).parent / "profiles"))
+PROFILING_MAX_FILES = int(os.environ.get("PROFILING_MAX_FILES", "100"))
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: Path) -> None:
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+
+
+class ProfilingMiddleware:
+    def __init__(
+        self,
+        app,
+        mode: str = PROFILING_MODE,
+        header: str = PROFILING_HEADER,
+        token: str = PROFILING_TOKEN,
+        sample_rate: float = PROFILING_SAMPLE_RATE,
+        interval_ms: float = PROFILING_INTERVAL_MS,
+        directory: Path = PROFILING_DIR,
+        max_files: int = PROFILING_MAX_FILES,
+    ):
+        if mode not in ("sampling", "cprofile"):
+            raise ValueError(f"Unknown profiling mode {mode!r}")
+        self.app = app
+        self.mode = mode
+        self.header = header.lower().encode("latin-1")
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self.max_files = max_files
+        self._busy = False
+        if not token:
+            logger.warning("PROFILING_TOKEN is not set: the %s header is ignored, only sampling applies", header)
+
+    def triggered(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == self.header:
+                    return hmac.compare_digest(value, self.token.encode("latin-1"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy or not self.triggered(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        profile_id = uuid.uuid4().hex
+        header = (b"x-profile-id", profile_id.encode("ascii"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        profiler: Optional[cProfile.Profile] = None
+        sampler: Optional[StackSampler] = None
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                sampler.stop()
+            self._busy = False
+            try:
+                path = await asyncio.to_thread(self._write, profile_id, profiler, sampler)
+                metrics.inc("profiles_captured")
+                logger.info("Profiled %s %s into %s", scope["method"], scope["path"], path)
+            except OSError:
+                logger.exception("Could not write profile %s", profile_id)
+
+    def _write(self, profile_id: str, profiler: Optional[cProfile.Profile], sampler: Optional[StackSampler]) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if profiler is not None:
+            path = self.directory / f"{profile_id}.prof"
+            profiler.dump_stats(path)
+        else:
+            path = self.directory / f"{profile_id}.collapsed"
+            sampler.write(path)
+        self._prune()
+        return path
+
+    def _prune(self) -> None:
+        profiles = [p for p in self.directory.iterdir() if p.suffix in (".prof", ".collapsed")]
+        if len(profiles) <= self.max_files:
+            return
+        profiles.sort(key=lambda p: p.stat().st_mtime)
+        for old in profiles[:len(profiles) - self.max_files]:
+            old.unlink(missing_ok=True)
@@ -0,0 +1,103 @@
+"""
+Removal of data left behind by deleted surveys.
+
+Deleting a survey only removes its document; everything keyed by its id is
+purged afterwards in bounded batches with a pause in between, so a survey with
+millions of responses never turns into one long-running delete that starves
+live traffic.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "1000"))
+PURGE_BATCH_DELAY_SECONDS = float(os.environ.get("PURGE_BATCH_DELAY_SECONDS", "0.05"))
+
+# Collection name -> field holding the owning survey id
+SURVEY_OWNED_COLLECTIONS: Dict[str, str] = {
+    "responses": "survey_id",
+    "survey_sketches": "survey_id",
+    "answer_blobs": "survey_id",
+}
+
+# Blocking callables removing survey-owned data kept outside MongoDB, run in a worker thread
+SURVEY_PURGE_HOOKS: List[Callable[[str], None]] = []
+
+_purge_tasks: Set[asyncio.Task] = set()
+
+
+async def purge_collection(
+    collection, field: str, survey_ids: List[str], batch_size: int, delay: float
+) -> int:
+    """Delete documents owned by ``survey_ids`` in batches of at most ``batch_size``."""
+    deleted = 0
+    while True:
+        cursor = collection.find({field: {"$in": survey_ids}}, {"_id": 1}).limit(batch_size)
+        ids = [doc["_id"] async for doc in cursor]
+        if not ids:
+            break
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        if len(ids) < batch_size:
+            break
+        await asyncio.sleep(delay)
+    return deleted
+
+
+async def purge_survey_data(
+    db,
+    survey_ids: List[str],
+    batch_size: int = PURGE_BATCH_SIZE,
+    delay: float = PURGE_BATCH_DELAY_SECONDS,
+) -> Dict[str, int]:
+    """Purge every survey-owned collection and return the deleted count per collection."""
+    deleted = {}
+    for name, field in SURVEY_OWNED_COLLECTIONS.items():
+        deleted[name] = await purge_collection(db[name], field, survey_ids, batch_size, delay)
+    for hook in SURVEY_PURGE_HOOKS:
+        for survey_id in survey_ids:
+            await asyncio.to_thread(hook, survey_id)
+    return deleted
+
+
+def schedule_purge(db, survey_id: str) -> asyncio.Task:
+    """Purge a deleted survey's data in the background."""
+
+    async def run():
+        try:
+            deleted = await purge_survey_data(db, [survey_id])
+            logger.info("Purged data of deleted survey %s: %s", survey_id, deleted)
+        except Exception:
+            # Whatever is left is picked up by `cli.py purge-orphans`
+            logger.exception("Purge of deleted survey %s failed", survey_id)
+
+    task = asyncio.create_task(run())
+    _purge_tasks.add(task)
+    task.add_done_callback(_purge_tasks.discard)
+    return task
+
+
+async def cancel_pending_purges() -> None:
+    for task in list(_purge_tasks):
+        task.cancel()
+    await asyncio.gather(*_purge_tasks, return_exceptions=True)
+
+
+async def distinct_values(collection, field: str) -> Set:
+    # $group instead of distinct() so the result is not capped at 16MB
+    return {doc["_id"] async for doc in collection.aggregate([{"$group": {"_id": f"${field}"}}], allowDiskUse=True)}
+
+
+async def find_orphaned_survey_ids(db) -> List[str]:
+    """Survey ids referenced by survey-owned collections that no longer have a survey."""
+    referenced = set()
+    for name, field in SURVEY_OWNED_COLLECTIONS.items():
+        referenced |= await distinct_values(db[name], field)
+    # Surveys are read after the scan: a survey created meanwhile exists before any of its data,
+    # so it is in this snapshot whenever the scan saw its data
+    existing = await distinct_values(db.surveys, "id")
+    return sorted(referenced - existing, key=str)
@@ -0,0 +1,207 @@
+"""
+Deadlines, a circuit breaker and stale fallbacks for storage calls.
+
+Endpoints set a deadline with ``with_deadline``; it lives in a context
+variable, so every storage call made while handling the request sees it. MongoDB
+queries pass the time left as ``maxTimeMS``, and ``CircuitBreaker.call`` also
+stops waiting client-side once it runs out.
+
+The breaker watches storage calls and opens when too many of the recent ones
+failed or were slow. While it is open, calls fail at once instead of queueing
+behind a struggling database, and reads with a ``FallbackCache`` entry are
+answered with the last value that was read successfully.
+"""
+
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+from metrics import metrics
+
+QUERY_DEADLINE_SECONDS = float(os.environ.get("QUERY_DEADLINE_SECONDS", "5"))
+STATS_DEADLINE_SECONDS = float(os.environ.get("STATS_DEADLINE_SECONDS", "30"))
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("BREAKER_SLOW_CALL_SECONDS", "1.0"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "10"))
+FALLBACK_CACHE_SIZE = int(os.environ.get("FALLBACK_CACHE_SIZE", "10000"))
+
+# Errors that mean the storage backend is in trouble, as opposed to e.g. a 404
+STORAGE_ERRORS = (PyMongoError, sqlite3.OperationalError, asyncio.TimeoutError)
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+def with_deadline(seconds: float):
+    """Give an endpoint ``seconds`` for all its storage calls (an enclosing, earlier deadline wins)."""
+
+    def decorate(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            deadline = time.monotonic() + seconds
+            current = _deadline.get()
+            token = _deadline.set(deadline if current is None else min(current, deadline))
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _deadline.reset(token)
+
+        return wrapper
+
+    return decorate
+
+
+def remaining_seconds() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def max_time_ms() -> Optional[int]:
+    remaining = remaining_seconds()
+    return None if remaining is None else max(1, int(remaining * 1000))
+
+
+def cursor_deadline() -> Dict[str, int]:
+    """Keyword arguments bounding a find() cursor by the current deadline."""
+    ms = max_time_ms()
+    return {} if ms is None else {"max_time_ms": ms}
+
+
+def command_deadline() -> Dict[str, int]:
+    """Keyword arguments bounding aggregate(), count_documents() and the like by the current deadline."""
+    ms = max_time_ms()
+    return {} if ms is None else {"maxTimeMS": ms}
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Storage circuit breaker is open")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class CircuitBreaker:
+    """Closed -> open when the recent failure rate is too high -> half-open trial after a pause."""
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+    ):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def _allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_running:
+                return False
+            self._trial_running = True
+        return True
+
+    def _open(self) -> None:
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        metrics.inc("circuit_breaker_trips")
+
+    def _record(self, ok: bool) -> None:
+        if self.state == "half_open":
+            self._trial_running = False
+            if ok:
+                self.state = "closed"
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+            self._outcomes.clear()
+
+    async def call(self, operation: Callable[[], Awaitable[Any]], slow_after: Optional[float] = None) -> Any:
+        """Run a storage operation within the current deadline; raises CircuitOpen while open."""
+        if not self._allow():
+            raise CircuitOpen(self.open_seconds - (time.monotonic() - self._opened_at))
+        started = time.monotonic()
+        remaining = remaining_seconds()
+        try:
+            if remaining is None:
+                result = await operation()
+            else:
+                result = await asyncio.wait_for(operation(), max(remaining, 0.0))
+        except STORAGE_ERRORS:
+            self._record(False)
+            raise
+        except asyncio.CancelledError:
+            # The client went away; that says nothing about the database
+            if self.state == "half_open":
+                self._trial_running = False
+            raise
+        except Exception:
+            # E.g. "not found": the database answered
+            self._record(True)
+            raise
+        self._record(time.monotonic() - started <= (slow_after or self.slow_call_seconds))
+        return result
+
+
+class FallbackCache:
+    """Last successfully read value per key, served while reads fail."""
+
+    def __init__(self, max_size: int = FALLBACK_CACHE_SIZE):
+        self.max_size = max_size
+        self._values: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def put(self, key: str, value: Any) -> None:
+        self._values[key] = (time.time(), value)
+        self._values.move_to_end(key)
+        if len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    async def read(
+        self,
+        breaker: CircuitBreaker,
+        operation: Callable[[], Awaitable[Any]],
+        key: Optional[str] = None,
+        slow_after: Optional[float] = None,
+    ) -> Tuple[Any, Optional[float]]:
+        """Run ``operation`` through ``breaker``; returns (value, age in seconds if served stale)."""
+        try:
+            value = await breaker.call(operation, slow_after)
+        except (CircuitOpen, *STORAGE_ERRORS):
+            cached = self._values.get(key) if key is not None else None
+            if cached is None:
+                raise
+            metrics.inc("stale_responses_served")
+            return cached[1], time.time() - cached[0]
+        if key is not None and value is not None:
+            self.put(key, value)
+        return value, None
@@ -1,22 +1,107 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+import asyncio
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-import uuid
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+from admission import AdmissionRejected, build_admission_controller, client_ip
+from archive import ArchiveScheduler, load_archived_stats, remove_survey_archive
+from blobs import expand_answers, is_blob_ref, load_blob
+from compression import COMPRESSION_ENABLED, CompressionMiddleware, Payload, PayloadCache
+from export import stream_csv, stream_parquet
+from grid import MAX_GRID_PAGE_SIZE, grid_pipeline, grid_result, grid_sort_key
+from idempotency import MAX_IDEMPOTENCY_KEY_LENGTH, recent_responses
+from live import LiveStatsBroker
+from metrics import metrics
+from models import (
+    MAX_BATCH_SURVEYS,
+    BulkSurveyCreate,
+    Question,
+    Survey,
+    SurveyCreate,
+    SurveyPatch,
+    SurveyResponse,
+    SurveyResponseCreate,
+    default_templates,
+)
+from profiling import PROFILING_ENABLED, ProfilingMiddleware
+from purge import SURVEY_PURGE_HOOKS, cancel_pending_purges
+from resilience import (
+    QUERY_DEADLINE_SECONDS, STATS_DEADLINE_SECONDS, STORAGE_ERRORS, CircuitBreaker, CircuitOpen, FallbackCache,
+    command_deadline, cursor_deadline, with_deadline
+)
+from sketches import SKETCH_INDEX_KEYS, SketchStore
+from spool import RESPONSE_SPOOL_ENABLED, RESPONSE_SPOOL_SURVEY_LOOKUP_SECONDS, ResponseSpool
+from stats import estimate_question_stats
+from storage import (
+    ANALYTICS_MIN_POOL_SIZE,
+    INGEST_MIN_POOL_SIZE,
+    DuplicateResponse,
+    MongoStore,
+    build_store,
+    mongo_client_options,
+)
+from validation import validators
+from warmup import WARMUP_RECENT_SURVEYS, WARMUP_SCAN_RESPONSES, WarmUp
+
+# MongoDB connections: analytics gets its own pool (and read preference) so dashboards cannot starve submissions
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, **mongo_client_options("ingest"))
 db = client[os.environ['DB_NAME']]
+analytics_client = AsyncIOMotorClient(mongo_url, **mongo_client_options("analytics"))
+analytics_db = analytics_client[os.environ['DB_NAME']]
+
+# Surveys and responses for the core API; MongoDB-only features below use db directly
+store = build_store(db)
+MONGO_STORAGE = isinstance(store, MongoStore)
+analytics_store = MongoStore(analytics_db) if MONGO_STORAGE else store
+
+# Fail fast while storage is struggling, answering reads from the last good value where possible
+storage_breaker = CircuitBreaker()
+fallback_cache = FallbackCache()
+metrics.gauge("storage_circuit_open", lambda: float(storage_breaker.state != "closed"))
+
+# Shared feed of new responses for live dashboards
+live_stats = LiveStatsBroker(db)
+
+# Old responses move to Parquet files; deleting a survey removes them too
+archive_scheduler = ArchiveScheduler(db)
+SURVEY_PURGE_HOOKS.append(remove_survey_archive)
+
+# Serialized, pre-compressed survey definitions and template catalogue
+payload_cache = PayloadCache()
+
+# Distinct-count and top-answer sketches for free-text questions
+answer_sketches = SketchStore(db)
+
+# Rate limits and write concurrency for response submission
+admission = build_admission_controller()
+
+async def observe_drained_responses(responses: List[Dict[str, Any]]) -> None:
+    surveys = {
+        survey["id"]: survey
+        async for survey in db.surveys.find({"id": {"$in": list({r["survey_id"] for r in responses})}})
+    }
+    for response in responses:
+        live_stats.publish(response)
+        if response["survey_id"] in surveys:
+            answer_sketches.observe(surveys[response["survey_id"]], response)
+
+# Fast-ack ingestion: submissions are acknowledged once on local disk and drained into MongoDB
+response_spool = ResponseSpool(db, on_stored=observe_drained_responses)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -24,128 +109,376 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Survey Models
-class QuestionOption(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    text: str
-    value: str
-
-class Question(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    type: str  # text, multiple_choice, rating, checkbox, email, phone
-    title: str
-    description: Optional[str] = None
-    required: bool = False
-    options: Optional[List[QuestionOption]] = None  # For multiple choice/checkbox
-    min_rating: Optional[int] = None  # For rating questions
-    max_rating: Optional[int] = None  # For rating questions
-
-class Survey(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    title: str
-    description: Optional[str] = None
-    questions: List[Question]
-    is_template: bool = False
-    template_category: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-
-class SurveyCreate(BaseModel):
-    title: str
-    description: Optional[str] = None
-    questions: List[Question]
-    is_template: bool = False
-    template_category: Optional[str] = None
-
-class SurveyResponse(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    survey_id: str
-    responses: Dict[str, Any]  # question_id -> response
-    submitted_at: datetime = Field(default_factory=datetime.utcnow)
-
-class SurveyResponseCreate(BaseModel):
-    survey_id: str
-    responses: Dict[str, Any]
+# Approximate stats: default sample size, and the survey size below which exact stats are always used
+APPROX_STATS_SAMPLE_SIZE = int(os.environ.get("APPROX_STATS_SAMPLE_SIZE", "10000"))
+APPROX_STATS_MIN_RESPONSES = int(os.environ.get("APPROX_STATS_MIN_RESPONSES", "50000"))
+
+def require_mongo_storage() -> None:
+    if not MONGO_STORAGE:
+        raise HTTPException(status_code=501, detail=f"Not available with the {store.name} storage backend")
+
+async def storage_call(
+    operation, response: Optional[Response] = None, cache_key: Optional[str] = None, slow_after: Optional[float] = None
+):
+    """Run storage work through the circuit breaker; reads with a cache key are served stale while it fails."""
+    try:
+        value, age = await fallback_cache.read(storage_breaker, operation, cache_key, slow_after)
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail="Database unavailable", headers={"Retry-After": e.retry_after_header})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database deadline exceeded")
+    except STORAGE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    if age is not None and response is not None:
+        response.headers["X-Stale-Seconds"] = str(int(age))
+    return value
+
+async def acquire_analytics_slot() -> None:
+    try:
+        await admission.acquire("analytics")
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=e.reason, headers={"Retry-After": e.retry_after_header})
+
+async def analytics_workload():
+    """Hold an analytics slot for the request; queued submissions are admitted ahead of it."""
+    await acquire_analytics_slot()
+    try:
+        yield
+    finally:
+        admission.release("analytics")
+
+def payload_response(request: Request, response: Response, payload: Payload) -> Response:
+    """Send a cached payload in the encoding the client accepts, keeping headers set on ``response``."""
+    body, encoding = payload.select(request.headers.get("accept-encoding"))
+    headers = {**response.headers, "Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
 # Survey API Routes
 @api_router.post("/surveys", response_model=Survey)
+@with_deadline(QUERY_DEADLINE_SECONDS)
 async def create_survey(survey_data: SurveyCreate):
     survey_dict = survey_data.dict()
     survey_obj = Survey(**survey_dict)
-    await db.surveys.insert_one(survey_obj.dict())
+    await storage_call(lambda: store.insert_surveys([survey_obj.dict()]))
     return survey_obj
 
 @api_router.get("/surveys", response_model=List[Survey])
-async def get_surveys():
-    surveys = await db.surveys.find({"is_template": False}).to_list(1000)
-    return [Survey(**survey) for survey in surveys]
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def get_surveys(response: Response, ids: Optional[str] = Query(None, description="Comma-separated survey ids")):
+    if ids is None:
+        surveys = await storage_call(lambda: store.list_surveys(is_template=False), response, "surveys")
+        return [Survey(**survey) for survey in surveys]
+    
+    # Batch fetch: one query, returned in the requested order; unknown ids are skipped
+    requested = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if len(requested) > MAX_BATCH_SURVEYS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SURVEYS} ids per request")
+    surveys = await storage_call(lambda: store.list_surveys(is_template=False, ids=requested, limit=len(requested)))
+    by_id = {survey["id"]: survey for survey in surveys}
+    return [Survey(**by_id[survey_id]) for survey_id in requested if survey_id in by_id]
 
 @api_router.get("/surveys/{survey_id}", response_model=Survey)
-async def get_survey(survey_id: str):
-    survey = await db.surveys.find_one({"id": survey_id})
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def get_survey(survey_id: str, request: Request, response: Response):
+    survey = await storage_call(lambda: store.get_survey(survey_id), response, f"survey:{survey_id}")
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
-    return Survey(**survey)
+    return payload_response(request, response, await survey_payload(survey))
+
+async def survey_payload(survey: Dict[str, Any]) -> Payload:
+    return await payload_cache.get(
+        f"survey:{survey['id']}", survey.get("updated_at"), lambda: jsonable_encoder(Survey(**survey))
+    )
 
 @api_router.put("/surveys/{survey_id}", response_model=Survey)
+@with_deadline(QUERY_DEADLINE_SECONDS)
 async def update_survey(survey_id: str, survey_data: SurveyCreate):
     survey_dict = survey_data.dict()
     survey_dict["updated_at"] = datetime.utcnow()
     
-    result = await db.surveys.update_one(
-        {"id": survey_id},
-        {"$set": survey_dict}
-    )
+    updated_survey = await storage_call(lambda: store.replace_survey(survey_id, survey_dict))
     
-    if result.matched_count == 0:
+    if not updated_survey:
         raise HTTPException(status_code=404, detail="Survey not found")
     
-    updated_survey = await db.surveys.find_one({"id": survey_id})
+    return Survey(**updated_survey)
+
+def build_survey_patch_update(patch: SurveyPatch) -> Tuple[Any, Optional[List[Dict[str, Any]]]]:
+    """Translate a SurveyPatch into a single MongoDB update.
+
+    A patch touching the questions array in one way (field edits, appends at one
+    position, or removals) becomes a plain operator update using positional
+    array filters, so only the changed elements are rewritten. Patches combining
+    several structural changes, or reordering, cannot be expressed without
+    conflicting paths and use an update pipeline evaluated on the server instead.
+    """
+    top_level = patch.dict(include={"title", "description", "template_category"}, exclude_unset=True)
+    top_level["updated_at"] = datetime.utcnow()
+
+    # Edits of the same question are merged (later fields win): two array filters may not match one element
+    merged_updates: Dict[str, Dict[str, Any]] = {}
+    for u in patch.update_questions:
+        merged_updates.setdefault(u.id, {}).update(u.dict(exclude={"id"}, exclude_unset=True))
+    updates = [(question_id, fields) for question_id, fields in merged_updates.items() if fields]
+    adds = [(a.position, a.question.dict()) for a in patch.add_questions]
+    add_positions = {position for position, _ in adds}
+
+    structural = sum(bool(change) for change in (updates, adds, patch.remove_questions))
+    if patch.question_order is None and structural <= 1 and len(add_positions) <= 1:
+        update: Dict[str, Any] = {"$set": dict(top_level)}
+        array_filters = []
+        for i, (question_id, fields) in enumerate(updates):
+            for field, value in fields.items():
+                update["$set"][f"questions.$[q{i}].{field}"] = value
+            array_filters.append({f"q{i}.id": question_id})
+        if adds:
+            push: Dict[str, Any] = {"$each": [question for _, question in adds]}
+            position = add_positions.pop()
+            if position is not None:
+                push["$position"] = position
+            update["$push"] = {"questions": push}
+        if patch.remove_questions:
+            update["$pull"] = {"questions": {"id": {"$in": patch.remove_questions}}}
+        return update, array_filters or None
+
+    # Values are wrapped in $literal so user text such as "$5 off" is never read as a field path
+    pipeline: List[Dict[str, Any]] = []
+    if patch.remove_questions:
+        pipeline.append({"$set": {"questions": {"$filter": {
+            "input": "$questions",
+            "as": "q",
+            "cond": {"$not": [{"$in": ["$$q.id", {"$literal": patch.remove_questions}]}]}
+        }}}})
+    if updates:
+        pipeline.append({"$set": {"questions": {"$map": {
+            "input": "$questions",
+            "as": "q",
+            "in": {"$mergeObjects": ["$$q", {"$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$$q.id", {"$literal": question_id}]}, "then": {"$literal": fields}}
+                    for question_id, fields in updates
+                ],
+                "default": {}
+            }}]}
+        }}}})
+    for position, question in adds:
+        if position is None:
+            questions = {"$concatArrays": ["$questions", {"$literal": [question]}]}
+        else:
+            questions = {"$concatArrays": [
+                {"$slice": ["$questions", position]},
+                {"$literal": [question]},
+                {"$slice": ["$questions", position, {"$add": [{"$size": "$questions"}, 1]}]}
+            ]}
+        pipeline.append({"$set": {"questions": questions}})
+    if patch.question_order is not None:
+        order = {"$literal": patch.question_order}
+        pipeline.append({"$set": {"questions": {"$concatArrays": [
+            {"$filter": {
+                "input": {"$map": {
+                    "input": order,
+                    "as": "qid",
+                    "in": {"$arrayElemAt": [
+                        {"$filter": {"input": "$questions", "as": "q", "cond": {"$eq": ["$$q.id", "$$qid"]}}},
+                        0
+                    ]}
+                }},
+                "cond": {"$ne": ["$$this", None]}
+            }},
+            {"$filter": {"input": "$questions", "as": "q", "cond": {"$not": [{"$in": ["$$q.id", order]}]}}}
+        ]}}})
+    pipeline.append({"$set": {field: {"$literal": value} for field, value in top_level.items()}})
+    return pipeline, None
+
+@api_router.patch("/surveys/{survey_id}", response_model=Survey, dependencies=[Depends(require_mongo_storage)])
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def patch_survey(survey_id: str, patch: SurveyPatch):
+    referenced_ids = list({u.id for u in patch.update_questions} | set(patch.remove_questions))
+    added_ids = [a.question.id for a in patch.add_questions]
+    
+    survey_filter: Dict[str, Any] = {"id": survey_id}
+    question_filter: Dict[str, Any] = {}
+    if referenced_ids:
+        question_filter["$all"] = referenced_ids
+    if added_ids:
+        question_filter["$nin"] = added_ids
+    if question_filter:
+        survey_filter["questions.id"] = question_filter
+    
+    update, array_filters = build_survey_patch_update(patch)
+    updated_survey = await storage_call(lambda: db.surveys.find_one_and_update(
+        survey_filter,
+        update,
+        array_filters=array_filters,
+        return_document=ReturnDocument.AFTER,
+        **command_deadline()
+    ))
+    
+    if not updated_survey:
+        # Only the failure path pays for a second lookup to tell the two cases apart
+        if not await storage_call(lambda: db.surveys.count_documents({"id": survey_id}, limit=1)):
+            raise HTTPException(status_code=404, detail="Survey not found")
+        raise HTTPException(status_code=409, detail="Patch references unknown question ids or re-adds existing ones")
+    
     return Survey(**updated_survey)
 
 @api_router.delete("/surveys/{survey_id}")
+@with_deadline(QUERY_DEADLINE_SECONDS)
 async def delete_survey(survey_id: str):
-    result = await db.surveys.delete_one({"id": survey_id})
-    if result.deleted_count == 0:
+    if not await storage_call(lambda: store.delete_survey(survey_id)):
         raise HTTPException(status_code=404, detail="Survey not found")
+    
+    # A deleted survey must not come back as a stale fallback
+    validators.discard(survey_id)
+    fallback_cache.discard(f"survey:{survey_id}")
+    fallback_cache.discard("surveys")
+    payload_cache.discard(f"survey:{survey_id}")
     return {"message": "Survey deleted successfully"}
 
 # Template API Routes
 @api_router.get("/templates", response_model=List[Survey])
-async def get_templates():
-    templates = await db.surveys.find({"is_template": True}).to_list(1000)
-    return [Survey(**template) for template in templates]
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def get_templates(request: Request, response: Response):
+    templates = await storage_call(lambda: store.list_surveys(is_template=True), response, "templates")
+    return payload_response(request, response, await templates_payload(templates))
+
+async def templates_payload(templates: List[Dict[str, Any]]) -> Payload:
+    version = tuple((template["id"], template.get("updated_at")) for template in templates)
+    return await payload_cache.get(
+        "templates", version, lambda: jsonable_encoder([Survey(**template) for template in templates])
+    )
+
+def survey_from_template(template: Dict[str, Any], title: str) -> Survey:
+    return Survey(
+        title=title,
+        description=template.get("description", ""),
+        questions=[Question(**q) for q in template["questions"]],
+        is_template=False
+    )
 
 @api_router.post("/templates/{template_id}/create-survey", response_model=Survey)
+@with_deadline(QUERY_DEADLINE_SECONDS)
 async def create_survey_from_template(template_id: str, title: str):
-    template = await db.surveys.find_one({"id": template_id, "is_template": True})
+    template = await storage_call(lambda: store.get_survey(template_id, is_template=True))
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     
     # Create new survey from template
-    new_survey = Survey(
-        title=title,
-        description=template.get("description", ""),
-        questions=[Question(**q) for q in template["questions"]],
-        is_template=False
-    )
+    new_survey = survey_from_template(template, title)
     
-    await db.surveys.insert_one(new_survey.dict())
+    await storage_call(lambda: store.insert_surveys([new_survey.dict()]))
     return new_survey
 
+@api_router.post("/templates/{template_id}/create-surveys", response_model=List[Survey])
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def create_surveys_from_template(template_id: str, request: BulkSurveyCreate):
+    # One template read and one bulk insert, however many surveys are cloned
+    template = await storage_call(lambda: store.get_survey(template_id, is_template=True))
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    new_surveys = [survey_from_template(template, title) for title in request.titles]
+    await storage_call(lambda: store.insert_surveys([survey.dict() for survey in new_surveys]))
+    return new_surveys
+
 # Response API Routes
 @api_router.post("/responses", response_model=SurveyResponse)
-async def submit_response(response_data: SurveyResponseCreate):
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def submit_response(
+    response_data: SurveyResponseCreate,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    if idempotency_key is not None:
+        if not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+        # Immediate retries are answered from memory without touching the database
+        original = recent_responses.get(response_data.survey_id, idempotency_key)
+        if original is not None:
+            return SurveyResponse(**original)
+    
+    # Shed excess load before any database call
+    try:
+        await admission.check_rate(response_data.survey_id, client_ip(request))
+        if RESPONSE_SPOOL_ENABLED and MONGO_STORAGE:
+            return await spool_response(response_data, idempotency_key)
+        async with admission.write_slot():
+            return await storage_call(lambda: store_response(response_data, idempotency_key))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": e.retry_after_header})
+
+async def store_response(response_data: SurveyResponseCreate, idempotency_key: Optional[str] = None) -> SurveyResponse:
     # Verify survey exists
-    survey = await db.surveys.find_one({"id": response_data.survey_id})
+    survey = await store.get_survey(response_data.survey_id)
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
     
+    errors = validators.get(survey)(response_data.responses)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    
     response_obj = SurveyResponse(**response_data.dict())
-    await db.responses.insert_one(response_obj.dict())
+    response_doc = response_obj.dict()
+    if idempotency_key is not None:
+        response_doc["idempotency_key"] = idempotency_key
+    
+    try:
+        await store.insert_response(response_doc)
+    except DuplicateResponse:
+        # A retry of a submission stored earlier (or concurrently): return the original
+        original = await store.find_response(response_data.survey_id, idempotency_key)
+        if original is None:
+            raise
+        if MONGO_STORAGE:
+            # The stored original may hold blob references; retries must get the answers as submitted
+            original = (await expand_answers(db, [original]))[0]
+        recent_responses.put(response_data.survey_id, idempotency_key, original)
+        return SurveyResponse(**original)
+    
+    if idempotency_key is not None:
+        recent_responses.put(response_data.survey_id, idempotency_key, response_doc)
+    live_stats.publish(response_doc)
+    if MONGO_STORAGE:
+        answer_sketches.observe(survey, response_doc)
+    return response_obj
+
+async def spool_response(response_data: SurveyResponseCreate, idempotency_key: Optional[str] = None) -> SurveyResponse:
+    # Validation needs the survey; while MongoDB is unreachable the copy seen last is used
+    try:
+        survey = await asyncio.wait_for(
+            db.surveys.find_one({"id": response_data.survey_id}), RESPONSE_SPOOL_SURVEY_LOOKUP_SECONDS
+        )
+        if survey:
+            response_spool.surveys.put(survey)
+    except (asyncio.TimeoutError, PyMongoError):
+        survey = response_spool.surveys.get(response_data.survey_id)
+        if survey is None:
+            raise HTTPException(status_code=503, detail="Survey temporarily unavailable")
+    if not survey:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    
+    errors = validators.get(survey)(response_data.responses)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    
+    response_obj = SurveyResponse(**response_data.dict())
+    response_doc = response_obj.dict()
+    if idempotency_key is not None:
+        response_doc["idempotency_key"] = idempotency_key
+    try:
+        await response_spool.append(response_doc)
+    except OSError:
+        raise HTTPException(status_code=503, detail="Response spool unavailable")
+    
+    # Live stats and sketches are updated when the drainer stores the response
+    if idempotency_key is not None:
+        recent_responses.put(response_data.survey_id, idempotency_key, response_doc)
     return response_obj
 
-@api_router.get("/surveys/{survey_id}/responses", response_model=List[SurveyResponse])
+@api_router.get("/surveys/{survey_id}/responses", response_model=List[SurveyResponse], dependencies=[Depends(analytics_workload)])
+@with_deadline(QUERY_DEADLINE_SECONDS)
 async def get_survey_responses(survey_id: str, page: int = 1, limit: int = 100, sort_by: str = "submitted_at", sort_order: str = "desc"):
     # Calculate skip value for pagination
     skip = (page - 1) * limit
@@ -154,215 +487,242 @@ async def get_survey_responses(survey_id: str, page: int = 1, limit: int = 100,
     sort_direction = -1 if sort_order == "desc" else 1
     
     # Get responses with pagination and sorting
-    responses = await db.responses.find({"survey_id": survey_id}).sort(sort_by, sort_direction).skip(skip).limit(limit).to_list(limit)
+    try:
+        responses = await storage_call(
+            lambda: analytics_store.list_responses(survey_id, skip, limit, sort_by, sort_direction)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return [SurveyResponse(**response) for response in responses]
 
-@api_router.get("/surveys/{survey_id}/responses/stats")
-async def get_survey_response_stats(survey_id: str):
+@api_router.get(
+    "/surveys/{survey_id}/responses/grid",
+    dependencies=[Depends(require_mongo_storage), Depends(analytics_workload)]
+)
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def get_survey_response_grid(
+    survey_id: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=MAX_GRID_PAGE_SIZE),
+    sort_by: str = "submitted_at",
+    sort_order: str = Query("desc", pattern="^(asc|desc)$"),
+    q: str = ""
+):
+    survey = await storage_call(lambda: analytics_db.surveys.find_one({"id": survey_id}, **cursor_deadline()))
+    if not survey:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    try:
+        sort_key = grid_sort_key(survey, sort_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Page, matching total and facet counts come back from a single aggregation
+    pipeline = grid_pipeline(survey, (page - 1) * limit, limit, sort_key, -1 if sort_order == "desc" else 1, q.strip())
+    docs = await storage_call(
+        lambda: analytics_db.responses.aggregate(pipeline, allowDiskUse=True, **command_deadline()).to_list(1)
+    )
+    return {"page": page, "limit": limit, **grid_result(survey, docs[0])}
+
+@api_router.get("/surveys/{survey_id}/responses/stats", dependencies=[Depends(analytics_workload)])
+@with_deadline(STATS_DEADLINE_SECONDS)
+async def get_survey_response_stats(
+    survey_id: str,
+    response: Response,
+    mode: str = Query("exact", pattern="^(exact|approximate)$"),
+    sample_size: int = Query(APPROX_STATS_SAMPLE_SIZE, ge=100, le=1000000)
+):
+    # Full scans are slow by nature, so only running out of time counts against the breaker
+    return await storage_call(
+        lambda: compute_response_stats(survey_id, mode, sample_size),
+        response,
+        f"stats:{survey_id}:{mode}:{sample_size}",
+        slow_after=STATS_DEADLINE_SECONDS
+    )
+
+async def compute_response_stats(survey_id: str, mode: str, sample_size: int) -> Dict[str, Any]:
     # Get total response count
-    total_responses = await db.responses.count_documents({"survey_id": survey_id})
+    total_responses = await analytics_store.count_responses(survey_id)
     
     # Get survey details
-    survey = await db.surveys.find_one({"id": survey_id})
+    survey = await analytics_store.get_survey(survey_id)
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
     
-    # Calculate completion rate and other stats
-    responses = await db.responses.find({"survey_id": survey_id}).to_list(1000)
+    # Archived responses are covered exactly by their partition summaries
+    archived = await asyncio.to_thread(load_archived_stats, survey)
+    live_responses = total_responses
+    total_responses += archived.total_responses
+    
+    # Small surveys are cheap to scan, so they always get exact stats
+    if mode == "approximate" and (live_responses <= max(APPROX_STATS_MIN_RESPONSES, sample_size) or not MONGO_STORAGE):
+        mode = "exact"
     
     # Calculate question-wise response stats
-    question_stats = {}
-    for question in survey.get("questions", []):
-        question_id = question["id"]
-        answered_count = 0
-        response_data = []
-        
-        for response in responses:
-            if question_id in response.get("responses", {}):
-                answered_count += 1
-                response_data.append(response["responses"][question_id])
-        
-        completion_rate = (answered_count / total_responses * 100) if total_responses > 0 else 0
-        
-        # For multiple choice questions, calculate option distribution
-        option_distribution = {}
-        if question["type"] == "multiple_choice":
-            for resp in response_data:
-                if resp:
-                    option_distribution[resp] = option_distribution.get(resp, 0) + 1
-        
-        # For rating questions, calculate average
-        average_rating = None
-        if question["type"] == "rating":
-            numeric_responses = [r for r in response_data if isinstance(r, (int, float))]
-            if numeric_responses:
-                average_rating = sum(numeric_responses) / len(numeric_responses)
-        
-        question_stats[question_id] = {
-            "question_title": question["title"],
-            "question_type": question["type"],
-            "answered_count": answered_count,
-            "completion_rate": completion_rate,
-            "option_distribution": option_distribution,
-            "average_rating": average_rating
-        }
+    extra = {}
+    if mode == "approximate":
+        sample = await analytics_db.responses.aggregate([
+            {"$match": {"survey_id": survey_id}},
+            {"$sample": {"size": sample_size}},
+            {"$project": {"_id": 0, "responses": 1}}
+        ], **command_deadline()).to_list(sample_size)
+        used, question_stats = estimate_question_stats(survey.get("questions", []), sample, live_responses, archived)
+        extra = {"sample_size": used, "confidence_level": 0.95}
+    else:
+        stats = await analytics_store.response_stats(survey, archived)
+        question_stats = stats.question_stats(total_responses)
+    
+    # Free-text questions get approximate distinct and most common answers from their sketches
+    if MONGO_STORAGE:
+        for question_id, sketch in (await answer_sketches.load(survey_id)).items():
+            if question_id in question_stats:
+                question_stats[question_id].update(sketch.result())
     
     return {
         "total_responses": total_responses,
         "survey_title": survey["title"],
-        "question_stats": question_stats
+        "question_stats": question_stats,
+        "mode": mode,
+        **extra
     }
 
-# Initialize default templates
-@api_router.post("/init-templates")
-async def initialize_templates():
-    # Check if templates already exist
-    existing_templates = await db.surveys.count_documents({"is_template": True})
-    if existing_templates > 0:
-        return {"message": "Templates already initialized"}
+@api_router.get("/surveys/{survey_id}/responses/export", dependencies=[Depends(require_mongo_storage)])
+async def export_survey_responses(survey_id: str, format: str = Query("parquet", pattern="^(parquet|csv)$")):
+    survey = await analytics_db.surveys.find_one({"id": survey_id})
+    if not survey:
+        raise HTTPException(status_code=404, detail="Survey not found")
     
-    # Customer Feedback Template
-    customer_feedback = Survey(
-        title="Customer Feedback Survey",
-        description="Collect valuable feedback from your customers",
-        is_template=True,
-        template_category="Customer Service",
-        questions=[
-            Question(
-                type="rating",
-                title="How would you rate our service?",
-                description="Rate from 1 to 5",
-                required=True,
-                min_rating=1,
-                max_rating=5
-            ),
-            Question(
-                type="multiple_choice",
-                title="How did you hear about us?",
-                required=True,
-                options=[
-                    QuestionOption(text="Social Media", value="social_media"),
-                    QuestionOption(text="Search Engine", value="search_engine"),
-                    QuestionOption(text="Word of Mouth", value="word_of_mouth"),
-                    QuestionOption(text="Advertisement", value="advertisement"),
-                    QuestionOption(text="Other", value="other")
-                ]
-            ),
-            Question(
-                type="text",
-                title="What can we improve?",
-                description="Please share your suggestions",
-                required=False
-            ),
-            Question(
-                type="email",
-                title="Email (optional)",
-                description="We may contact you for follow-up",
-                required=False
-            )
-        ]
-    )
+    # Built row group by row group from the cursor, so memory use does not grow with the survey
+    if format == "parquet":
+        body, media_type = stream_parquet(analytics_db, survey), "application/vnd.apache.parquet"
+    else:
+        body, media_type = stream_csv(analytics_db, survey), "text/csv"
+    
+    # The analytics slot is held until streaming ends (or the client goes away), not just until we return
+    await acquire_analytics_slot()
+    released = False
+    
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            admission.release("analytics")
+    
+    async def body_holding_slot():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            release_slot()
     
-    # Employee Satisfaction Template
-    employee_satisfaction = Survey(
-        title="Employee Satisfaction Survey",
-        description="Measure employee satisfaction and engagement",
-        is_template=True,
-        template_category="HR",
-        questions=[
-            Question(
-                type="rating",
-                title="How satisfied are you with your current role?",
-                required=True,
-                min_rating=1,
-                max_rating=5
-            ),
-            Question(
-                type="multiple_choice",
-                title="What motivates you most at work?",
-                required=True,
-                options=[
-                    QuestionOption(text="Career Growth", value="career_growth"),
-                    QuestionOption(text="Compensation", value="compensation"),
-                    QuestionOption(text="Work-Life Balance", value="work_life_balance"),
-                    QuestionOption(text="Team Environment", value="team_environment"),
-                    QuestionOption(text="Recognition", value="recognition")
-                ]
-            ),
-            Question(
-                type="checkbox",
-                title="What benefits are most important to you?",
-                required=False,
-                options=[
-                    QuestionOption(text="Health Insurance", value="health_insurance"),
-                    QuestionOption(text="Remote Work", value="remote_work"),
-                    QuestionOption(text="Professional Development", value="professional_development"),
-                    QuestionOption(text="Flexible Hours", value="flexible_hours"),
-                    QuestionOption(text="Retirement Plans", value="retirement_plans")
-                ]
-            ),
-            Question(
-                type="text",
-                title="Additional comments or suggestions",
-                required=False
-            )
-        ]
+    return StreamingResponse(
+        body_holding_slot(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{survey_id}_responses.{format}"'},
+        background=BackgroundTask(release_slot)
     )
+
+@api_router.get(
+    "/surveys/{survey_id}/responses/{response_id}/answers/{question_id}",
+    dependencies=[Depends(require_mongo_storage)]
+)
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def get_full_answer(survey_id: str, response_id: str, question_id: str):
+    # Long text answers are stored apart from their response; this loads one on demand
+    response = await storage_call(lambda: analytics_db.responses.find_one(
+        {"id": response_id, "survey_id": survey_id}, {"_id": 0, "responses": 1}, **cursor_deadline()
+    ))
+    if not response or question_id not in response.get("responses", {}):
+        raise HTTPException(status_code=404, detail="Answer not found")
+    answer = response["responses"][question_id]
+    if is_blob_ref(answer):
+        blob_id = answer["blob_id"]
+        answer = await storage_call(lambda: load_blob(analytics_db, blob_id, **cursor_deadline()))
+        if answer is None:
+            raise HTTPException(status_code=404, detail="Answer not found")
+    return {"response_id": response_id, "question_id": question_id, "answer": answer}
+
+@api_router.get("/surveys/{survey_id}/responses/live", dependencies=[Depends(require_mongo_storage)])
+async def stream_survey_response_stats(survey_id: str, request: Request):
+    survey = await storage_call(lambda: db.surveys.find_one({"id": survey_id}))
+    if not survey:
+        raise HTTPException(status_code=404, detail="Survey not found")
     
-    # Event Feedback Template
-    event_feedback = Survey(
-        title="Event Feedback Survey",
-        description="Gather feedback about your event",
-        is_template=True,
-        template_category="Events",
-        questions=[
-            Question(
-                type="rating",
-                title="How would you rate the overall event?",
-                required=True,
-                min_rating=1,
-                max_rating=5
-            ),
-            Question(
-                type="multiple_choice",
-                title="Which session did you find most valuable?",
-                required=True,
-                options=[
-                    QuestionOption(text="Opening Keynote", value="opening_keynote"),
-                    QuestionOption(text="Panel Discussion", value="panel_discussion"),
-                    QuestionOption(text="Workshop", value="workshop"),
-                    QuestionOption(text="Networking Session", value="networking"),
-                    QuestionOption(text="Closing Remarks", value="closing_remarks")
-                ]
-            ),
-            Question(
-                type="text",
-                title="What topics would you like to see in future events?",
-                required=False
-            ),
-            Question(
-                type="multiple_choice",
-                title="Would you recommend this event to others?",
-                required=True,
-                options=[
-                    QuestionOption(text="Definitely", value="definitely"),
-                    QuestionOption(text="Probably", value="probably"),
-                    QuestionOption(text="Maybe", value="maybe"),
-                    QuestionOption(text="Probably Not", value="probably_not"),
-                    QuestionOption(text="Definitely Not", value="definitely_not")
-                ]
-            )
-        ]
+    # Server-Sent Events: a "snapshot" event followed by "delta" events for changed questions
+    return StreamingResponse(
+        live_stats.stream(survey, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+@api_router.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+# Initialize default templates
+@api_router.post("/init-templates")
+@with_deadline(QUERY_DEADLINE_SECONDS)
+async def initialize_templates():
+    # Check if templates already exist
+    existing_templates = await storage_call(lambda: store.list_surveys(is_template=True, limit=1))
+    if existing_templates:
+        return {"message": "Templates already initialized"}
     
     # Insert templates
-    await db.surveys.insert_one(customer_feedback.dict())
-    await db.surveys.insert_one(employee_satisfaction.dict())
-    await db.surveys.insert_one(event_feedback.dict())
+    await storage_call(lambda: store.insert_surveys([template.dict() for template in default_templates()]))
     
     return {"message": "Templates initialized successfully"}
 
+# Warm-up after startup: indexes, pools, templates and recently active surveys, before /readyz says ready
+warm_up = WarmUp()
+
+@warm_up.step("indexes", required=True)
+async def create_indexes():
+    # Retried until they exist; /readyz stays unready meanwhile
+    await store.ensure_indexes()
+    if MONGO_STORAGE:
+        await db.survey_sketches.create_index(SKETCH_INDEX_KEYS, unique=True)
+
+@warm_up.step("connections")
+async def open_connections():
+    if not MONGO_STORAGE:
+        return
+    # Concurrent pings each check out a connection, opening the pools up to their minimum size
+    await asyncio.gather(
+        *(client.admin.command("ping") for _ in range(max(1, INGEST_MIN_POOL_SIZE))),
+        *(analytics_client.admin.command("ping") for _ in range(max(1, ANALYTICS_MIN_POOL_SIZE)))
+    )
+
+@warm_up.step("templates")
+async def load_templates():
+    await initialize_templates()
+    templates = await store.list_surveys(is_template=True)
+    fallback_cache.put("templates", templates)
+    await templates_payload(templates)
+
+@warm_up.step("recent_surveys")
+async def load_recent_surveys():
+    survey_ids = await store.recently_active_survey_ids(WARMUP_RECENT_SURVEYS, WARMUP_SCAN_RESPONSES)
+    if not survey_ids:
+        return
+    for survey in await store.list_surveys(is_template=False, ids=survey_ids, limit=len(survey_ids)):
+        fallback_cache.put(f"survey:{survey['id']}", survey)
+        validators.get(survey)
+        response_spool.surveys.put(survey)
+        await survey_payload(survey)
+
+# Probes live outside /api: liveness says the process is up, readiness that it is warm
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    status = warm_up.status()
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -374,6 +734,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli/zstd for JSON and CSV bodies; cached payloads arrive already encoded and pass through
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Only installed when enabled, so unprofiled deployments pay nothing for it
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -381,6 +749,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_background_tasks():
+    # Nothing here waits on the database, so the process starts while MongoDB is unreachable
+    if MONGO_STORAGE:
+        answer_sketches.start()
+        archive_scheduler.start()
+        await response_spool.start()
+    # In the background, so /healthz answers while the caches fill
+    warm_up.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await warm_up.stop()
+    live_stats.close()
+    archive_scheduler.stop()
+    await answer_sketches.stop()
+    await cancel_pending_purges()
+    await response_spool.stop()
+    await store.close()
+    client.close()
+    analytics_client.close()
\ No newline at end of file
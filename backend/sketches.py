@@ -0,0 +1,259 @@
+"""
+Approximate distinct counts and most common answers for free-text questions.
+
+Every text, email and phone answer is fed into a HyperLogLog (distinct answers)
+and a Space-Saving summary (most frequent answers). Both are small, fixed-size
+and mergeable, so they are kept per survey, question and day: submissions update
+an in-memory buffer that is flushed to the ``survey_sketches`` collection every
+few seconds, and the stats endpoint merges the stored buckets on read.
+
+HyperLogLog registers are merged in MongoDB itself with ``$max``. Space-Saving
+summaries are merged in Python and written back with an optimistic version
+check, which is cheap because flushes are infrequent.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+SKETCH_QUESTION_TYPES = ("text", "email", "phone")
+SKETCH_FLUSH_SECONDS = float(os.environ.get("SKETCH_FLUSH_SECONDS", "5"))
+SKETCH_TOPK_CAPACITY = int(os.environ.get("SKETCH_TOPK_CAPACITY", "100"))
+SKETCH_TOP_K = int(os.environ.get("SKETCH_TOP_K", "10"))
+HLL_PRECISION = 12
+
+SKETCH_INDEX_KEYS = [("survey_id", 1), ("question_id", 1), ("bucket", 1)]
+
+
+def normalize_answer(value: str) -> str:
+    return " ".join(value.split()).lower()
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Sparse HyperLogLog with 2**precision registers over 64-bit hashes."""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[Dict[int, int]] = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers: Dict[int, int] = registers or {}
+
+    def add(self, value: str) -> None:
+        h = hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers.get(index, 0):
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        for index, rank in other.registers.items():
+            if rank > self.registers.get(index, 0):
+                self.registers[index] = rank
+        return self
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def estimate(self) -> int:
+        m = self.m
+        zeros = m - len(self.registers)
+        harmonic = zeros + sum(2.0 ** -rank for rank in self.registers.values())
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / harmonic
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters: at most ``capacity`` counters of (count, error).
+
+    Every reported count overestimates the true count by at most its error, and
+    every error is at most total / capacity.
+    """
+
+    def __init__(self, capacity: int = SKETCH_TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counters: Dict[str, List[int]] = {}
+        self.total = 0
+
+    def add(self, value: str, count: int = 1) -> None:
+        self.total += count
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = [count, 0]
+        else:
+            # Replace the smallest counter; its count becomes the newcomer's error
+            smallest = min(self.counters, key=lambda v: self.counters[v][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[value] = [floor + count, floor]
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        # Values missing from a full summary may still have up to its minimum count
+        own_floor = self._floor()
+        other_floor = other._floor()
+        merged: Dict[str, List[int]] = {}
+        for value in set(self.counters) | set(other.counters):
+            count_a, error_a = self.counters.get(value, (own_floor, own_floor))
+            count_b, error_b = other.counters.get(value, (other_floor, other_floor))
+            merged[value] = [count_a + count_b, error_a + error_b]
+        ranked = sorted(merged.items(), key=lambda item: item[1][0], reverse=True)
+        self.counters = dict(ranked[:self.capacity])
+        self.total += other.total
+        return self
+
+    def _floor(self) -> int:
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def top(self, k: int = SKETCH_TOP_K) -> List[Dict[str, Any]]:
+        ranked = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)[:k]
+        return [{"value": value, "count": count, "max_overcount": error} for value, (count, error) in ranked]
+
+    def to_doc(self) -> List[Dict[str, Any]]:
+        return [{"v": value, "c": count, "e": error} for value, (count, error) in self.counters.items()]
+
+    @classmethod
+    def from_doc(cls, items: Iterable[Dict[str, Any]], total: int = 0, capacity: int = SKETCH_TOPK_CAPACITY):
+        summary = cls(capacity)
+        summary.counters = {item["v"]: [item["c"], item["e"]] for item in items}
+        summary.total = total
+        return summary
+
+
+class QuestionSketch:
+    __slots__ = ("hll", "top")
+
+    def __init__(self, hll: Optional[HyperLogLog] = None, top: Optional[SpaceSaving] = None):
+        self.hll = hll or HyperLogLog()
+        self.top = top or SpaceSaving()
+
+    def add(self, value: str) -> None:
+        self.hll.add(value)
+        self.top.add(value)
+
+    def merge(self, other: "QuestionSketch") -> "QuestionSketch":
+        self.hll.merge(other.hll)
+        self.top.merge(other.top)
+        return self
+
+    def result(self, k: int = SKETCH_TOP_K) -> Dict[str, Any]:
+        return {
+            "approximate_distinct": {
+                "estimate": self.hll.estimate(),
+                "relative_error": round(self.hll.relative_error, 4),
+            },
+            "top_answers": {
+                "items": self.top.top(k),
+                "max_overcount": self.top.total // self.top.capacity,
+            },
+        }
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "QuestionSketch":
+        hll = HyperLogLog(registers={int(index): rank for index, rank in doc.get("hll", {}).items()})
+        top = SpaceSaving.from_doc(doc.get("topk", []), doc.get("count", 0))
+        return cls(hll, top)
+
+
+SketchKey = Tuple[str, str, str]
+
+
+class SketchStore:
+    def __init__(self, db):
+        self.db = db
+        self.buffer: Dict[SketchKey, QuestionSketch] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def observe(self, survey: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """Buffer the free-text answers of a stored response."""
+        answers = response.get("responses", {})
+        bucket = response["submitted_at"].strftime("%Y-%m-%d")
+        for question in survey.get("questions", []):
+            if question["type"] not in SKETCH_QUESTION_TYPES:
+                continue
+            value = answers.get(question["id"])
+            if isinstance(value, str) and value.strip():
+                key = (survey["id"], question["id"], bucket)
+                sketch = self.buffer.get(key)
+                if sketch is None:
+                    sketch = self.buffer[key] = QuestionSketch()
+                sketch.add(normalize_answer(value))
+
+    async def flush(self) -> None:
+        buffer, self.buffer = self.buffer, {}
+        for key, sketch in buffer.items():
+            try:
+                await self.write(key, sketch)
+            except Exception:
+                logger.exception("Could not flush answer sketch %s; retrying on the next flush", key)
+                # Keep the updates, together with anything observed since the buffer was swapped out
+                pending = self.buffer.get(key)
+                self.buffer[key] = sketch if pending is None else sketch.merge(pending)
+
+    async def write(self, key: SketchKey, sketch: QuestionSketch, attempts: int = 5) -> None:
+        survey_id, question_id, bucket = key
+        match = {"survey_id": survey_id, "question_id": question_id, "bucket": bucket}
+        for _ in range(attempts):
+            stored = await self.db.survey_sketches.find_one(match, {"topk": 1, "count": 1, "version": 1})
+            top = SpaceSaving.from_doc(stored["topk"], stored["count"]) if stored else SpaceSaving()
+            top.merge(sketch.top)
+            update = {
+                "$max": {f"hll.{index}": rank for index, rank in sketch.hll.registers.items()},
+                "$inc": {"count": sketch.top.total, "version": 1},
+                "$set": {"topk": top.to_doc(), "updated_at": datetime.utcnow()},
+            }
+            try:
+                if stored is None:
+                    result = await self.db.survey_sketches.update_one(match, update, upsert=True)
+                else:
+                    result = await self.db.survey_sketches.update_one({**match, "version": stored["version"]}, update)
+            except DuplicateKeyError:
+                # Another process created the bucket first
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                return
+        raise RuntimeError(f"Gave up merging answer sketch after {attempts} conflicting writes")
+
+    async def load(self, survey_id: str) -> Dict[str, QuestionSketch]:
+        """Merge every stored bucket into one sketch per question."""
+        merged: Dict[str, QuestionSketch] = {}
+        async for doc in self.db.survey_sketches.find({"survey_id": survey_id}):
+            sketch = QuestionSketch.from_doc(doc)
+            if doc["question_id"] in merged:
+                merged[doc["question_id"]].merge(sketch)
+            else:
+                merged[doc["question_id"]] = sketch
+        return merged
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(SKETCH_FLUSH_SECONDS)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
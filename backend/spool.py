@@ -0,0 +1,435 @@
+"""
+Durable local spool for response submissions.
+
+With RESPONSE_SPOOL_ENABLED, validated responses are appended to a local
+append-only log and acknowledged as soon as they are on disk, so a slow or
+failing-over MongoDB no longer holds up respondents. Appends are group
+committed: everything that arrives within RESPONSE_SPOOL_COMMIT_MS is written
+and fsynced together, and each submitter waits for the fsync covering its line.
+
+A background drainer replays the log into ``responses`` with ``insert_many``.
+The position of the last drained line is checkpointed on disk, so after a
+restart draining resumes where it stopped; a batch inserted just before a crash
+is replayed and its duplicates are dropped by the unique index on ``id``. Long
+text answers are moved to ``answer_blobs`` on the way (see blobs.py).
+
+A batch failing for a reason that may pass (connection loss, failover, write
+concern) is retried as a whole. A record MongoDB rejects for good (validation,
+a document too large) is moved to the dead-letter file instead, so it cannot
+hold up everything spooled after it.
+
+The log is split into segments, which are deleted once fully drained:
+
+    RESPONSE_SPOOL_DIR/segment-<number>.jsonl
+    RESPONSE_SPOOL_DIR/checkpoint.json
+    RESPONSE_SPOOL_DIR/dead-letter.jsonl
+
+Each process needs a RESPONSE_SPOOL_DIR of its own. Worker processes sharing one
+would append to the same segment and each keep their own checkpoint, so lines
+could interleave and responses would be drained twice or deleted undrained.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError
+
+from blobs import discard_blobs, offload_batch, store_blobs
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_SPOOL_ENABLED = os.environ.get("RESPONSE_SPOOL_ENABLED", "false").lower() in ("1", "true", "yes")
+# One directory per process (e.g. suffix it per uvicorn/gunicorn worker); never shared
+RESPONSE_SPOOL_DIR = Path(os.environ.get("RESPONSE_SPOOL_DIR", Path(__file__).parent / "spool"))
+RESPONSE_SPOOL_COMMIT_MS = float(os.environ.get("RESPONSE_SPOOL_COMMIT_MS", "5"))
+RESPONSE_SPOOL_SEGMENT_BYTES = int(os.environ.get("RESPONSE_SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_SPOOL_DRAIN_BATCH = int(os.environ.get("RESPONSE_SPOOL_DRAIN_BATCH", "1000"))
+RESPONSE_SPOOL_DRAIN_IDLE_SECONDS = 0.2
+RESPONSE_SPOOL_RETRY_SECONDS = 2.0
+# How long a spooled submission waits for the survey before using the copy seen last
+RESPONSE_SPOOL_SURVEY_LOOKUP_SECONDS = float(os.environ.get("RESPONSE_SPOOL_SURVEY_LOOKUP_SECONDS", "0.5"))
+RESPONSE_SPOOL_SURVEY_CACHE_SIZE = 1000
+
+DUPLICATE_KEY_ERROR = 11000
+# Per-document write errors caused by the server's state rather than the document; the batch is retried
+RETRYABLE_WRITE_ERROR_CODES = frozenset({
+    6,      # HostUnreachable
+    7,      # HostNotFound
+    50,     # MaxTimeMSExpired
+    89,     # NetworkTimeout
+    91,     # ShutdownInProgress
+    112,    # WriteConflict
+    189,    # PrimarySteppedDown
+    262,    # ExceededTimeLimit
+    9001,   # SocketException
+    10107,  # NotWritablePrimary
+    11600,  # InterruptedAtShutdown
+    11602,  # InterruptedDueToReplStateChange
+    13435,  # NotPrimaryNoSecondaryOk
+    13436,  # NotPrimaryOrSecondary
+})
+
+# A response MongoDB will never accept, with the reason
+Rejected = Tuple[Dict[str, Any], str]
+
+# (segment number, byte offset) of the next line to drain
+Position = Tuple[int, int]
+
+
+def segment_path(directory: Path, number: int) -> Path:
+    return directory / f"segment-{number:012d}.jsonl"
+
+
+def segment_numbers(directory: Path) -> List[int]:
+    return sorted(int(path.stem.split("-", 1)[1]) for path in directory.glob("segment-*.jsonl"))
+
+
+def encode_record(response: Dict[str, Any]) -> bytes:
+    doc = {**response, "submitted_at": response["submitted_at"].isoformat()}
+    return (json.dumps({"t": time.time(), "doc": doc}, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def decode_record(line: bytes) -> Dict[str, Any]:
+    record = json.loads(line)
+    record["doc"]["submitted_at"] = datetime.fromisoformat(record["doc"]["submitted_at"])
+    return record
+
+
+class SurveySnapshots:
+    """Last copy of recently used surveys, for validating submissions while MongoDB is unreachable."""
+
+    def __init__(self, max_size: int = RESPONSE_SPOOL_SURVEY_CACHE_SIZE):
+        self.max_size = max_size
+        self._surveys: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        return self._surveys.get(survey_id)
+
+    def put(self, survey: Dict[str, Any]) -> None:
+        self._surveys[survey["id"]] = survey
+        self._surveys.move_to_end(survey["id"])
+        if len(self._surveys) > self.max_size:
+            self._surveys.popitem(last=False)
+
+
+class ResponseSpool:
+    def __init__(
+        self,
+        db,
+        on_stored: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+        directory: Path = RESPONSE_SPOOL_DIR,
+        commit_interval: float = RESPONSE_SPOOL_COMMIT_MS / 1000,
+        segment_bytes: int = RESPONSE_SPOOL_SEGMENT_BYTES,
+        drain_batch: int = RESPONSE_SPOOL_DRAIN_BATCH,
+    ):
+        self.db = db
+        # Called with the responses a drain batch actually inserted (duplicates excluded)
+        self.on_stored = on_stored
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.segment_bytes = segment_bytes
+        self.drain_batch = drain_batch
+        self.surveys = SurveySnapshots()
+
+        self.depth = 0
+        self._head_time: Optional[float] = None
+        self._segment = 0
+        self._committed = 0
+        self._file = None
+        self._checkpoint: Position = (0, 0)
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._commit_task: Optional[asyncio.Task] = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+    # --- recovery -------------------------------------------------------
+
+    def _recover(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        numbers = segment_numbers(self.directory)
+        checkpoint_path = self.directory / "checkpoint.json"
+        if checkpoint_path.exists():
+            stored = json.loads(checkpoint_path.read_text())
+            self._checkpoint = (stored["segment"], stored["offset"])
+        elif numbers:
+            self._checkpoint = (numbers[0], 0)
+
+        if numbers:
+            # A crash mid-append can leave a torn last line; it was never acknowledged
+            last = segment_path(self.directory, numbers[-1])
+            data = last.read_bytes()
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                with open(last, "r+b") as f:
+                    f.truncate(complete)
+                    os.fsync(f.fileno())
+            self._segment = numbers[-1]
+        else:
+            self._segment = self._checkpoint[0]
+
+        self._file = open(segment_path(self.directory, self._segment), "ab")
+        self._committed = self._file.tell()
+
+        # Count what is left to drain
+        segment, offset = self._checkpoint
+        for number in numbers:
+            if number < segment:
+                continue
+            with open(segment_path(self.directory, number), "rb") as f:
+                if number == segment:
+                    f.seek(offset)
+                for line in f:
+                    if self._head_time is None:
+                        self._head_time = json.loads(line)["t"]
+                    self.depth += 1
+
+    # --- appending ------------------------------------------------------
+
+    async def append(self, response: Dict[str, Any]) -> None:
+        """Add a response to the spool; returns once it is durably on disk."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((encode_record(response), future))
+        self._wakeup.set()
+        await future
+
+    def _write(self, lines: List[bytes]) -> None:
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._committed = self._file.tell()
+        if self._committed >= self.segment_bytes:
+            self._file.close()
+            self._segment += 1
+            self._file = open(segment_path(self.directory, self._segment), "ab")
+            self._committed = 0
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    async def _commit_loop(self) -> None:
+        while not self._closing:
+            await self._wakeup.wait()
+            # Let concurrent submissions join this commit
+            await asyncio.sleep(self.commit_interval)
+            self._wakeup.clear()
+            await self._commit()
+
+    async def _commit(self) -> None:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self._write, [line for line, _ in batch])
+        except Exception as e:
+            logger.exception("Could not write %d responses to the spool", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if self.depth == 0:
+            self._head_time = time.time()
+        self.depth += len(batch)
+        metrics.inc("responses_spooled", len(batch))
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    # --- draining -------------------------------------------------------
+
+    def _read_batch(self, start: Position, active: Position) -> Tuple[List[Dict[str, Any]], int, Position]:
+        """Up to ``drain_batch`` committed records from ``start``.
+
+        Also returns the number of unreadable lines skipped and the position after the batch.
+        """
+        records: List[Dict[str, Any]] = []
+        skipped = 0
+        segment, offset = start
+        active_segment, committed = active
+        while len(records) < self.drain_batch and segment <= active_segment:
+            path = segment_path(self.directory, segment)
+            if not path.exists():
+                segment, offset = segment + 1, 0
+                continue
+            limit = committed if segment == active_segment else path.stat().st_size
+            with open(path, "rb") as f:
+                f.seek(offset)
+                while len(records) < self.drain_batch and offset < limit:
+                    line = f.readline()
+                    if not line.endswith(b"\n") or offset + len(line) > limit:
+                        break
+                    offset += len(line)
+                    try:
+                        records.append(decode_record(line))
+                    except (ValueError, KeyError):
+                        logger.error("Skipping unreadable spool record in %s", path.name)
+                        skipped += 1
+            if segment == active_segment or len(records) >= self.drain_batch:
+                break
+            segment, offset = segment + 1, 0
+        return records, skipped, (segment, offset)
+
+    def _save_checkpoint(self, position: Position) -> None:
+        path = self.directory / "checkpoint.json"
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"segment": position[0], "offset": position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        # Segments before the checkpoint are fully drained
+        for number in segment_numbers(self.directory):
+            if number < position[0]:
+                segment_path(self.directory, number).unlink(missing_ok=True)
+
+    async def _insert(self, responses: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Rejected]]:
+        """Insert a batch, skipping responses already stored.
+
+        Returns the responses inserted now and those rejected for good; raises
+        when the whole batch should be retried.
+        """
+        # The stored copies carry blob references; the returned originals keep their full answers
+        stored, blobs = offload_batch(responses)
+        try:
+            await store_blobs(self.db, blobs)
+            await self.db.responses.insert_many(stored, ordered=False)
+            return responses, []
+        except InvalidDocument as e:
+            # Raised before anything is sent (e.g. a document over 16MB), so the culprit is found one by one
+            if len(responses) == 1:
+                await discard_blobs(self.db, stored)
+                return [], [(responses[0], str(e))]
+            inserted: List[Dict[str, Any]] = []
+            rejected: List[Rejected] = []
+            for response in responses:
+                one_inserted, one_rejected = await self._insert([response])
+                inserted += one_inserted
+                rejected += one_rejected
+            return inserted, rejected
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if e.details.get("writeConcernErrors") or any(
+                error["code"] in RETRYABLE_WRITE_ERROR_CODES for error in errors
+            ):
+                raise
+            failed = {error["index"]: error for error in errors}
+            # Replays keep their blobs; duplicates by idempotency key and rejected records leave theirs behind
+            await discard_blobs(self.db, [stored[index] for index in failed])
+            duplicates = [index for index, error in failed.items() if error["code"] == DUPLICATE_KEY_ERROR]
+            metrics.inc("response_spool_duplicates", len(duplicates))
+            rejected = [
+                (responses[index], f"{error['code']}: {error.get('errmsg', '')}")
+                for index, error in failed.items()
+                if error["code"] != DUPLICATE_KEY_ERROR
+            ]
+            return [response for index, response in enumerate(responses) if index not in failed], rejected
+
+    def _dead_letter(self, rejected: List[Rejected]) -> None:
+        lines = [
+            json.dumps(
+                {"t": time.time(), "error": error, "doc": {**doc, "submitted_at": doc["submitted_at"].isoformat()}},
+                separators=(",", ":"),
+                default=str,
+            ) + "\n"
+            for doc, error in rejected
+        ]
+        with open(self.directory / "dead-letter.jsonl", "a") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _drain_loop(self) -> None:
+        while True:
+            records, skipped, position = await asyncio.to_thread(
+                self._read_batch, self._checkpoint, (self._segment, self._committed)
+            )
+            if not records:
+                if position != self._checkpoint:
+                    # Only unreadable lines or finished segments were passed
+                    await asyncio.to_thread(self._save_checkpoint, position)
+                    self._checkpoint = position
+                    self._consumed(skipped)
+                await asyncio.sleep(RESPONSE_SPOOL_DRAIN_IDLE_SECONDS)
+                continue
+            self._head_time = records[0]["t"]
+            try:
+                inserted, rejected = await self._insert([record["doc"] for record in records])
+                if rejected:
+                    # Before the checkpoint moves past them, so a rejected response is never just lost
+                    await asyncio.to_thread(self._dead_letter, rejected)
+            except Exception:
+                logger.exception("Draining %d spooled responses failed; retrying", len(records))
+                metrics.inc("response_spool_drain_errors")
+                await asyncio.sleep(RESPONSE_SPOOL_RETRY_SECONDS)
+                continue
+            if rejected:
+                logger.error(
+                    "Moved %d spooled responses MongoDB rejected to %s: %s",
+                    len(rejected), self.directory / "dead-letter.jsonl", rejected[0][1],
+                )
+                metrics.inc("response_spool_dead_letters", len(rejected))
+
+            await asyncio.to_thread(self._save_checkpoint, position)
+            self._checkpoint = position
+            self._consumed(len(records) + skipped)
+            metrics.inc("responses_drained", len(inserted))
+            if self.on_stored is not None and inserted:
+                try:
+                    await self.on_stored(inserted)
+                except Exception:
+                    logger.exception("Post-insert handling of drained responses failed")
+
+    def _consumed(self, count: int) -> None:
+        self.depth = max(0, self.depth - count)
+        if self.depth == 0:
+            self._head_time = None
+
+    # --- lifecycle ------------------------------------------------------
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest response still waiting in the spool."""
+        if not self.depth or self._head_time is None:
+            return 0.0
+        return max(0.0, time.time() - self._head_time)
+
+    async def start(self, accept: bool = RESPONSE_SPOOL_ENABLED) -> None:
+        """Recover the spool and start draining it.
+
+        Nothing runs when spooling is disabled and no spool is left on disk;
+        a spool left behind by an earlier run is still drained.
+        """
+        if not accept and not self.directory.exists():
+            return
+        await asyncio.to_thread(self._recover)
+        metrics.gauge("response_spool_depth", lambda: self.depth)
+        metrics.gauge("response_spool_lag_seconds", self.lag_seconds)
+        self._commit_task = asyncio.create_task(self._commit_loop())
+        self._drain_task = asyncio.create_task(self._drain_loop())
+
+    async def stop(self) -> None:
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            await asyncio.gather(self._drain_task, return_exceptions=True)
+            self._drain_task = None
+        if self._commit_task is not None:
+            # The commit loop is not cancelled mid-write; it finishes the commit in progress
+            self._closing = True
+            self._wakeup.set()
+            await self._commit_task
+            self._commit_task = None
+        # Whatever is still spooled is drained on the next start
+        await self._commit()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,213 @@
+"""
+Per-question response statistics.
+
+StatsAccumulator folds responses in one at a time, so the same code serves a
+full scan for the stats endpoint and incremental updates for live dashboards.
+Run over a random sample instead, it also yields estimates for the whole survey
+with 95% confidence intervals.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+Z_95 = 1.959964
+
+
+class QuestionAccumulator:
+    __slots__ = ("question", "answered_count", "option_counts", "rating_sum", "rating_sum_squares", "rating_count")
+
+    def __init__(self, question: Dict[str, Any]):
+        self.question = question
+        self.answered_count = 0
+        self.option_counts: Dict[Any, int] = {}
+        self.rating_sum = 0.0
+        self.rating_sum_squares = 0.0
+        self.rating_count = 0
+
+    def add(self, answer: Any) -> None:
+        self.answered_count += 1
+        question_type = self.question["type"]
+        if question_type == "multiple_choice":
+            if answer:
+                self.option_counts[answer] = self.option_counts.get(answer, 0) + 1
+        elif question_type == "rating":
+            if isinstance(answer, (int, float)):
+                self.rating_sum += answer
+                self.rating_sum_squares += answer * answer
+                self.rating_count += 1
+
+    def result(self, total_responses: int) -> Dict[str, Any]:
+        return {
+            "question_title": self.question["title"],
+            "question_type": self.question["type"],
+            "answered_count": self.answered_count,
+            "completion_rate": (self.answered_count / total_responses * 100) if total_responses > 0 else 0,
+            "option_distribution": dict(self.option_counts),
+            "average_rating": (self.rating_sum / self.rating_count) if self.rating_count else None,
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "answered_count": self.answered_count,
+            "option_counts": dict(self.option_counts),
+            "rating_sum": self.rating_sum,
+            "rating_sum_squares": self.rating_sum_squares,
+            "rating_count": self.rating_count,
+        }
+
+    def merge_state(self, state: Dict[str, Any]) -> None:
+        self.answered_count += state["answered_count"]
+        for option, count in state["option_counts"].items():
+            self.option_counts[option] = self.option_counts.get(option, 0) + count
+        self.rating_sum += state["rating_sum"]
+        self.rating_sum_squares += state["rating_sum_squares"]
+        self.rating_count += state["rating_count"]
+
+    def estimate(
+        self, sample_size: int, population: int, total: int, exact: Optional["QuestionAccumulator"] = None
+    ) -> Dict[str, Any]:
+        """Estimate stats for ``population`` responses from a uniform sample of ``sample_size`` of them.
+
+        ``exact`` holds precisely known stats for the ``total - population``
+        responses outside the sampled population (archived ones); they are added
+        without widening the intervals.
+        """
+        exact = exact or QuestionAccumulator(self.question)
+        fpc = finite_population_correction(sample_size, population)
+        scale = population / sample_size
+
+        def count_interval(successes: int, known: int) -> List[int]:
+            low, high = proportion_interval(successes, sample_size, fpc)
+            return [math.floor(low * population) + known, math.ceil(high * population) + known]
+
+        answered_count = round(self.answered_count * scale) + exact.answered_count
+        answered_interval = count_interval(self.answered_count, exact.answered_count)
+        option_distribution = {}
+        option_intervals = {}
+        for option in set(self.option_counts) | set(exact.option_counts):
+            sampled = self.option_counts.get(option, 0)
+            known = exact.option_counts.get(option, 0)
+            option_distribution[option] = round(sampled * scale) + known
+            option_intervals[option] = count_interval(sampled, known)
+
+        average_rating = None
+        rating_interval = None
+        rated = self.rating_count * scale
+        if rated + exact.rating_count:
+            average_rating = (self.rating_sum * scale + exact.rating_sum) / (rated + exact.rating_count)
+            margin = 0.0
+            if self.rating_count > 1:
+                mean = self.rating_sum / self.rating_count
+                variance = (self.rating_sum_squares - self.rating_count * mean ** 2) / (self.rating_count - 1)
+                margin = Z_95 * math.sqrt(max(variance, 0.0) / self.rating_count) * fpc
+                # Only the sampled share of the ratings is uncertain
+                margin *= rated / (rated + exact.rating_count)
+            rating_interval = [average_rating - margin, average_rating + margin]
+
+        return {
+            "question_title": self.question["title"],
+            "question_type": self.question["type"],
+            "answered_count": answered_count,
+            "completion_rate": (answered_count / total * 100) if total > 0 else 0,
+            "option_distribution": option_distribution,
+            "average_rating": average_rating,
+            "confidence_intervals": {
+                "answered_count": answered_interval,
+                "completion_rate": [bound / total * 100 for bound in answered_interval] if total > 0 else [0, 0],
+                "option_distribution": option_intervals,
+                "average_rating": rating_interval,
+            },
+        }
+
+
+class StatsAccumulator:
+    """Running per-question stats for one survey."""
+
+    def __init__(self, questions: List[Dict[str, Any]]):
+        self.questions = {question["id"]: QuestionAccumulator(question) for question in questions}
+        self.total_responses = 0
+
+    def add(self, answers: Dict[str, Any]) -> Set[str]:
+        """Fold in one response's answers and return the ids of the questions it touched."""
+        self.total_responses += 1
+        touched = set()
+        for question_id, answer in answers.items():
+            accumulator = self.questions.get(question_id)
+            if accumulator is not None:
+                accumulator.add(answer)
+                touched.add(question_id)
+        return touched
+
+    def add_all(self, responses: Iterable[Dict[str, Any]]) -> "StatsAccumulator":
+        for response in responses:
+            self.add(response.get("responses", {}))
+        return self
+
+    def question_stats(
+        self, total_responses: Optional[int] = None, question_ids: Optional[Iterable[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        total = self.total_responses if total_responses is None else total_responses
+        ids = self.questions.keys() if question_ids is None else question_ids
+        return {question_id: self.questions[question_id].result(total) for question_id in ids}
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "total_responses": self.total_responses,
+            "questions": {question_id: question.to_state() for question_id, question in self.questions.items()},
+        }
+
+    def merge_state(self, state: Dict[str, Any]) -> "StatsAccumulator":
+        """Add serialized stats; questions no longer in the survey are ignored."""
+        self.total_responses += state["total_responses"]
+        for question_id, question_state in state["questions"].items():
+            question = self.questions.get(question_id)
+            if question is not None:
+                question.merge_state(question_state)
+        return self
+
+
+def finite_population_correction(sample_size: int, population: int) -> float:
+    if population <= 1 or sample_size >= population:
+        return 0.0
+    return math.sqrt((population - sample_size) / (population - 1))
+
+
+def proportion_interval(successes: int, trials: int, fpc: float = 1.0) -> Tuple[float, float]:
+    """Wilson score interval at 95%, narrowed by the finite population correction."""
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    z = Z_95 * fpc
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def compute_question_stats(
+    questions: List[Dict[str, Any]], responses: Iterable[Dict[str, Any]], total_responses: int
+) -> Dict[str, Dict[str, Any]]:
+    """Stats for every question over ``responses``, with rates relative to ``total_responses``."""
+    return StatsAccumulator(questions).add_all(responses).question_stats(total_responses)
+
+
+def estimate_question_stats(
+    questions: List[Dict[str, Any]],
+    sample: Iterable[Dict[str, Any]],
+    population: int,
+    exact: Optional[StatsAccumulator] = None,
+) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+    """Estimated stats from a random sample of ``population`` responses; returns (sample size, stats).
+
+    ``exact`` adds precisely known stats for responses outside the population.
+    """
+    accumulator = StatsAccumulator(questions).add_all(sample)
+    exact = exact or StatsAccumulator(questions)
+    size = accumulator.total_responses
+    total = population + exact.total_responses
+    if size == 0:
+        return 0, exact.question_stats(total)
+    return size, {
+        question_id: question.estimate(size, population, total, exact.questions[question_id])
+        for question_id, question in accumulator.questions.items()
+    }
@@ -0,0 +1,430 @@
+"""
+Storage backends for surveys and responses.
+
+The core API (survey CRUD, response submission and listing, exact stats) goes
+through a SurveyStore. MongoStore uses Motor. SqliteStore keeps everything in a
+local SQLite file in WAL mode, which needs no database server and suits
+single-node installs, tests and benchmarks. STORAGE_BACKEND picks one.
+
+MongoDB queries are bounded by the request deadline (see resilience.py), and
+long text answers are stored apart from their responses (see blobs.py).
+Respondent ingestion and analytics use separate Motor clients, so each has its
+own connection pool. Analytics reads can go to secondaries through
+ANALYTICS_READ_PREFERENCE.
+
+Features built on MongoDB-specific machinery still use Motor directly and need
+STORAGE_BACKEND=mongo: survey patches, the responses grid, approximate stats,
+live stats, answer sketches, exports, archiving and the ingestion spool.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from blobs import BLOB_INDEX_KEYS, discard_blobs, offload_answers, store_blobs
+from idempotency import IDEMPOTENCY_INDEX_KEYS, IDEMPOTENCY_INDEX_OPTIONS
+from purge import schedule_purge
+from resilience import command_deadline, cursor_deadline
+from stats import StatsAccumulator
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo")
+SQLITE_PATH = Path(os.environ.get("SQLITE_PATH", Path(__file__).parent / "surveys.db"))
+INGEST_MIN_POOL_SIZE = int(os.environ.get("INGEST_MIN_POOL_SIZE", "10"))
+INGEST_MAX_POOL_SIZE = int(os.environ.get("INGEST_MAX_POOL_SIZE", "100"))
+ANALYTICS_MIN_POOL_SIZE = int(os.environ.get("ANALYTICS_MIN_POOL_SIZE", "2"))
+ANALYTICS_MAX_POOL_SIZE = int(os.environ.get("ANALYTICS_MAX_POOL_SIZE", "20"))
+# E.g. secondaryPreferred; analytics may then briefly lag behind submissions
+ANALYTICS_READ_PREFERENCE = os.environ.get("ANALYTICS_READ_PREFERENCE", "primary")
+# At least 90 when set, as MongoDB requires; 0 leaves staleness unbounded
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get("ANALYTICS_MAX_STALENESS_SECONDS", "0"))
+
+
+def mongo_client_options(workload: str) -> Dict[str, Any]:
+    """Keyword arguments for the Motor client serving ``workload`` ("ingest" or "analytics")."""
+    if workload == "ingest":
+        return {"minPoolSize": INGEST_MIN_POOL_SIZE, "maxPoolSize": INGEST_MAX_POOL_SIZE, "appname": "forms-ingest"}
+    if workload == "analytics":
+        options = {
+            "minPoolSize": ANALYTICS_MIN_POOL_SIZE,
+            "maxPoolSize": ANALYTICS_MAX_POOL_SIZE,
+            "readPreference": ANALYTICS_READ_PREFERENCE,
+            "appname": "forms-analytics",
+        }
+        if ANALYTICS_MAX_STALENESS_SECONDS and ANALYTICS_READ_PREFERENCE != "primary":
+            options["maxStalenessSeconds"] = ANALYTICS_MAX_STALENESS_SECONDS
+        return options
+    raise ValueError(f"Unknown workload {workload!r}")
+
+
+class DuplicateResponse(Exception):
+    """A response with the same idempotency key is already stored for the survey."""
+
+
+class SurveyStore(ABC):
+    name: str
+
+    @abstractmethod
+    async def ensure_indexes(self) -> None: ...
+
+    @abstractmethod
+    async def insert_surveys(self, surveys: List[Dict[str, Any]]) -> None: ...
+
+    @abstractmethod
+    async def get_survey(self, survey_id: str, is_template: Optional[bool] = None) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def list_surveys(
+        self, is_template: bool, ids: Optional[List[str]] = None, limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Surveys (or templates), optionally only those in ``ids``, in no particular order."""
+
+    @abstractmethod
+    async def replace_survey(self, survey_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Overwrite ``fields`` of a survey and return it, or None when it does not exist."""
+
+    @abstractmethod
+    async def delete_survey(self, survey_id: str) -> bool:
+        """Delete a survey and, eventually, its responses; False when it does not exist."""
+
+    @abstractmethod
+    async def insert_response(self, response: Dict[str, Any]) -> None:
+        """Store a response; raises DuplicateResponse when its idempotency key was used before."""
+
+    @abstractmethod
+    async def find_response(self, survey_id: str, idempotency_key: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def list_responses(
+        self, survey_id: str, skip: int, limit: int, sort_by: str = "submitted_at", direction: int = -1
+    ) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def count_responses(self, survey_id: str) -> int: ...
+
+    @abstractmethod
+    async def recently_active_survey_ids(self, limit: int, scan: int) -> List[str]:
+        """Up to ``limit`` ids of surveys with the newest responses, newest first, looking at the last ``scan`` stored."""
+
+    @abstractmethod
+    async def response_stats(self, survey: Dict[str, Any], stats: StatsAccumulator) -> StatsAccumulator:
+        """Fold every stored response of ``survey`` into ``stats``."""
+
+    async def close(self) -> None:
+        pass
+
+
+class MongoStore(SurveyStore):
+    name = "mongo"
+
+    def __init__(self, db):
+        self.db = db
+
+    async def ensure_indexes(self) -> None:
+        await self.db.surveys.create_index("id")
+        await self.db.responses.create_index([("survey_id", 1), ("submitted_at", -1)])
+        await self.db.responses.create_index(IDEMPOTENCY_INDEX_KEYS, **IDEMPOTENCY_INDEX_OPTIONS)
+        # Replayed spool batches rely on this to drop responses already stored
+        await self.db.responses.create_index("id", unique=True)
+        await self.db.answer_blobs.create_index(BLOB_INDEX_KEYS)
+
+    async def insert_surveys(self, surveys: List[Dict[str, Any]]) -> None:
+        if len(surveys) == 1:
+            await self.db.surveys.insert_one(surveys[0])
+        else:
+            await self.db.surveys.insert_many(surveys, ordered=False)
+
+    async def get_survey(self, survey_id: str, is_template: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        query: Dict[str, Any] = {"id": survey_id}
+        if is_template is not None:
+            query["is_template"] = is_template
+        return await self.db.surveys.find_one(query, **cursor_deadline())
+
+    async def list_surveys(
+        self, is_template: bool, ids: Optional[List[str]] = None, limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"is_template": is_template}
+        if ids is not None:
+            query["id"] = {"$in": ids}
+        return await self.db.surveys.find(query, **cursor_deadline()).to_list(limit)
+
+    async def replace_survey(self, survey_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self.db.surveys.find_one_and_update(
+            {"id": survey_id}, {"$set": fields}, return_document=ReturnDocument.AFTER, **command_deadline()
+        )
+
+    async def delete_survey(self, survey_id: str) -> bool:
+        result = await self.db.surveys.delete_one({"id": survey_id})
+        if result.deleted_count == 0:
+            return False
+        # Responses and other survey-owned data are removed in throttled batches
+        schedule_purge(self.db, survey_id)
+        return True
+
+    async def insert_response(self, response: Dict[str, Any]) -> None:
+        # Long text answers go to answer_blobs, leaving a reference and preview in the response
+        response, blobs = offload_answers(response)
+        await store_blobs(self.db, blobs)
+        try:
+            await self.db.responses.insert_one(response)
+        except DuplicateKeyError as e:
+            # A retry carries a new response id, so the blobs just written belong to nothing
+            await discard_blobs(self.db, [response])
+            raise DuplicateResponse() from e
+
+    async def find_response(self, survey_id: str, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        return await self.db.responses.find_one(
+            {"survey_id": survey_id, "idempotency_key": idempotency_key}, **cursor_deadline()
+        )
+
+    async def list_responses(
+        self, survey_id: str, skip: int, limit: int, sort_by: str = "submitted_at", direction: int = -1
+    ) -> List[Dict[str, Any]]:
+        cursor = self.db.responses.find({"survey_id": survey_id}, **cursor_deadline())
+        cursor = cursor.sort(sort_by, direction).skip(skip).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def count_responses(self, survey_id: str) -> int:
+        return await self.db.responses.count_documents({"survey_id": survey_id}, **command_deadline())
+
+    async def recently_active_survey_ids(self, limit: int, scan: int) -> List[str]:
+        # Reverse natural order walks the newest inserts first without needing an index
+        cursor = self.db.responses.find({}, {"_id": 0, "survey_id": 1}, **cursor_deadline())
+        responses = await cursor.sort("$natural", -1).limit(scan).to_list(scan)
+        return list(dict.fromkeys(response["survey_id"] for response in responses))[:limit]
+
+    async def response_stats(self, survey: Dict[str, Any], stats: StatsAccumulator) -> StatsAccumulator:
+        cursor = self.db.responses.find({"survey_id": survey["id"]}, {"_id": 0, "responses": 1}, **cursor_deadline())
+        async for response in cursor:
+            stats.add(response.get("responses", {}))
+        return stats
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS surveys (
+    id TEXT PRIMARY KEY,
+    is_template INTEGER NOT NULL,
+    doc TEXT NOT NULL CHECK (json_valid(doc))
+);
+CREATE INDEX IF NOT EXISTS surveys_is_template ON surveys (is_template);
+CREATE TABLE IF NOT EXISTS responses (
+    id TEXT PRIMARY KEY,
+    survey_id TEXT NOT NULL,
+    submitted_at TEXT NOT NULL,
+    idempotency_key TEXT,
+    responses TEXT NOT NULL CHECK (json_valid(responses))
+);
+CREATE INDEX IF NOT EXISTS responses_survey_submitted ON responses (survey_id, submitted_at);
+CREATE UNIQUE INDEX IF NOT EXISTS responses_survey_idempotency_key
+    ON responses (survey_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
+"""
+
+SQLITE_SORT_COLUMNS = {"submitted_at": "submitted_at", "id": "id"}
+
+
+def to_json(value: Any) -> str:
+    return json.dumps(value, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+
+def survey_from_row(doc: str) -> Dict[str, Any]:
+    survey = json.loads(doc)
+    for field in ("created_at", "updated_at"):
+        if isinstance(survey.get(field), str):
+            survey[field] = datetime.fromisoformat(survey[field])
+    return survey
+
+
+def response_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    response = {
+        "id": row["id"],
+        "survey_id": row["survey_id"],
+        "submitted_at": datetime.fromisoformat(row["submitted_at"]),
+        "responses": json.loads(row["responses"]),
+    }
+    if row["idempotency_key"] is not None:
+        response["idempotency_key"] = row["idempotency_key"]
+    return response
+
+
+class SqliteStore(SurveyStore):
+    """One shared connection, used from worker threads one call at a time."""
+
+    name = "sqlite"
+
+    def __init__(self, path: Path = SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps NORMAL crash-safe; only the last commits can be lost on power failure
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, work):
+        def locked():
+            with self._lock:
+                return work(self._connect())
+
+        return await asyncio.to_thread(locked)
+
+    async def ensure_indexes(self) -> None:
+        await self._run(lambda connection: connection.executescript(SQLITE_SCHEMA))
+
+    async def insert_surveys(self, surveys: List[Dict[str, Any]]) -> None:
+        rows = [(survey["id"], int(survey.get("is_template", False)), to_json(survey)) for survey in surveys]
+
+        def insert(connection):
+            with connection:
+                connection.execute("BEGIN")
+                connection.executemany("INSERT INTO surveys (id, is_template, doc) VALUES (?, ?, ?)", rows)
+
+        await self._run(insert)
+
+    async def get_survey(self, survey_id: str, is_template: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        sql, params = "SELECT doc FROM surveys WHERE id = ?", [survey_id]
+        if is_template is not None:
+            sql += " AND is_template = ?"
+            params.append(int(is_template))
+        row = await self._run(lambda connection: connection.execute(sql, params).fetchone())
+        return survey_from_row(row["doc"]) if row else None
+
+    async def list_surveys(
+        self, is_template: bool, ids: Optional[List[str]] = None, limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        sql, params = "SELECT doc FROM surveys WHERE is_template = ?", [int(is_template)]
+        if ids is not None:
+            # json_each keeps the statement the same size however many ids are asked for
+            sql += " AND id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(ids))
+        sql += " LIMIT ?"
+        params.append(limit)
+        rows = await self._run(lambda connection: connection.execute(sql, params).fetchall())
+        return [survey_from_row(row["doc"]) for row in rows]
+
+    async def replace_survey(self, survey_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        def replace(connection):
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute("SELECT doc FROM surveys WHERE id = ?", (survey_id,)).fetchone()
+                if row is None:
+                    return None
+                survey = {**json.loads(row["doc"]), **fields}
+                doc = to_json(survey)
+                connection.execute(
+                    "UPDATE surveys SET doc = ?, is_template = ? WHERE id = ?",
+                    (doc, int(survey.get("is_template", False)), survey_id),
+                )
+                return doc
+
+        doc = await self._run(replace)
+        return survey_from_row(doc) if doc is not None else None
+
+    async def delete_survey(self, survey_id: str) -> bool:
+        # Local deletes are cheap, so responses go in the same transaction
+        def delete(connection):
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                deleted = connection.execute("DELETE FROM surveys WHERE id = ?", (survey_id,)).rowcount
+                if deleted:
+                    connection.execute("DELETE FROM responses WHERE survey_id = ?", (survey_id,))
+                return bool(deleted)
+
+        return await self._run(delete)
+
+    async def insert_response(self, response: Dict[str, Any]) -> None:
+        row = (
+            response["id"],
+            response["survey_id"],
+            response["submitted_at"].isoformat(),
+            response.get("idempotency_key"),
+            to_json(response.get("responses", {})),
+        )
+
+        def insert(connection):
+            connection.execute(
+                "INSERT INTO responses (id, survey_id, submitted_at, idempotency_key, responses) VALUES (?, ?, ?, ?, ?)",
+                row,
+            )
+
+        try:
+            await self._run(insert)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateResponse() from e
+
+    async def find_response(self, survey_id: str, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        row = await self._run(lambda connection: connection.execute(
+            "SELECT * FROM responses WHERE survey_id = ? AND idempotency_key = ?", (survey_id, idempotency_key)
+        ).fetchone())
+        return response_from_row(row) if row else None
+
+    async def list_responses(
+        self, survey_id: str, skip: int, limit: int, sort_by: str = "submitted_at", direction: int = -1
+    ) -> List[Dict[str, Any]]:
+        params: List[Any] = [survey_id]
+        if sort_by in SQLITE_SORT_COLUMNS:
+            order = SQLITE_SORT_COLUMNS[sort_by]
+        elif sort_by.startswith("responses."):
+            order = "json_extract(responses, ?)"
+            params.append('$."' + sort_by.split(".", 1)[1].replace('"', '""') + '"')
+        else:
+            raise ValueError(f"Cannot sort responses by {sort_by!r}")
+        order_direction = "DESC" if direction < 0 else "ASC"
+        sql = (
+            f"SELECT * FROM responses WHERE survey_id = ? "
+            f"ORDER BY {order} {order_direction}, id {order_direction} LIMIT ? OFFSET ?"
+        )
+        params += [limit, skip]
+        rows = await self._run(lambda connection: connection.execute(sql, params).fetchall())
+        return [response_from_row(row) for row in rows]
+
+    async def count_responses(self, survey_id: str) -> int:
+        row = await self._run(lambda connection: connection.execute(
+            "SELECT COUNT(*) FROM responses WHERE survey_id = ?", (survey_id,)
+        ).fetchone())
+        return row[0]
+
+    async def recently_active_survey_ids(self, limit: int, scan: int) -> List[str]:
+        rows = await self._run(lambda connection: connection.execute(
+            "SELECT survey_id FROM (SELECT survey_id, rowid AS position FROM responses ORDER BY rowid DESC LIMIT ?)"
+            " GROUP BY survey_id ORDER BY MAX(position) DESC LIMIT ?",
+            (scan, limit)
+        ).fetchall())
+        return [row["survey_id"] for row in rows]
+
+    async def response_stats(self, survey: Dict[str, Any], stats: StatsAccumulator) -> StatsAccumulator:
+        def fold(connection):
+            for (answers,) in connection.execute("SELECT responses FROM responses WHERE survey_id = ?", (survey["id"],)):
+                stats.add(json.loads(answers))
+            return stats
+
+        return await self._run(fold)
+
+    async def close(self) -> None:
+        def close(_connection):
+            self._connection.close()
+            self._connection = None
+
+        if self._connection is not None:
+            await self._run(close)
+
+
+def build_store(db, backend: str = STORAGE_BACKEND) -> SurveyStore:
+    if backend == "mongo":
+        return MongoStore(db)
+    if backend == "sqlite":
+        return SqliteStore()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
@@ -0,0 +1,150 @@
+"""
+Validation of submitted answers against a survey's questions.
+
+Each survey is compiled once into a validator holding one check per question,
+so validating a submission is a dictionary walk with no per-request parsing of
+the question list. Compiled validators are cached per survey and invalidated by
+the survey's ``updated_at``.
+"""
+
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+VALIDATOR_CACHE_SIZE = int(os.environ.get("VALIDATOR_CACHE_SIZE", "1024"))
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+PHONE_PATTERN = re.compile(r"^\+?[0-9 ()./-]{7,20}$")
+
+# A check returns an error message, or None when the answer is valid
+Check = Callable[[Any], Optional[str]]
+Validator = Callable[[Dict[str, Any]], List[Dict[str, str]]]
+
+
+def is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def _check_text(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return "Expected a text answer"
+    return None
+
+
+def _check_email(value: Any) -> Optional[str]:
+    if not isinstance(value, str) or not EMAIL_PATTERN.match(value):
+        return "Expected a valid email address"
+    return None
+
+
+def _check_phone(value: Any) -> Optional[str]:
+    if not isinstance(value, str) or not PHONE_PATTERN.match(value):
+        return "Expected a valid phone number"
+    digits = sum(c.isdigit() for c in value)
+    if not 7 <= digits <= 15:
+        return "Expected a valid phone number"
+    return None
+
+
+def _any_value(value: Any) -> Optional[str]:
+    return None
+
+
+def compile_question_check(question: Dict[str, Any]) -> Check:
+    question_type = question.get("type")
+    values = frozenset(option["value"] for option in question.get("options") or [])
+
+    if question_type == "rating":
+        # Same defaults the survey builder and response form use
+        low = question.get("min_rating")
+        high = question.get("max_rating")
+        low = 1 if low is None else low
+        high = 5 if high is None else high
+        message = f"Expected a whole number from {low} to {high}"
+
+        def check_rating(value: Any) -> Optional[str]:
+            if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+                return message
+            return None
+
+        return check_rating
+
+    if question_type == "multiple_choice":
+        if not values:
+            return _check_text
+        message = f"Expected one of: {', '.join(sorted(values))}"
+
+        def check_choice(value: Any) -> Optional[str]:
+            if not isinstance(value, str) or value not in values:
+                return message
+            return None
+
+        return check_choice
+
+    if question_type == "checkbox":
+
+        def check_checkbox(value: Any) -> Optional[str]:
+            if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+                return "Expected a list of selected options"
+            if len(set(value)) != len(value):
+                return "Options may only be selected once"
+            if values and not values.issuperset(value):
+                return f"Unknown options: {', '.join(sorted(set(value) - values))}"
+            return None
+
+        return check_checkbox
+
+    return {"text": _check_text, "email": _check_email, "phone": _check_phone}.get(question_type, _any_value)
+
+
+def compile_validator(survey: Dict[str, Any]) -> Validator:
+    """Compile a survey document into a function returning a list of answer errors."""
+    checks = {question["id"]: compile_question_check(question) for question in survey.get("questions", [])}
+    required = [question["id"] for question in survey.get("questions", []) if question.get("required")]
+
+    def validate(answers: Dict[str, Any]) -> List[Dict[str, str]]:
+        errors = []
+        for question_id, value in answers.items():
+            check = checks.get(question_id)
+            if check is None:
+                errors.append({"question_id": question_id, "message": "Unknown question"})
+            elif not is_empty(value):
+                message = check(value)
+                if message:
+                    errors.append({"question_id": question_id, "message": message})
+        for question_id in required:
+            if is_empty(answers.get(question_id)):
+                errors.append({"question_id": question_id, "message": "This question is required"})
+        return errors
+
+    return validate
+
+
+class ValidatorCache:
+    """LRU cache of compiled validators keyed by survey id and ``updated_at``."""
+
+    def __init__(self, max_size: int = VALIDATOR_CACHE_SIZE):
+        self.max_size = max_size
+        self._validators: "OrderedDict[str, Tuple[Any, Validator]]" = OrderedDict()
+
+    def get(self, survey: Dict[str, Any]) -> Validator:
+        survey_id = survey["id"]
+        version = survey.get("updated_at")
+        cached = self._validators.get(survey_id)
+        if cached is not None and cached[0] == version:
+            self._validators.move_to_end(survey_id)
+            return cached[1]
+
+        validator = compile_validator(survey)
+        self._validators[survey_id] = (version, validator)
+        self._validators.move_to_end(survey_id)
+        if len(self._validators) > self.max_size:
+            self._validators.popitem(last=False)
+        return validator
+
+    def discard(self, survey_id: str) -> None:
+        self._validators.pop(survey_id, None)
+
+
+validators = ValidatorCache()
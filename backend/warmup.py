@@ -0,0 +1,95 @@
+"""
+Startup warm-up and readiness.
+
+A fresh process would otherwise pay for connection handshakes, template reads
+and cache fills on its first requests. ``WarmUp`` runs those steps in the
+background right after startup. ``/readyz`` reports ready only once every
+step has succeeded, so the load balancer keeps traffic away until then, while
+``/healthz`` only says the process is alive. A failed step is retried after
+WARMUP_RETRY_SECONDS; steps that already succeeded are not run again.
+
+Steps registered with ``required=True`` (e.g. creating indexes) run even when
+warm-up is disabled; readiness then waits for those alone.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", "5"))
+# Surveys with the newest responses are preloaded, judged from the last WARMUP_SCAN_RESPONSES stored
+WARMUP_RECENT_SURVEYS = int(os.environ.get("WARMUP_RECENT_SURVEYS", "200"))
+WARMUP_SCAN_RESPONSES = int(os.environ.get("WARMUP_SCAN_RESPONSES", "20000"))
+
+
+class WarmUp:
+    """Named startup steps run in registration order; ready once all have succeeded."""
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, retry_seconds: float = WARMUP_RETRY_SECONDS):
+        self.enabled = enabled
+        self.retry_seconds = retry_seconds
+        self.steps: List[Tuple[str, Callable[[], Awaitable[Any]]]] = []
+        self.required: Set[str] = set()
+        # Seconds each finished step took
+        self.completed: Dict[str, float] = {}
+        self.ready = False
+        self.draining = False
+        self._task: Optional[asyncio.Task] = None
+        metrics.gauge("ready", lambda: float(self.ready and not self.draining))
+
+    def step(self, name: str, required: bool = False):
+        def register(func: Callable[[], Awaitable[Any]]):
+            self.steps.append((name, func))
+            if required:
+                self.required.add(name)
+            return func
+
+        return register
+
+    async def run(self) -> None:
+        started = time.monotonic()
+        for name, func in self.steps:
+            if not self.enabled and name not in self.required:
+                continue
+            while name not in self.completed:
+                step_started = time.monotonic()
+                try:
+                    await func()
+                except Exception:
+                    metrics.inc("warmup_failures")
+                    logger.exception("Warm-up step %s failed; retrying in %ss", name, self.retry_seconds)
+                    await asyncio.sleep(self.retry_seconds)
+                    continue
+                self.completed[name] = time.monotonic() - step_started
+        self.ready = True
+        logger.info("Warm-up finished in %.2fs", time.monotonic() - started)
+
+    def start(self) -> None:
+        if not self.enabled and not self.required:
+            self.ready = True
+            return
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        # Report not ready first, so the load balancer stops sending traffic while we drain
+        self.draining = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready and not self.draining,
+            "draining": self.draining,
+            "steps": {name: self.completed.get(name) for name, _ in self.steps},
+        }
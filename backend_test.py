@@ -54,6 +54,17 @@ class SurveyAPITester:
             self.test_results[category]['errors'].append(f"{test_name}: {error_msg}")
             print(f"❌ {test_name}: {error_msg}")
 
+    def with_question_ids(self, response_data):
+        """Map placeholder keys like "question_2" to the survey's real question ids"""
+        survey = self.session.get(f"{API_BASE}/surveys/{response_data['survey_id']}").json()
+        question_ids = [q['id'] for q in survey['questions']]
+        answers = {}
+        for key, value in response_data['responses'].items():
+            if key.startswith('question_'):
+                key = question_ids[int(key.split('_', 1)[1]) - 1]
+            answers[key] = value
+        return {**response_data, "responses": answers}
+
     def test_survey_crud_apis(self):
         print("\n=== Testing Survey CRUD APIs ===")
         
@@ -154,6 +165,60 @@ class SurveyAPITester:
         # Test 5: Delete Survey (will be done at cleanup)
         # We'll keep the survey for response testing and delete later
 
+    def test_survey_patch_api(self):
+        print("\n=== Testing Survey PATCH API ===")
+        
+        if not self.created_surveys:
+            self.log_result('survey_crud', 'Patch Survey', False, "No surveys available for testing")
+            return
+        
+        survey_id = self.created_surveys[0]
+        try:
+            survey = self.session.get(f"{API_BASE}/surveys/{survey_id}").json()
+            first_id = survey['questions'][0]['id']
+            
+            # Single field edit goes through positional array filters
+            response = self.session.patch(f"{API_BASE}/surveys/{survey_id}", json={
+                "update_questions": [{"id": first_id, "title": "$5 off? Renamed question"}]
+            })
+            if response.status_code == 200 and response.json()['questions'][0]['title'] == "$5 off? Renamed question":
+                self.log_result('survey_crud', 'Patch Survey Question Title', True)
+            else:
+                self.log_result('survey_crud', 'Patch Survey Question Title', False, f"Status: {response.status_code}, Response: {response.text}")
+            
+            # Combined add + reorder goes through an update pipeline
+            new_question = {"id": str(uuid.uuid4()), "type": "text", "title": "Added by patch"}
+            response = self.session.patch(f"{API_BASE}/surveys/{survey_id}", json={
+                "title": "Patched Survey Title",
+                "add_questions": [{"question": new_question}],
+                "question_order": [new_question['id']]
+            })
+            if response.status_code == 200:
+                patched = response.json()
+                ids = [q['id'] for q in patched['questions']]
+                if patched['title'] == "Patched Survey Title" and ids[0] == new_question['id'] and len(ids) == len(survey['questions']) + 1:
+                    self.log_result('survey_crud', 'Patch Survey Add And Reorder', True)
+                else:
+                    self.log_result('survey_crud', 'Patch Survey Add And Reorder', False, f"Unexpected question order: {ids}")
+            else:
+                self.log_result('survey_crud', 'Patch Survey Add And Reorder', False, f"Status: {response.status_code}, Response: {response.text}")
+            
+            # Removing it again restores the original questions
+            response = self.session.patch(f"{API_BASE}/surveys/{survey_id}", json={"remove_questions": [new_question['id']]})
+            if response.status_code == 200 and len(response.json()['questions']) == len(survey['questions']):
+                self.log_result('survey_crud', 'Patch Survey Remove Question', True)
+            else:
+                self.log_result('survey_crud', 'Patch Survey Remove Question', False, f"Status: {response.status_code}")
+            
+            # Unknown question ids are rejected
+            response = self.session.patch(f"{API_BASE}/surveys/{survey_id}", json={"remove_questions": ["does-not-exist"]})
+            if response.status_code == 409:
+                self.log_result('survey_crud', 'Patch Survey Unknown Question', True)
+            else:
+                self.log_result('survey_crud', 'Patch Survey Unknown Question', False, f"Expected 409, got {response.status_code}")
+        except Exception as e:
+            self.log_result('survey_crud', 'Patch Survey', False, str(e))
+
     def test_template_system(self):
         print("\n=== Testing Template System ===")
         
@@ -201,6 +266,39 @@ class SurveyAPITester:
         except Exception as e:
             self.log_result('template_system', 'Create Survey from Template', False, str(e))
 
+    def test_batch_survey_operations(self):
+        print("\n=== Testing Batch Survey Operations ===")
+        
+        if not getattr(self, 'template_id', None):
+            self.log_result('template_system', 'Bulk Create Surveys', False, "No template available for testing")
+            return
+        
+        # Test 1: Clone one template into several surveys
+        titles = [f"Bulk Event Survey {i}" for i in range(5)]
+        try:
+            response = self.session.post(f"{API_BASE}/templates/{self.template_id}/create-surveys", json={"titles": titles})
+            if response.status_code == 200 and [s['title'] for s in response.json()] == titles:
+                bulk_ids = [s['id'] for s in response.json()]
+                self.created_surveys.extend(bulk_ids)
+                self.log_result('template_system', 'Bulk Create Surveys', True)
+            else:
+                self.log_result('template_system', 'Bulk Create Surveys', False, f"Status: {response.status_code}, Response: {response.text}")
+                return
+        except Exception as e:
+            self.log_result('template_system', 'Bulk Create Surveys', False, str(e))
+            return
+        
+        # Test 2: Fetch them back in one request, in the requested order
+        try:
+            requested = list(reversed(bulk_ids)) + ["does-not-exist"]
+            response = self.session.get(f"{API_BASE}/surveys", params={"ids": ",".join(requested)})
+            if response.status_code == 200 and [s['id'] for s in response.json()] == requested[:-1]:
+                self.log_result('survey_crud', 'Batch Get Surveys', True)
+            else:
+                self.log_result('survey_crud', 'Batch Get Surveys', False, f"Status: {response.status_code}, Response: {response.text}")
+        except Exception as e:
+            self.log_result('survey_crud', 'Batch Get Surveys', False, str(e))
+
     def test_response_collection_system(self):
         print("\n=== Testing Response Collection System ===")
         
@@ -221,7 +319,7 @@ class SurveyAPITester:
         }
         
         try:
-            response = self.session.post(f"{API_BASE}/responses", json=response_data)
+            response = self.session.post(f"{API_BASE}/responses", json=self.with_question_ids(response_data))
             if response.status_code == 200:
                 response_obj = response.json()
                 self.created_responses.append(response_obj['id'])
@@ -245,7 +343,7 @@ class SurveyAPITester:
         }
         
         try:
-            response = self.session.post(f"{API_BASE}/responses", json=response_data2)
+            response = self.session.post(f"{API_BASE}/responses", json=self.with_question_ids(response_data2))
             if response.status_code == 200:
                 response_obj = response.json()
                 self.created_responses.append(response_obj['id'])
@@ -255,7 +353,48 @@ class SurveyAPITester:
         except Exception as e:
             self.log_result('response_collection', 'Submit Multiple Responses', False, str(e))
 
-        # Test 3: Get Survey Responses
+        # Test 3: Reject Invalid Answers
+        invalid_response = {
+            "survey_id": survey_id,
+            "responses": {
+                "question_1": "Invalid Rating",
+                "question_2": "not_an_option",
+                "question_3": 9,
+                "unknown_question": "value"
+            }
+        }
+        try:
+            response = self.session.post(f"{API_BASE}/responses", json=self.with_question_ids(invalid_response))
+            if response.status_code == 422 and len(response.json().get('detail', [])) == 3:
+                self.log_result('response_collection', 'Reject Invalid Answers', True)
+            else:
+                self.log_result('response_collection', 'Reject Invalid Answers', False, f"Status: {response.status_code}, Response: {response.text}")
+        except Exception as e:
+            self.log_result('response_collection', 'Reject Invalid Answers', False, str(e))
+
+        # Test 4: Retried Submission With Idempotency-Key
+        retried_response = {
+            "survey_id": survey_id,
+            "responses": {
+                "question_1": "Retry Smith",
+                "question_2": "neutral",
+                "question_3": 3
+            }
+        }
+        try:
+            headers = {"Idempotency-Key": str(uuid.uuid4())}
+            payload = self.with_question_ids(retried_response)
+            first = self.session.post(f"{API_BASE}/responses", json=payload, headers=headers)
+            second = self.session.post(f"{API_BASE}/responses", json=payload, headers=headers)
+            if first.status_code == 200 and second.status_code == 200 and first.json()['id'] == second.json()['id']:
+                self.created_responses.append(first.json()['id'])
+                self.log_result('response_collection', 'Idempotent Retry', True)
+            else:
+                self.log_result('response_collection', 'Idempotent Retry', False, f"Statuses: {first.status_code}, {second.status_code}")
+        except Exception as e:
+            self.log_result('response_collection', 'Idempotent Retry', False, str(e))
+
+        # Test 5: Get Survey Responses
         try:
             response = self.session.get(f"{API_BASE}/surveys/{survey_id}/responses")
             if response.status_code == 200:
@@ -360,7 +499,7 @@ class SurveyAPITester:
         }
         
         try:
-            response = self.session.post(f"{API_BASE}/responses", json=comprehensive_response)
+            response = self.session.post(f"{API_BASE}/responses", json=self.with_question_ids(comprehensive_response))
             if response.status_code == 200:
                 response_obj = response.json()
                 self.created_responses.append(response_obj['id'])
@@ -458,7 +597,7 @@ class SurveyAPITester:
         # Submit multiple responses
         for i, response_data in enumerate(response_data_list):
             try:
-                response = self.session.post(f"{API_BASE}/responses", json=response_data)
+                response = self.session.post(f"{API_BASE}/responses", json=self.with_question_ids(response_data))
                 if response.status_code == 200:
                     response_obj = response.json()
                     self.created_responses.append(response_obj['id'])
@@ -569,6 +708,25 @@ class SurveyAPITester:
         except Exception as e:
             self.log_result('enhanced_responses', 'Combined Pagination and Sorting', False, str(e))
 
+        # Test 7: Grid page, matching total and facets in one request
+        try:
+            survey = self.session.get(f"{API_BASE}/surveys/{survey_id}").json()
+            choice_id = survey['questions'][1]['id']
+            response = self.session.get(f"{API_BASE}/surveys/{survey_id}/responses/grid", params={
+                "page": 1, "limit": 2, "sort_by": "submitted_at", "sort_order": "asc", "q": "alice"
+            })
+            if response.status_code == 200:
+                grid = response.json()
+                facet = grid['facets'].get(choice_id, {})
+                if grid['total'] >= 1 and len(grid['items']) <= 2 and facet.get('values', {}).get('very_satisfied', 0) >= 1:
+                    self.log_result('enhanced_responses', 'Grid Page with Facets', True)
+                else:
+                    self.log_result('enhanced_responses', 'Grid Page with Facets', False, f"Unexpected grid: {grid}")
+            else:
+                self.log_result('enhanced_responses', 'Grid Page with Facets', False, f"Status: {response.status_code}")
+        except Exception as e:
+            self.log_result('enhanced_responses', 'Grid Page with Facets', False, str(e))
+
     def test_response_analytics_endpoint(self):
         print("\n=== Testing Response Analytics Endpoint ===")
         
@@ -753,7 +911,9 @@ class SurveyAPITester:
             return False
 
         self.test_survey_crud_apis()
+        self.test_survey_patch_api()
         self.test_template_system()
+        self.test_batch_survey_operations()
         self.test_response_collection_system()
         self.test_question_types_support()
         self.test_enhanced_response_endpoints()
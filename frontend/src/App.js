@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import "./App.css";
 import axios from "axios";
 
@@ -400,10 +400,29 @@ const SurveyBuilder = ({ onSave, editingSurvey = null }) => {
   );
 };
 
+// crypto.randomUUID only exists in secure contexts (HTTPS, localhost); forms opened over plain HTTP fall back
+const newIdempotencyKey = () => {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  const bytes = new Uint8Array(16);
+  if (typeof crypto !== 'undefined' && typeof crypto.getRandomValues === 'function') {
+    crypto.getRandomValues(bytes);
+  } else {
+    for (let i = 0; i < bytes.length; i++) bytes[i] = Math.floor(Math.random() * 256);
+  }
+  bytes[6] = (bytes[6] & 0x0f) | 0x40;
+  bytes[8] = (bytes[8] & 0x3f) | 0x80;
+  const hex = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+};
+
 // Survey Response Component
 const SurveyResponse = ({ survey, onSubmit }) => {
   const [responses, setResponses] = useState({});
   const [submitted, setSubmitted] = useState(false);
+  // One key per filled-in form, so resubmitting after a network error never stores it twice
+  const [idempotencyKey] = useState(newIdempotencyKey);
 
   const handleResponseChange = (questionId, value) => {
     setResponses(prev => ({
@@ -415,7 +434,7 @@ const SurveyResponse = ({ survey, onSubmit }) => {
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
-      await onSubmit(responses);
+      await onSubmit(responses, idempotencyKey);
       setSubmitted(true);
     } catch (error) {
       console.error('Error submitting response:', error);
@@ -477,25 +496,82 @@ const SurveyResponse = ({ survey, onSubmit }) => {
 };
 
 // Grid View Component for Survey Responses
-const ResponseGridView = ({ survey, responses, onRefresh }) => {
+// Long text answers arrive as {blob_id, preview, length}; the full text is fetched on request
+const isLongAnswer = (answer) => answer !== null && typeof answer === 'object' && !Array.isArray(answer) && 'blob_id' in answer;
+
+const LongAnswer = ({ surveyId, responseId, questionId, answer }) => {
+  const [fullText, setFullText] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  const loadFullText = async () => {
+    setLoading(true);
+    try {
+      const response = await axios.get(`${API}/surveys/${surveyId}/responses/${responseId}/answers/${questionId}`);
+      setFullText(response.data.answer);
+    } catch (error) {
+      console.error('Error loading answer:', error);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  if (fullText !== null) {
+    return <span className="whitespace-pre-wrap">{fullText}</span>;
+  }
+  return (
+    <span>
+      {answer.preview}…{' '}
+      <button type="button" onClick={loadFullText} disabled={loading} className="text-blue-600 hover:underline text-sm">
+        {loading ? 'Loading...' : `Show all ${answer.length} characters`}
+      </button>
+    </span>
+  );
+};
+
+const GRID_ROW_HEIGHT = 56;
+const GRID_VIEWPORT_HEIGHT = 600;
+const GRID_OVERSCAN_ROWS = 8;
+
+const ResponseGridView = ({ survey }) => {
   const [sortBy, setSortBy] = useState('submitted_at');
   const [sortOrder, setSortOrder] = useState('desc');
   const [filterText, setFilterText] = useState('');
+  const [query, setQuery] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
-  const [itemsPerPage, setItemsPerPage] = useState(10);
-  const [stats, setStats] = useState(null);
+  const [itemsPerPage, setItemsPerPage] = useState(100);
+  const [grid, setGrid] = useState({ items: [], total: 0, facets: {} });
+  const [loading, setLoading] = useState(false);
+  const [scrollTop, setScrollTop] = useState(0);
   const [selectedResponses, setSelectedResponses] = useState([]);
+  const viewportRef = useRef(null);
+
+  // Only ask the server once typing pauses
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      setQuery(filterText.trim());
+      setCurrentPage(1);
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [filterText]);
 
   useEffect(() => {
-    loadResponseStats();
-  }, [survey.id]);
+    loadGrid();
+  }, [survey.id, currentPage, itemsPerPage, sortBy, sortOrder, query]);
 
-  const loadResponseStats = async () => {
+  const loadGrid = async () => {
+    setLoading(true);
     try {
-      const response = await axios.get(`${API}/surveys/${survey.id}/responses/stats`);
-      setStats(response.data);
+      const response = await axios.get(`${API}/surveys/${survey.id}/responses/grid`, {
+        params: { page: currentPage, limit: itemsPerPage, sort_by: sortBy, sort_order: sortOrder, q: query }
+      });
+      setGrid(response.data);
+      setSelectedResponses([]);
+      setScrollTop(0);
+      if (viewportRef.current) viewportRef.current.scrollTop = 0;
     } catch (error) {
-      console.error('Error loading response stats:', error);
+      console.error('Error loading response grid:', error);
+    } finally {
+      setLoading(false);
     }
   };
 
@@ -506,6 +582,7 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
       setSortBy(column);
       setSortOrder('asc');
     }
+    setCurrentPage(1);
   };
 
   const handleSelectResponse = (responseId) => {
@@ -517,107 +594,58 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
   };
 
   const handleSelectAll = () => {
-    if (selectedResponses.length === filteredResponses.length) {
+    if (selectedResponses.length === grid.items.length) {
       setSelectedResponses([]);
     } else {
-      setSelectedResponses(filteredResponses.map(r => r.id));
+      setSelectedResponses(grid.items.map(r => r.id));
     }
   };
 
-  const exportToCSV = () => {
-    const csvData = filteredResponses.map(response => {
-      const row = {
-        'Response ID': response.id,
-        'Submitted At': new Date(response.submitted_at).toLocaleString()
-      };
-      
-      survey.questions.forEach(question => {
-        const answer = response.responses[question.id];
-        row[question.title] = Array.isArray(answer) ? answer.join(', ') : (answer || 'No response');
-      });
-      
-      return row;
-    });
-
-    const csvContent = [
-      Object.keys(csvData[0]).join(','),
-      ...csvData.map(row => Object.values(row).map(val => `"${val}"`).join(','))
-    ].join('\n');
-
-    const blob = new Blob([csvContent], { type: 'text/csv' });
-    const url = URL.createObjectURL(blob);
-    const a = document.createElement('a');
-    a.href = url;
-    a.download = `${survey.title}_responses.csv`;
-    a.click();
-  };
-
-  const filteredResponses = responses.filter(response => {
-    if (!filterText) return true;
-    
-    const searchText = filterText.toLowerCase();
-    return survey.questions.some(question => {
-      const answer = response.responses[question.id];
-      const answerText = Array.isArray(answer) ? answer.join(' ') : (answer || '');
-      return answerText.toString().toLowerCase().includes(searchText);
-    });
-  });
-
-  const sortedResponses = [...filteredResponses].sort((a, b) => {
-    let aValue = a[sortBy];
-    let bValue = b[sortBy];
-    
-    if (sortBy === 'submitted_at') {
-      aValue = new Date(aValue);
-      bValue = new Date(bValue);
-    }
-    
-    if (sortOrder === 'asc') {
-      return aValue < bValue ? -1 : aValue > bValue ? 1 : 0;
-    } else {
-      return aValue > bValue ? -1 : aValue < bValue ? 1 : 0;
-    }
-  });
-
-  const paginatedResponses = sortedResponses.slice(
-    (currentPage - 1) * itemsPerPage,
-    currentPage * itemsPerPage
+  const totalPages = Math.max(1, Math.ceil(grid.total / itemsPerPage));
+  const facetValues = Object.values(grid.facets);
+  const avgCompletionRate = grid.total > 0 && facetValues.length > 0
+    ? Math.round(facetValues.reduce((acc, facet) => acc + facet.answered / grid.total * 100, 0) / facetValues.length)
+    : 0;
+
+  // Only the rows inside the scrolled viewport (plus a margin) are rendered
+  const firstRow = Math.max(0, Math.floor(scrollTop / GRID_ROW_HEIGHT) - GRID_OVERSCAN_ROWS);
+  const lastRow = Math.min(
+    grid.items.length,
+    Math.ceil((scrollTop + GRID_VIEWPORT_HEIGHT) / GRID_ROW_HEIGHT) + GRID_OVERSCAN_ROWS
   );
-
-  const totalPages = Math.ceil(sortedResponses.length / itemsPerPage);
+  const visibleResponses = grid.items.slice(firstRow, lastRow);
+  const columnCount = survey.questions.length + 2;
 
   const SortIcon = ({ column }) => {
     if (sortBy !== column) return <span className="text-gray-400">⏸</span>;
     return sortOrder === 'asc' ? <span className="text-blue-500">▲</span> : <span className="text-blue-500">▼</span>;
   };
 
+  const topFacetValues = (facet) => Object.entries(facet?.values || {}).slice(0, 3);
+
   return (
     <div className="bg-white rounded-lg shadow-sm p-6">
       {/* Stats Dashboard */}
-      {stats && (
-        <div className="mb-6 grid grid-cols-1 md:grid-cols-4 gap-4">
-          <div className="bg-blue-50 p-4 rounded-lg">
-            <div className="text-2xl font-bold text-blue-600">{stats.total_responses}</div>
-            <div className="text-sm text-gray-600">Total Responses</div>
-          </div>
-          <div className="bg-green-50 p-4 rounded-lg">
-            <div className="text-2xl font-bold text-green-600">
-              {stats.total_responses > 0 ? Math.round(Object.values(stats.question_stats).reduce((acc, q) => acc + q.completion_rate, 0) / Object.keys(stats.question_stats).length) : 0}%
-            </div>
-            <div className="text-sm text-gray-600">Avg Completion Rate</div>
-          </div>
-          <div className="bg-purple-50 p-4 rounded-lg">
-            <div className="text-2xl font-bold text-purple-600">{survey.questions.length}</div>
-            <div className="text-sm text-gray-600">Questions</div>
-          </div>
-          <div className="bg-orange-50 p-4 rounded-lg">
-            <div className="text-2xl font-bold text-orange-600">
-              {stats.total_responses > 0 ? Math.round(stats.total_responses / 7) : 0}
-            </div>
-            <div className="text-sm text-gray-600">Avg per Week</div>
+      <div className="mb-6 grid grid-cols-1 md:grid-cols-4 gap-4">
+        <div className="bg-blue-50 p-4 rounded-lg">
+          <div className="text-2xl font-bold text-blue-600">{grid.total}</div>
+          <div className="text-sm text-gray-600">{query ? 'Matching Responses' : 'Total Responses'}</div>
+        </div>
+        <div className="bg-green-50 p-4 rounded-lg">
+          <div className="text-2xl font-bold text-green-600">{avgCompletionRate}%</div>
+          <div className="text-sm text-gray-600">Avg Completion Rate</div>
+        </div>
+        <div className="bg-purple-50 p-4 rounded-lg">
+          <div className="text-2xl font-bold text-purple-600">{survey.questions.length}</div>
+          <div className="text-sm text-gray-600">Questions</div>
+        </div>
+        <div className="bg-orange-50 p-4 rounded-lg">
+          <div className="text-2xl font-bold text-orange-600">
+            {grid.total > 0 ? Math.round(grid.total / 7) : 0}
           </div>
+          <div className="text-sm text-gray-600">Avg per Week</div>
         </div>
-      )}
+      </div>
 
       {/* Controls */}
       <div className="mb-6 flex flex-wrap gap-4 items-center justify-between">
@@ -631,25 +659,36 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
           />
           <select
             value={itemsPerPage}
-            onChange={(e) => setItemsPerPage(parseInt(e.target.value))}
+            onChange={(e) => {
+              setItemsPerPage(parseInt(e.target.value));
+              setCurrentPage(1);
+            }}
             className="px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
           >
-            <option value={10}>10 per page</option>
-            <option value={25}>25 per page</option>
             <option value={50}>50 per page</option>
             <option value={100}>100 per page</option>
+            <option value={250}>250 per page</option>
+            <option value={500}>500 per page</option>
           </select>
+          {loading && <span className="text-sm text-gray-500">Loading...</span>}
         </div>
         <div className="flex items-center space-x-2">
-          <button
-            onClick={exportToCSV}
+          <a
+            href={`${API}/surveys/${survey.id}/responses/export?format=csv`}
             className="px-4 py-2 bg-green-500 text-white rounded-md hover:bg-green-600 flex items-center space-x-2"
           >
             <span>📊</span>
             <span>Export CSV</span>
-          </button>
+          </a>
+          <a
+            href={`${API}/surveys/${survey.id}/responses/export?format=parquet`}
+            className="px-4 py-2 bg-green-700 text-white rounded-md hover:bg-green-800 flex items-center space-x-2"
+          >
+            <span>🗄️</span>
+            <span>Export Parquet</span>
+          </a>
           <button
-            onClick={onRefresh}
+            onClick={loadGrid}
             className="px-4 py-2 bg-blue-500 text-white rounded-md hover:bg-blue-600 flex items-center space-x-2"
           >
             <span>🔄</span>
@@ -659,14 +698,19 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
       </div>
 
       {/* Grid Table */}
-      <div className="overflow-x-auto">
+      <div
+        ref={viewportRef}
+        className="overflow-auto"
+        style={{ maxHeight: GRID_VIEWPORT_HEIGHT }}
+        onScroll={(e) => setScrollTop(e.currentTarget.scrollTop)}
+      >
         <table className="w-full border-collapse">
-          <thead>
+          <thead className="sticky top-0 z-10">
             <tr className="bg-gray-50">
               <th className="border border-gray-200 p-3 text-left">
                 <input
                   type="checkbox"
-                  checked={selectedResponses.length === filteredResponses.length && filteredResponses.length > 0}
+                  checked={selectedResponses.length === grid.items.length && grid.items.length > 0}
                   onChange={handleSelectAll}
                   className="mr-2"
                 />
@@ -682,64 +726,95 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
                 </div>
               </th>
               {survey.questions.map(question => (
-                <th key={question.id} className="border border-gray-200 p-3 text-left">
-                  <div className="max-w-32 truncate" title={question.title}>
-                    {question.title}
+                <th
+                  key={question.id}
+                  className="border border-gray-200 p-3 text-left cursor-pointer hover:bg-gray-100"
+                  onClick={() => handleSort(question.id)}
+                >
+                  <div className="flex items-center space-x-2">
+                    <div className="max-w-32 truncate" title={question.title}>
+                      {question.title}
+                    </div>
+                    <SortIcon column={question.id} />
                   </div>
                   <div className="text-xs text-gray-500 mt-1">
-                    {question.type}
+                    {question.type} · {grid.facets[question.id]?.answered ?? 0} answered
                   </div>
+                  {topFacetValues(grid.facets[question.id]).length > 0 && (
+                    <div className="text-xs text-gray-400 mt-1 max-w-32 truncate">
+                      {topFacetValues(grid.facets[question.id]).map(([value, count]) => `${value} (${count})`).join(', ')}
+                    </div>
+                  )}
                 </th>
               ))}
             </tr>
           </thead>
           <tbody>
-            {paginatedResponses.map((response, index) => (
-              <tr key={response.id} className={index % 2 === 0 ? 'bg-white' : 'bg-gray-50'}>
-                <td className="border border-gray-200 p-3">
-                  <input
-                    type="checkbox"
-                    checked={selectedResponses.includes(response.id)}
-                    onChange={() => handleSelectResponse(response.id)}
-                    className="mr-2"
-                  />
-                  <span className="text-xs text-gray-500">#{index + 1}</span>
-                </td>
-                <td className="border border-gray-200 p-3">
-                  <div className="text-sm">
-                    {new Date(response.submitted_at).toLocaleDateString()}
-                  </div>
-                  <div className="text-xs text-gray-500">
-                    {new Date(response.submitted_at).toLocaleTimeString()}
-                  </div>
-                </td>
-                {survey.questions.map(question => {
-                  const answer = response.responses[question.id];
-                  return (
-                    <td key={question.id} className="border border-gray-200 p-3">
-                      <div className="max-w-48 truncate" title={Array.isArray(answer) ? answer.join(', ') : (answer || 'No response')}>
-                        {Array.isArray(answer) ? (
-                          <div className="flex flex-wrap gap-1">
-                            {answer.map((item, i) => (
-                              <span key={i} className="inline-block bg-blue-100 text-blue-800 text-xs px-2 py-1 rounded">
-                                {item}
-                              </span>
-                            ))}
-                          </div>
-                        ) : question.type === 'rating' ? (
-                          <div className="flex items-center">
-                            <span className="text-lg">⭐</span>
-                            <span className="ml-1">{answer || 'No rating'}</span>
-                          </div>
-                        ) : (
-                          <span className="text-sm">{answer || 'No response'}</span>
-                        )}
-                      </div>
-                    </td>
-                  );
-                })}
+            {firstRow > 0 && (
+              <tr style={{ height: firstRow * GRID_ROW_HEIGHT }}>
+                <td colSpan={columnCount} />
+              </tr>
+            )}
+            {visibleResponses.map((response, offset) => {
+              const index = firstRow + offset;
+              return (
+                <tr
+                  key={response.id}
+                  style={{ height: GRID_ROW_HEIGHT }}
+                  className={index % 2 === 0 ? 'bg-white' : 'bg-gray-50'}
+                >
+                  <td className="border border-gray-200 px-3 py-1">
+                    <input
+                      type="checkbox"
+                      checked={selectedResponses.includes(response.id)}
+                      onChange={() => handleSelectResponse(response.id)}
+                      className="mr-2"
+                    />
+                    <span className="text-xs text-gray-500">#{(currentPage - 1) * itemsPerPage + index + 1}</span>
+                  </td>
+                  <td className="border border-gray-200 px-3 py-1 whitespace-nowrap">
+                    <div className="text-sm">
+                      {new Date(response.submitted_at).toLocaleDateString()}
+                    </div>
+                    <div className="text-xs text-gray-500">
+                      {new Date(response.submitted_at).toLocaleTimeString()}
+                    </div>
+                  </td>
+                  {survey.questions.map(question => {
+                    const answer = response.responses[question.id];
+                    return (
+                      <td key={question.id} className="border border-gray-200 px-3 py-1">
+                        <div className="max-w-48 truncate whitespace-nowrap" title={Array.isArray(answer) ? answer.join(', ') : isLongAnswer(answer) ? `${answer.preview}…` : (answer || 'No response')}>
+                          {Array.isArray(answer) ? (
+                            <div className="flex gap-1 overflow-hidden">
+                              {answer.map((item, i) => (
+                                <span key={i} className="inline-block bg-blue-100 text-blue-800 text-xs px-2 py-1 rounded">
+                                  {item}
+                                </span>
+                              ))}
+                            </div>
+                          ) : question.type === 'rating' ? (
+                            <div className="flex items-center">
+                              <span className="text-lg">⭐</span>
+                              <span className="ml-1">{answer || 'No rating'}</span>
+                            </div>
+                          ) : isLongAnswer(answer) ? (
+                            <span className="text-sm">{answer.preview}…</span>
+                          ) : (
+                            <span className="text-sm">{answer || 'No response'}</span>
+                          )}
+                        </div>
+                      </td>
+                    );
+                  })}
+                </tr>
+              );
+            })}
+            {lastRow < grid.items.length && (
+              <tr style={{ height: (grid.items.length - lastRow) * GRID_ROW_HEIGHT }}>
+                <td colSpan={columnCount} />
               </tr>
-            ))}
+            )}
           </tbody>
         </table>
       </div>
@@ -748,7 +823,7 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
       {totalPages > 1 && (
         <div className="mt-4 flex items-center justify-between">
           <div className="text-sm text-gray-600">
-            Showing {((currentPage - 1) * itemsPerPage) + 1} to {Math.min(currentPage * itemsPerPage, sortedResponses.length)} of {sortedResponses.length} responses
+            Showing {((currentPage - 1) * itemsPerPage) + 1} to {Math.min(currentPage * itemsPerPage, grid.total)} of {grid.total} responses
           </div>
           <div className="flex items-center space-x-2">
             <button
@@ -758,19 +833,9 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
             >
               Previous
             </button>
-            {[...Array(totalPages)].map((_, i) => (
-              <button
-                key={i}
-                onClick={() => setCurrentPage(i + 1)}
-                className={`px-3 py-1 border border-gray-300 rounded-md ${
-                  currentPage === i + 1 
-                    ? 'bg-blue-500 text-white border-blue-500' 
-                    : 'hover:bg-gray-50'
-                }`}
-              >
-                {i + 1}
-              </button>
-            ))}
+            <span className="text-sm text-gray-600">
+              Page {currentPage} of {totalPages}
+            </span>
             <button
               onClick={() => setCurrentPage(Math.min(totalPages, currentPage + 1))}
               disabled={currentPage === totalPages}
@@ -792,7 +857,7 @@ const ResponseGridView = ({ survey, responses, onRefresh }) => {
             <div className="flex space-x-2">
               <button
                 onClick={() => {
-                  const selectedData = responses.filter(r => selectedResponses.includes(r.id));
+                  const selectedData = grid.items.filter(r => selectedResponses.includes(r.id));
                   console.log('Selected responses:', selectedData);
                 }}
                 className="px-3 py-1 bg-blue-500 text-white rounded text-sm hover:bg-blue-600"
@@ -827,6 +892,13 @@ function App() {
     initializeApp();
   }, []);
 
+  // The grid pages through the server; only the list view loads every response
+  useEffect(() => {
+    if (currentView === 'responses' && responseViewMode === 'list' && selectedSurvey) {
+      loadSurveyResponses(selectedSurvey.id);
+    }
+  }, [currentView, responseViewMode, selectedSurvey?.id]);
+
   const initializeApp = async () => {
     try {
       // Initialize templates
@@ -897,11 +969,13 @@ function App() {
     }
   };
 
-  const handleSubmitResponse = async (responses) => {
+  const handleSubmitResponse = async (responses, idempotencyKey) => {
     try {
       await axios.post(`${API}/responses`, {
         survey_id: selectedSurvey.id,
         responses
+      }, {
+        headers: { 'Idempotency-Key': idempotencyKey }
       });
     } catch (error) {
       console.error('Error submitting response:', error);
@@ -969,7 +1043,6 @@ function App() {
               </button>
               <button
                 onClick={() => {
-                  loadSurveyResponses(survey.id);
                   setSelectedSurvey(survey);
                   setCurrentView('responses');
                 }}
@@ -1065,8 +1138,6 @@ function App() {
       {responseViewMode === 'grid' ? (
         <ResponseGridView 
           survey={selectedSurvey} 
-          responses={surveyResponses} 
-          onRefresh={() => loadSurveyResponses(selectedSurvey.id)}
         />
       ) : (
         // Original list view for comparison
@@ -1092,7 +1163,14 @@ function App() {
                         <p className="text-gray-700 mt-1">
                           {Array.isArray(response.responses[question.id]) 
                             ? response.responses[question.id].join(', ')
-                            : response.responses[question.id] || 'No response'
+                            : isLongAnswer(response.responses[question.id])
+                              ? <LongAnswer
+                                  surveyId={selectedSurvey.id}
+                                  responseId={response.id}
+                                  questionId={question.id}
+                                  answer={response.responses[question.id]}
+                                />
+                              : response.responses[question.id] || 'No response'
                           }
                         </p>
                       </div>
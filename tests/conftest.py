@@ -0,0 +1,113 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Backend modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+DEFAULT_BENCHMARK_SIZES = "1000,10000,100000,1000000"
+DEFAULT_BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_baselines.json"
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks", "microbenchmarks (tests/test_benchmarks.py)")
+    group.addoption("--benchmark", action="store_true", help="Run the microbenchmarks; they are skipped otherwise.")
+    group.addoption(
+        "--benchmark-sizes", default=DEFAULT_BENCHMARK_SIZES, help="Comma-separated numbers of synthetic responses."
+    )
+    group.addoption("--benchmark-rounds", type=int, default=3, help="Timed rounds per benchmark; the fastest counts.")
+    group.addoption(
+        "--benchmark-min-time",
+        type=float,
+        default=0.2,
+        help="Seconds each round runs for at least; fast benchmarks repeat until then.",
+    )
+    group.addoption(
+        "--benchmark-baseline", default=str(DEFAULT_BASELINE_PATH), help="JSON file holding baseline timings."
+    )
+    group.addoption("--benchmark-save", action="store_true", help="Write this run's timings as the new baseline.")
+    group.addoption(
+        "--benchmark-max-regression",
+        type=float,
+        default=20.0,
+        help="Fail when a benchmark is this many percent slower than its baseline.",
+    )
+    group.addoption(
+        "--benchmark-noise-floor",
+        type=float,
+        default=0.00001,
+        help="Seconds per iteration a benchmark may slow down by regardless of the percentage.",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "size" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("--benchmark-sizes").split(",") if size.strip()]
+        metafunc.parametrize("size", sizes, ids=[f"{size:,}".replace(",", "_") for size in sizes])
+
+
+class Benchmark:
+    """Times callables and compares them with stored baselines (seconds per iteration, by benchmark id).
+
+    Each round repeats the callable until it has run for at least ``min_time``,
+    so short benchmarks are not judged on a single timer-resolution-sized sample.
+    """
+
+    def __init__(self, config):
+        self.rounds = config.getoption("--benchmark-rounds")
+        self.min_time = config.getoption("--benchmark-min-time")
+        self.max_regression = config.getoption("--benchmark-max-regression")
+        self.noise_floor = config.getoption("--benchmark-noise-floor")
+        self.save = config.getoption("--benchmark-save")
+        self.path = Path(config.getoption("--benchmark-baseline"))
+        self.baseline = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.results = {}
+
+    def iterations(self, func, *args) -> int:
+        """Double the number of calls until they take at least ``min_time`` (this also warms up)."""
+        number = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(number):
+                func(*args)
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.min_time:
+                return number
+            # Jump close to the target once a timing is meaningful, instead of doubling all the way
+            number = number * 2 if elapsed < self.min_time / 100 else int(number * self.min_time / elapsed) + 1
+
+    def __call__(self, name: str, func, *args):
+        number = self.iterations(func, *args)
+        best = float("inf")
+        for _ in range(self.rounds):
+            started = time.perf_counter()
+            for _ in range(number):
+                func(*args)
+            best = min(best, (time.perf_counter() - started) / number)
+        self.results[name] = best
+
+        baseline = self.baseline.get(name)
+        if not self.save and baseline is not None:
+            change = (best - baseline) / baseline * 100
+            if change > self.max_regression and best - baseline > self.noise_floor:
+                pytest.fail(
+                    f"{name} took {best:.6f}s per iteration, {change:.0f}% slower than the {baseline:.6f}s "
+                    f"baseline (allowed: {self.max_regression:.0f}% or {self.noise_floor:.6f}s)"
+                )
+        return best
+
+    def write(self) -> None:
+        self.path.write_text(json.dumps({**self.baseline, **self.results}, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture(scope="session")
+def benchmark(request):
+    if not request.config.getoption("--benchmark"):
+        pytest.skip("microbenchmarks only run with --benchmark")
+    bench = Benchmark(request.config)
+    yield bench
+    if bench.save and bench.results:
+        bench.write()
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, WorkloadScheduler, build_admission_controller
+
+
+def test_queued_submissions_are_admitted_before_queued_analytics():
+    async def main():
+        scheduler = WorkloadScheduler(2, limits={"ingest": 2, "analytics": 2}, priorities={"ingest": 0, "analytics": 1})
+        await scheduler.acquire("analytics")
+        await scheduler.acquire("analytics")
+
+        order = []
+
+        async def run(workload):
+            await scheduler.acquire(workload)
+            order.append(workload)
+
+        waiting = [asyncio.create_task(run("analytics")), asyncio.create_task(run("ingest"))]
+        await asyncio.sleep(0)
+        assert scheduler.queued == {"ingest": 1, "analytics": 1}
+
+        scheduler.release("analytics")
+        await asyncio.sleep(0)
+        assert order == ["ingest"]
+        scheduler.release("analytics")
+        await asyncio.gather(*waiting)
+        assert order == ["ingest", "analytics"]
+
+    asyncio.run(main())
+
+
+def test_analytics_cannot_take_slots_beyond_its_limit():
+    async def main():
+        scheduler = WorkloadScheduler(4, limits={"ingest": 4, "analytics": 1}, priorities={"ingest": 0, "analytics": 1})
+        assert await scheduler.acquire("analytics") is False
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.acquire("analytics", timeout=0.01)
+        # The other slots stay free for submissions
+        for _ in range(3):
+            assert await scheduler.acquire("ingest", timeout=0.01) is False
+        assert scheduler.queued == {"ingest": 0, "analytics": 0}
+
+    asyncio.run(main())
+
+
+def test_controller_rejects_when_no_slot_frees_up_in_time():
+    async def main():
+        admission = AdmissionController(
+            max_inflight_writes=1, queue_timeout=0.01, analytics_queue_timeout=0.01, max_concurrency=1
+        )
+        async with admission.write_slot():
+            with pytest.raises(AdmissionRejected):
+                async with admission.analytics_slot():
+                    pass
+            with pytest.raises(AdmissionRejected):
+                async with admission.write_slot():
+                    pass
+        async with admission.analytics_slot():
+            assert admission.scheduler.inflight == {"ingest": 0, "analytics": 1}
+
+    asyncio.run(main())
+
+
+def test_client_limiter_is_off_without_a_trusted_client_address():
+    assert build_admission_controller(client_address_trusted=False).client_limiter is None
+    assert build_admission_controller(client_address_trusted=True).client_limiter is not None
@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from archive import archive_survey, iter_archived_responses, load_archived_stats, read_summaries, write_part
+from stats import StatsAccumulator
+
+SURVEY = {
+    "id": "survey",
+    "questions": [
+        {"id": "colour", "type": "multiple_choice", "title": "Colour"},
+        {"id": "score", "type": "rating", "title": "Score"},
+    ],
+}
+
+
+def make_responses(count, start=datetime(2024, 1, 30)):
+    return [
+        {
+            "_id": n,
+            "id": f"response-{n}",
+            "survey_id": SURVEY["id"],
+            "responses": {"colour": ["red", "blue"][n % 2], "score": n % 5 + 1},
+            "submitted_at": start + timedelta(hours=12 * n),
+        }
+        for n in range(count)
+    ]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeResponses:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def find(self, query):
+        cutoff = query["submitted_at"]["$lt"]
+        return FakeCursor([d for d in self.docs if d["survey_id"] == query["survey_id"] and d["submitted_at"] < cutoff])
+
+    async def delete_many(self, query):
+        ids = set(query["_id"]["$in"])
+        self.docs = [doc for doc in self.docs if doc["_id"] not in ids]
+        return SimpleNamespace(deleted_count=len(ids))
+
+
+def test_archived_stats_come_from_summaries_and_match_the_responses(tmp_path):
+    responses = make_responses(6)
+    write_part(SURVEY, "2024-01", responses[:4], tmp_path)
+    write_part(SURVEY, "2024-02", responses[4:], tmp_path)
+
+    expected = StatsAccumulator(SURVEY["questions"]).add_all(responses).question_stats()
+    archived = load_archived_stats(SURVEY, tmp_path)
+    assert archived.total_responses == 6
+    assert archived.question_stats() == expected
+    assert [summary["count"] for summary in read_summaries(SURVEY["id"], tmp_path)] == [4, 2]
+
+
+def test_archived_responses_round_trip_oldest_partition_first(tmp_path):
+    responses = make_responses(5)
+    write_part(SURVEY, "2024-02", responses[3:], tmp_path)
+    write_part(SURVEY, "2024-01", responses[:3], tmp_path)
+
+    read = list(iter_archived_responses(SURVEY["id"], tmp_path))
+    assert [r["id"] for r in read] == [r["id"] for r in responses]
+    assert [r["responses"] for r in read] == [r["responses"] for r in responses]
+    assert [r["submitted_at"] for r in read] == [r["submitted_at"] for r in responses]
+    assert list(iter_archived_responses("unknown", tmp_path)) == []
+
+
+def test_rewriting_a_batch_replaces_its_part(tmp_path):
+    responses = make_responses(3)
+    first = write_part(SURVEY, "2024-01", responses, tmp_path)
+    assert write_part(SURVEY, "2024-01", responses, tmp_path) == first
+    assert load_archived_stats(SURVEY, tmp_path).total_responses == 3
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_archive_survey_moves_only_old_responses_in_batches(tmp_path):
+    responses = make_responses(10)
+    cutoff = responses[7]["submitted_at"]
+    db = SimpleNamespace(responses=FakeResponses(responses))
+
+    moved = asyncio.run(archive_survey(db, SURVEY, cutoff, batch_size=3, root=tmp_path))
+    assert moved == 7
+    assert [doc["id"] for doc in db.responses.docs] == [r["id"] for r in responses[7:]]
+    # Split by month across the batches, with nothing lost or duplicated
+    assert [r["id"] for r in iter_archived_responses(SURVEY["id"], tmp_path)] == [r["id"] for r in responses[:7]]
+    assert load_archived_stats(SURVEY, tmp_path).total_responses == 7
@@ -0,0 +1,131 @@
+"""Microbenchmarks of pure-Python hot paths, run without a database.
+
+    pytest tests/test_benchmarks.py --benchmark --benchmark-save    # record baselines
+    pytest tests/test_benchmarks.py --benchmark                     # compare against them
+
+Baselines are wall-clock seconds per iteration, so only compare runs on the same machine.
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from models import Survey, SurveyResponse
+from stats import StatsAccumulator, estimate_question_stats
+from validation import compile_validator
+
+OPTIONS = [f"option_{n}" for n in range(6)]
+TEXT_ANSWERS = ["Great service", "Too slow", "Friendly staff", "Would come again", "Nothing to add"]
+
+
+def make_survey() -> Dict[str, Any]:
+    def options():
+        return [{"id": str(uuid.uuid4()), "text": value.title(), "value": value} for value in OPTIONS]
+
+    questions = [
+        {"id": "q_text", "type": "text", "title": "Comments", "required": False},
+        {"id": "q_choice", "type": "multiple_choice", "title": "Pick one", "required": True, "options": options()},
+        {"id": "q_checkbox", "type": "checkbox", "title": "Pick some", "required": False, "options": options()},
+        {"id": "q_rating", "type": "rating", "title": "Rate us", "required": True, "min_rating": 1, "max_rating": 10},
+        {"id": "q_email", "type": "email", "title": "Email", "required": False},
+        {"id": "q_phone", "type": "phone", "title": "Phone", "required": False},
+    ]
+    for question in questions:
+        question.setdefault("description", None)
+        question.setdefault("options", None)
+        question.setdefault("min_rating", None)
+        question.setdefault("max_rating", None)
+    now = datetime(2024, 1, 1)
+    return {
+        "id": str(uuid.uuid4()),
+        "title": "Benchmark survey",
+        "description": "Synthetic",
+        "questions": questions,
+        "is_template": False,
+        "template_category": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+SURVEY = make_survey()
+
+
+def make_responses(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    responses = []
+    for n in range(count):
+        answers: Dict[str, Any] = {
+            "q_choice": rng.choice(OPTIONS),
+            "q_rating": rng.randint(1, 10),
+        }
+        if rng.random() < 0.6:
+            answers["q_text"] = rng.choice(TEXT_ANSWERS)
+        if rng.random() < 0.5:
+            answers["q_checkbox"] = rng.sample(OPTIONS, rng.randint(1, 3))
+        if rng.random() < 0.4:
+            answers["q_email"] = f"user{n}@example.com"
+        if rng.random() < 0.3:
+            answers["q_phone"] = f"+1-555-{rng.randrange(100, 1000)}-{rng.randrange(10000):04d}"
+        responses.append({
+            "id": f"response-{n}",
+            "survey_id": SURVEY["id"],
+            "responses": answers,
+            "submitted_at": start + timedelta(seconds=n),
+        })
+    return responses
+
+
+_responses_cache: Dict[int, List[Dict[str, Any]]] = {}
+
+
+def responses_of_size(size: int) -> List[Dict[str, Any]]:
+    # Generating a million responses takes longer than most benchmarks, so each size is built once
+    if size not in _responses_cache:
+        _responses_cache[size] = make_responses(size)
+    return _responses_cache[size]
+
+
+def test_exact_stats(benchmark, size):
+    responses = responses_of_size(size)
+
+    def run():
+        StatsAccumulator(SURVEY["questions"]).add_all(responses).question_stats()
+
+    benchmark(f"exact_stats[{size}]", run)
+
+
+def test_approximate_stats(benchmark, size):
+    sample = responses_of_size(size)[:10000]
+    benchmark(
+        f"approximate_stats[{size}]",
+        estimate_question_stats, SURVEY["questions"], sample, size * 100
+    )
+
+
+def test_validation(benchmark, size):
+    responses = responses_of_size(size)
+    validate = compile_validator(SURVEY)
+
+    def run():
+        for response in responses:
+            assert not validate(response["responses"])
+
+    benchmark(f"validation[{size}]", run)
+
+
+def test_response_models(benchmark, size):
+    responses = responses_of_size(size)
+
+    def run():
+        for response in responses:
+            SurveyResponse(**response).dict()
+
+    benchmark(f"response_models[{size}]", run)
+
+
+def test_survey_model(benchmark):
+    # Independent of the response count: one survey round trip per iteration
+    benchmark("survey_model", lambda: Survey(**SURVEY).dict())
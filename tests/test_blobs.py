@@ -0,0 +1,173 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from blobs import ANSWER_BLOB_MIN_BYTES, apply_blobs, expand_answers, is_blob_ref, offload_answers
+
+LONG = "The onboarding took far too long. " * 100
+
+
+def make_response(answers, idempotency_key=None):
+    response = {"id": str(uuid.uuid4()), "survey_id": "survey", "responses": answers}
+    if idempotency_key is not None:
+        response["idempotency_key"] = idempotency_key
+    return response
+
+
+class FakeResponses:
+    """Unique indexes on ``id`` and on (survey_id, idempotency_key)."""
+
+    def __init__(self):
+        self.docs = []
+
+    def _conflicts(self, doc):
+        return any(
+            stored["id"] == doc["id"]
+            or ("idempotency_key" in doc and stored.get("idempotency_key") == doc["idempotency_key"])
+            for stored in self.docs
+        )
+
+    async def insert_one(self, doc):
+        if self._conflicts(doc):
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.docs.append(doc)
+
+    async def insert_many(self, docs, ordered=True):
+        errors = []
+        for index, doc in enumerate(docs):
+            if self._conflicts(doc):
+                errors.append({"index": index, "code": 11000})
+            else:
+                self.docs.append(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def find(self, query, projection=None):
+        for doc in self.docs:
+            if doc["id"] in query["id"]["$in"]:
+                yield doc
+
+
+class FakeBlobs:
+    def __init__(self):
+        self.docs = {}
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.docs[request._filter["_id"]] = request._doc
+
+    async def delete_many(self, query):
+        doomed = [key for key, blob in self.docs.items() if blob["response_id"] in query["response_id"]["$in"]]
+        for key in doomed:
+            del self.docs[key]
+        return type("DeleteResult", (), {"deleted_count": len(doomed)})()
+
+
+class FakeDb:
+    def __init__(self):
+        self.responses = FakeResponses()
+        self.answer_blobs = FakeBlobs()
+
+
+LONG_ENOUGH = "x" * (ANSWER_BLOB_MIN_BYTES + 1)
+
+
+def test_only_long_string_answers_are_offloaded():
+    response = make_response({"comment": LONG, "name": "Ann", "tags": ["a", "b"], "score": 4})
+    stored, blobs = offload_answers(response, min_bytes=1024, preview_chars=20)
+
+    reference = stored["responses"]["comment"]
+    assert is_blob_ref(reference)
+    assert reference == {"blob_id": f"{response['id']}:comment", "preview": LONG[:20], "length": len(LONG)}
+    assert {key: stored["responses"][key] for key in ("name", "tags", "score")} == {
+        "name": "Ann", "tags": ["a", "b"], "score": 4
+    }
+    assert [(blob["_id"], blob["survey_id"], blob["text"]) for blob in blobs] == [(reference["blob_id"], "survey", LONG)]
+    # The caller's document keeps its full answers
+    assert response["responses"]["comment"] == LONG
+
+
+def test_short_answers_and_disabled_offloading_leave_the_response_alone():
+    response = make_response({"comment": "Fine", "multibyte": "é" * 500})
+    assert offload_answers(response, min_bytes=1024) == (response, [])
+    assert offload_answers(make_response({"comment": LONG}), min_bytes=0)[1] == []
+    # Size is measured in bytes, not characters
+    assert len(offload_answers(make_response({"comment": "é" * 600}), min_bytes=1000)[1]) == 1
+
+
+def test_apply_blobs_restores_full_text():
+    stored, blobs = offload_answers(make_response({"comment": LONG}), min_bytes=1024)
+    apply_blobs([stored], {blob["_id"]: blob["text"] for blob in blobs})
+    assert stored["responses"]["comment"] == LONG
+
+
+def test_mongo_store_offloads_and_exports_expand():
+    mongo_url = os.environ.get("TEST_MONGO_URL")
+    if not mongo_url:
+        pytest.skip("TEST_MONGO_URL is not set")
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from purge import purge_survey_data
+    from storage import MongoStore
+
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[f"test_blobs_{uuid.uuid4().hex[:8]}"]
+        try:
+            store = MongoStore(db)
+            await store.ensure_indexes()
+            response = make_response({"comment": LONG, "name": "Ann"})
+            await store.insert_response(response)
+
+            stored = await db.responses.find_one({"id": response["id"]}, {"_id": 0})
+            assert is_blob_ref(stored["responses"]["comment"])
+            assert (await expand_answers(db, [stored]))[0]["responses"] == {"comment": LONG, "name": "Ann"}
+
+            await purge_survey_data(db, ["survey"])
+            assert await db.answer_blobs.count_documents({}) == 0
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    asyncio.run(main())
+
+
+def test_duplicate_submission_leaves_no_blobs_behind():
+    from storage import DuplicateResponse, MongoStore
+
+    async def main():
+        db = FakeDb()
+        store = MongoStore(db)
+        await store.insert_response(make_response({"comment": LONG_ENOUGH}, idempotency_key="retry-me"))
+        assert len(db.answer_blobs.docs) == 1
+
+        # The client retries; the server assigns the retry a new response id
+        with pytest.raises(DuplicateResponse):
+            await store.insert_response(make_response({"comment": LONG_ENOUGH}, idempotency_key="retry-me"))
+        assert len(db.answer_blobs.docs) == 1
+        assert db.answer_blobs.docs.popitem()[1]["response_id"] == db.responses.docs[0]["id"]
+
+    asyncio.run(main())
+
+
+def test_spool_duplicates_leave_no_blobs_behind(tmp_path):
+    from spool import ResponseSpool
+
+    async def main():
+        db = FakeDb()
+        spool = ResponseSpool(db, directory=tmp_path)
+        original = make_response({"comment": LONG_ENOUGH}, idempotency_key="once")
+        inserted, _ = await spool._insert([original])
+        assert inserted == [original]
+
+        # A replay of the same response, and a second submission with the same idempotency key
+        retry = make_response({"comment": LONG_ENOUGH}, idempotency_key="once")
+        inserted, rejected = await spool._insert([original, retry])
+        assert (inserted, rejected) == ([], [])
+        # The replay's blob is the original's, so it stays
+        assert [blob["response_id"] for blob in db.answer_blobs.docs.values()] == [original["id"]]
+
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+import asyncio
+import random
+
+import pytest
+import typer
+
+from cli import insert_responses
+
+
+class FlakyResponses:
+    def __init__(self, fail_on_call):
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+        self.docs = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(0)
+        if call == self.fail_on_call:
+            raise ConnectionError("connection reset")
+        self.docs.extend(docs)
+
+
+class FakeDb:
+    def __init__(self, fail_on_call=None):
+        self.responses = FlakyResponses(fail_on_call)
+
+
+def factory(rng: random.Random):
+    return {"id": str(rng.random()), "survey_id": "survey", "responses": {}}
+
+
+def test_insert_responses_inserts_every_batch():
+    db = FakeDb()
+    asyncio.run(insert_responses(db, [factory], 25, 10, 2, 1, report_every=60))
+    assert len(db.responses.docs) == 25
+    assert db.responses.calls == 3
+
+
+def test_insert_responses_fails_when_a_batch_fails():
+    db = FakeDb(fail_on_call=1)
+    with pytest.raises(typer.Exit) as exit_info:
+        asyncio.run(insert_responses(db, [factory], 100, 10, 2, 1, report_every=60))
+    assert exit_info.value.exit_code == 1
+    # No new batches are started once one has failed
+    assert db.responses.calls < 10
@@ -0,0 +1,106 @@
+import asyncio
+import gzip
+import json
+
+import brotli
+import zstandard
+
+from compression import CompressionMiddleware, PayloadCache, negotiate
+
+BODY = json.dumps([{"id": str(n), "title": "Customer Satisfaction Survey"} for n in range(200)]).encode()
+
+
+def run_app(app, accept_encoding="gzip, deflate, br, zstd"):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, min_size=1024)(scope, receive, send))
+    headers = dict(messages[0]["headers"])
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return headers, body, messages
+
+
+def json_app(body, content_type=b"application/json"):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def test_negotiate_prefers_server_order_and_honours_q_values():
+    assert negotiate("gzip, br, zstd") == "zstd"
+    assert negotiate("gzip, br;q=0.5") == "br"
+    assert negotiate("zstd;q=0, gzip") == "gzip"
+    assert negotiate("*") == "zstd"
+    assert negotiate("identity") is None
+    assert negotiate(None) is None
+
+
+def test_json_is_compressed_with_the_negotiated_encoding():
+    headers, body, _ = run_app(json_app(BODY))
+    assert headers[b"content-encoding"] == b"zstd"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(body)
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(body) == BODY
+
+    headers, body, _ = run_app(json_app(BODY), "gzip")
+    assert headers[b"content-encoding"] == b"gzip"
+    assert gzip.decompress(body) == BODY
+
+
+def test_small_binary_and_event_stream_bodies_are_not_compressed():
+    for app in (json_app(b'{"ok":true}'), json_app(BODY, b"application/vnd.apache.parquet"), json_app(BODY, b"text/event-stream")):
+        headers, body, _ = run_app(app)
+        assert b"content-encoding" not in headers
+        assert body in (b'{"ok":true}', BODY)
+
+
+def test_streaming_bodies_are_compressed_and_flushed_per_chunk():
+    rows = [f"{n},answer {n}\n".encode() for n in range(1000)]
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/csv")]})
+        for start in range(0, len(rows), 100):
+            await send({"type": "http.response.body", "body": b"".join(rows[start:start + 100]), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    headers, body, messages = run_app(app, "br")
+    assert headers[b"content-encoding"] == b"br"
+    assert b"content-length" not in headers
+    decompressor = brotli.Decompressor()
+    # Each flushed chunk decodes on its own, so the client sees rows as they are exported
+    assert decompressor.process(messages[1]["body"]) == b"".join(rows[:100])
+    assert brotli.decompress(body) == b"".join(rows)
+
+
+def test_payload_cache_reencodes_only_for_a_new_version():
+    builds = []
+
+    def build(title):
+        def content():
+            builds.append(title)
+            return [{"title": title, "question": "How likely are you to recommend us?"}] * 50
+        return content
+
+    async def main():
+        cache = PayloadCache()
+        first = await cache.get("templates", 1, build("first"))
+        assert await cache.get("templates", 1, build("ignored")) is first
+        body, encoding = first.select("gzip, br")
+        assert encoding == "br"
+        assert json.loads(brotli.decompress(body))[0]["title"] == "first"
+
+        second = await cache.get("templates", 2, build("second"))
+        assert second.select(None) == (second.body, None)
+        assert json.loads(second.body)[0]["title"] == "second"
+
+    asyncio.run(main())
+    assert builds == ["first", "second"]
@@ -0,0 +1,113 @@
+import asyncio
+import csv
+import io
+import uuid
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from export import export_columns, stream_csv, stream_parquet, typed_answer
+
+QUESTIONS = [
+    {"id": "q_name", "type": "text", "title": "Name"},
+    {"id": "q_score", "type": "rating", "title": "Score"},
+    {"id": "q_tags", "type": "checkbox", "title": "Tags"},
+    {"id": "q_again", "type": "text", "title": "Name"},
+]
+
+
+def make_survey():
+    # A fresh id, so nothing is read from the archive directory
+    return {"id": f"export-{uuid.uuid4().hex}", "questions": QUESTIONS}
+
+
+def make_responses(survey, count):
+    return [
+        {
+            "id": f"response-{n}",
+            "survey_id": survey["id"],
+            "submitted_at": datetime(2024, 1, 1) + timedelta(minutes=n),
+            "responses": {"q_name": f"Person {n}", "q_score": n % 5 + 1, "q_tags": ["a", "b"][: n % 3]},
+        }
+        for n in range(count)
+    ]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length):
+        batch, self.docs = self.docs[:length], self.docs[length:]
+        return batch
+
+
+class FakeResponses:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor(doc for doc in self.docs if doc["survey_id"] == query["survey_id"])
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.responses = FakeResponses(docs)
+
+
+def collect(stream):
+    async def main():
+        return b"".join([chunk async for chunk in stream])
+
+    return asyncio.run(main())
+
+
+def test_answers_are_coerced_to_their_column_type():
+    assert typed_answer("rating", 4) == 4
+    assert typed_answer("rating", "4") is None
+    assert typed_answer("rating", True) is None
+    assert typed_answer("checkbox", ["a", 1]) == ["a", "1"]
+    assert typed_answer("checkbox", "a") is None
+    assert typed_answer("text", {"x": 1}) == '{"x": 1}'
+    assert typed_answer("text", "") is None
+
+
+def test_repeated_titles_get_distinct_column_names():
+    assert [name for name, _ in export_columns(QUESTIONS)] == ["Name", "Score", "Tags", "Name (1)"]
+
+
+def test_parquet_export_is_typed_and_written_in_row_groups():
+    survey = make_survey()
+    responses = make_responses(survey, 25)
+    body = collect(stream_parquet(FakeDb(responses), survey, row_group_size=10))
+
+    parquet = pq.ParquetFile(io.BytesIO(body))
+    schema = parquet.schema_arrow
+    assert schema.names == ["id", "submitted_at", "Name", "Score", "Tags", "Name (1)"]
+    assert schema.field("submitted_at").type == pa.timestamp("us")
+    assert schema.field("Score").type == pa.int64()
+    assert schema.field("Tags").type == pa.list_(pa.string())
+    assert schema.field("Name (1)").metadata[b"question_id"] == b"q_again"
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)] == [10, 10, 5]
+
+    table = parquet.read()
+    assert table.column("id").to_pylist() == [r["id"] for r in responses]
+    assert table.column("Score").to_pylist() == [r["responses"]["q_score"] for r in responses]
+    assert table.column("Tags").to_pylist()[:3] == [None, ["a"], ["a", "b"]]
+    assert table.column("Name (1)").null_count == 25
+
+
+def test_csv_export_flattens_lists_and_leaves_missing_answers_empty():
+    survey = make_survey()
+    responses = make_responses(survey, 5)
+    rows = list(csv.reader(io.StringIO(collect(stream_csv(FakeDb(responses), survey, batch_size=2)).decode())))
+    assert rows[0] == ["Response ID", "Submitted At", "Name", "Score", "Tags", "Name (1)"]
+    assert len(rows) == 6
+    assert rows[3] == ["response-2", "2024-01-01T00:02:00", "Person 2", "3", "a, b", ""]
@@ -0,0 +1,119 @@
+"""The responses grid pipeline.
+
+Pipeline shape and result shaping always run; the end-to-end paging checks run
+when TEST_MONGO_URL points at a server, against a throwaway database.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from grid import grid_pipeline, grid_result, grid_sort_key
+
+SURVEY = {
+    "id": "survey",
+    "questions": [
+        {"id": "name", "type": "text", "title": "Name"},
+        {"id": "colour", "type": "multiple_choice", "title": "Colour"},
+        {"id": "tags", "type": "checkbox", "title": "Tags"},
+        {"id": "score", "type": "rating", "title": "Score"},
+    ],
+}
+
+
+def make_responses(count):
+    responses = []
+    for n in range(count):
+        answers = {"name": f"Person {n}", "colour": ["red", "blue", "green"][n % 3], "tags": ["a", "b"][: n % 3]}
+        if n % 2:
+            answers["score"] = n % 5 + 1
+        responses.append({
+            "id": f"response-{n:02d}",
+            "survey_id": SURVEY["id"],
+            "responses": answers,
+            "submitted_at": datetime(2024, 1, 1) + timedelta(minutes=n),
+        })
+    return responses
+
+
+def test_sort_key_is_limited_to_known_fields():
+    assert grid_sort_key(SURVEY, "submitted_at") == "submitted_at"
+    assert grid_sort_key(SURVEY, "score") == "responses.score"
+    with pytest.raises(ValueError):
+        grid_sort_key(SURVEY, "responses.$where")
+
+
+def test_pipeline_pages_and_facets_in_one_aggregation():
+    pipeline = grid_pipeline(SURVEY, 20, 10, "submitted_at", -1, "a.b")
+    assert pipeline[0] == {"$match": {"survey_id": "survey"}}
+    # Search text is matched literally
+    assert pipeline[2]["$match"]["$or"][0]["_answers.v"] == {"$regex": r"a\.b", "$options": "i"}
+
+    facets = pipeline[-1]["$facet"]
+    assert facets["items"][:3] == [{"$sort": {"submitted_at": -1, "_id": -1}}, {"$skip": 20}, {"$limit": 10}]
+    assert set(facets) == {"items", "total", "answered", "values_q1", "values_q2", "values_q3"}
+    assert {"$unwind": "$responses.tags"} in facets["values_q2"]
+    assert not any("$unwind" in stage for stage in facets["values_q1"])
+
+
+def test_result_shapes_counts_per_question():
+    doc = {
+        "items": [{"id": "response-01"}],
+        "total": [{"count": 12}],
+        "answered": [{"_id": None, "q0": 12, "q1": 12, "q2": 8, "q3": 6}],
+        "values_q1": [{"_id": "red", "count": 4}, {"_id": "blue", "count": 8}],
+        "values_q2": [{"_id": "a", "count": 8}, {"_id": None, "count": 1}],
+        "values_q3": [{"_id": 5, "count": 2}],
+    }
+    result = grid_result(SURVEY, doc)
+    assert result["total"] == 12
+    assert result["facets"]["name"] == {"answered": 12}
+    assert list(result["facets"]["colour"]["values"].items()) == [("blue", 8), ("red", 4)]
+    assert result["facets"]["tags"] == {"answered": 8, "values": {"a": 8}}
+    assert result["facets"]["score"]["values"] == {"5": 2}
+
+    empty = grid_result(SURVEY, {"items": [], "total": [], "answered": []})
+    assert empty["total"] == 0
+    assert empty["facets"]["colour"] == {"answered": 0, "values": {}}
+
+
+def test_pages_share_totals_and_facets_in_mongo():
+    mongo_url = os.environ.get("TEST_MONGO_URL")
+    if not mongo_url:
+        pytest.skip("TEST_MONGO_URL is not set")
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    responses = make_responses(25)
+
+    async def page(db, number, limit=10, text=""):
+        pipeline = grid_pipeline(SURVEY, (number - 1) * limit, limit, "submitted_at", 1, text)
+        docs = await db.responses.aggregate(pipeline).to_list(1)
+        return grid_result(SURVEY, docs[0])
+
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[f"test_grid_{uuid.uuid4().hex[:8]}"]
+        try:
+            await db.responses.insert_many([dict(response) for response in responses])
+            pages = [await page(db, number) for number in (1, 2, 3)]
+            searched = await page(db, 1, text="PERSON 1")
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+        return pages, searched
+
+    pages, searched = asyncio.run(main())
+    assert [len(p["items"]) for p in pages] == [10, 10, 5]
+    assert [item["id"] for p in pages for item in p["items"]] == [r["id"] for r in responses]
+    for p in pages:
+        assert p["total"] == 25
+        assert p["facets"] == pages[0]["facets"]
+    facets = pages[0]["facets"]
+    assert facets["colour"] == {"answered": 25, "values": {"red": 9, "blue": 8, "green": 8}}
+    assert facets["tags"]["values"] == {"a": 16, "b": 8}
+    assert facets["score"]["answered"] == 12
+    # Person 1 and Person 10-19
+    assert searched["total"] == 11
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime
+
+import live
+from live import LiveStatsBroker, StatsChannel
+from stats import StatsAccumulator
+
+QUESTIONS = [{"id": "colour", "type": "multiple_choice", "title": "Colour"}]
+SURVEY = {"id": "survey", "title": "Survey", "questions": QUESTIONS}
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeResponses:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor([doc for doc in self.docs if doc["survey_id"] == query["survey_id"]])
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.responses = FakeResponses(docs)
+
+
+def test_snapshot_includes_archived_responses(monkeypatch):
+    archived = StatsAccumulator(QUESTIONS)
+    for colour in ["red", "red", "blue"]:
+        archived.add({"colour": colour})
+    monkeypatch.setattr(live, "load_archived_stats", lambda survey: archived)
+
+    live_docs = [
+        {"id": "r1", "survey_id": "survey", "responses": {"colour": "blue"}, "submitted_at": datetime(2024, 1, 1)},
+    ]
+
+    async def main():
+        channel = StatsChannel(LiveStatsBroker(FakeDb(live_docs)), SURVEY)
+        await channel.load_snapshot()
+        return channel.snapshot()
+
+    snapshot = asyncio.run(main())
+    assert snapshot["total_responses"] == 4
+    assert snapshot["question_stats"]["colour"]["option_distribution"] == {"red": 2, "blue": 2}
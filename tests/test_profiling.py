@@ -0,0 +1,55 @@
+import asyncio
+import os
+import time
+
+from profiling import ProfilingMiddleware
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def request(middleware, headers=()):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/api/surveys", "headers": list(headers)}
+    asyncio.run(middleware(scope, receive, send))
+    return dict(messages[0]["headers"])
+
+
+def test_header_needs_the_configured_token(tmp_path):
+    middleware = ProfilingMiddleware(app, token="secret", directory=tmp_path)
+    assert b"x-profile-id" not in request(middleware, [(b"x-profile", b"1")])
+    assert b"x-profile-id" not in request(middleware)
+
+    profile_id = request(middleware, [(b"x-profile", b"secret")])[b"x-profile-id"].decode()
+    assert (tmp_path / f"{profile_id}.collapsed").exists()
+
+
+def test_header_is_ignored_without_a_token(tmp_path):
+    middleware = ProfilingMiddleware(app, token="", directory=tmp_path)
+    assert b"x-profile-id" not in request(middleware, [(b"x-profile", b"1")])
+    assert not tmp_path.exists() or not any(tmp_path.iterdir())
+
+    sampled = ProfilingMiddleware(app, token="", sample_rate=1.0, directory=tmp_path)
+    assert b"x-profile-id" in request(sampled)
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path):
+    tmp_path.joinpath("notes.txt").write_text("not a profile")
+    middleware = ProfilingMiddleware(app, mode="cprofile", sample_rate=1.0, directory=tmp_path, max_files=3)
+    ids = []
+    for n in range(5):
+        ids.append(request(middleware)[b"x-profile-id"].decode())
+        # Distinct modification times, oldest first
+        os.utime(tmp_path / f"{ids[-1]}.prof", (time.time() - 100 + n, time.time() - 100 + n))
+
+    assert sorted(p.stem for p in tmp_path.glob("*.prof")) == sorted(ids[2:])
+    assert tmp_path.joinpath("notes.txt").exists()
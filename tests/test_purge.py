@@ -0,0 +1,46 @@
+import asyncio
+
+from purge import find_orphaned_survey_ids
+
+
+class FakeCollection:
+    def __init__(self, docs, field, on_scan=None):
+        self.docs = docs
+        self.field = field
+        self.on_scan = on_scan
+        self.pipelines = []
+
+    async def aggregate(self, pipeline, allowDiskUse=False):
+        self.pipelines.append(pipeline)
+        for value in sorted({doc[self.field] for doc in self.docs}):
+            yield {"_id": value}
+        if self.on_scan is not None:
+            self.on_scan()
+
+
+class FakeDb:
+    def __init__(self, surveys, responses, on_response_scan=None):
+        self.surveys = FakeCollection(surveys, "id")
+        self.collections = {
+            "responses": FakeCollection(responses, "survey_id", on_response_scan),
+            "survey_sketches": FakeCollection([], "survey_id"),
+            "answer_blobs": FakeCollection([{"survey_id": "deleted"}], "survey_id"),
+        }
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+
+def test_only_data_of_missing_surveys_is_orphaned():
+    db = FakeDb([{"id": "kept"}], [{"survey_id": "kept"}, {"survey_id": "deleted"}])
+    assert asyncio.run(find_orphaned_survey_ids(db)) == ["deleted"]
+    # Survey ids are grouped like the owned collections, not read with distinct()
+    assert db.surveys.pipelines == [[{"$group": {"_id": "$id"}}]]
+
+
+def test_a_survey_created_during_the_scan_is_not_orphaned():
+    surveys = [{"id": "kept"}]
+    db = FakeDb(surveys, [{"survey_id": "kept"}, {"survey_id": "new"}, {"survey_id": "deleted"}])
+    # The new survey's document was written before its first response, i.e. before the scan finished
+    db.collections["responses"].on_scan = lambda: surveys.append({"id": "new"})
+    assert asyncio.run(find_orphaned_survey_ids(db)) == ["deleted"]
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpen, FallbackCache, cursor_deadline, remaining_seconds, with_deadline
+
+
+async def failing():
+    raise asyncio.TimeoutError()
+
+
+async def succeeding():
+    return {"title": "fresh"}
+
+
+def test_breaker_opens_on_failure_rate_and_recovers_after_trial():
+    async def main():
+        breaker = CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, open_seconds=0.05)
+        for operation in (succeeding, failing, succeeding, failing):
+            try:
+                await breaker.call(operation)
+            except asyncio.TimeoutError:
+                pass
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpen):
+            await breaker.call(succeeding)
+
+        await asyncio.sleep(0.06)
+        assert await breaker.call(succeeding) == {"title": "fresh"}
+        assert breaker.state == "closed"
+
+    asyncio.run(main())
+
+
+def test_slow_calls_count_as_failures():
+    async def slow():
+        await asyncio.sleep(0.02)
+
+    async def main():
+        breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, slow_call_seconds=0.01)
+        await breaker.call(slow)
+        await breaker.call(slow)
+        assert breaker.state == "open"
+
+    asyncio.run(main())
+
+
+def test_fallback_serves_last_value_while_failing():
+    async def main():
+        breaker = CircuitBreaker(window=1, min_calls=1, failure_rate=1.0, open_seconds=60)
+        cache = FallbackCache()
+        assert await cache.read(breaker, succeeding, "survey:1") == ({"title": "fresh"}, None)
+
+        value, age = await cache.read(breaker, failing, "survey:1")
+        assert value == {"title": "fresh"} and age >= 0
+        assert breaker.state == "open"
+        # While open the operation is not even attempted
+        value, age = await cache.read(breaker, succeeding, "survey:1")
+        assert value == {"title": "fresh"} and age is not None
+        with pytest.raises(CircuitOpen):
+            await cache.read(breaker, succeeding, "survey:2")
+
+    asyncio.run(main())
+
+
+def test_deadline_bounds_calls_and_sets_max_time_ms():
+    @with_deadline(0.05)
+    async def endpoint(breaker):
+        assert 0 < cursor_deadline()["max_time_ms"] <= 50
+        await breaker.call(lambda: asyncio.sleep(1))
+
+    async def main():
+        breaker = CircuitBreaker()
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await endpoint(breaker)
+        assert time.monotonic() - started < 0.5
+        assert remaining_seconds() is None and cursor_deadline() == {}
+
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime
+
+from sketches import HyperLogLog, QuestionSketch, SketchStore, SpaceSaving
+
+
+class FakeResult:
+    def __init__(self, matched_count=0, upserted_id=None):
+        self.matched_count = matched_count
+        self.upserted_id = upserted_id
+
+
+class FakeSketchCollection:
+    """Just enough of find_one/update_one for SketchStore.write."""
+
+    def __init__(self):
+        self.docs = []
+        self.failures = 0
+        self.before_update = None
+
+    def _find(self, query):
+        for doc in self.docs:
+            if all(doc.get(field) == value for field, value in query.items()):
+                return doc
+        return None
+
+    async def find_one(self, query, projection=None):
+        doc = self._find(query)
+        return None if doc is None else {**doc, "topk": list(doc["topk"])}
+
+    async def update_one(self, query, update, upsert=False):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        if self.before_update is not None:
+            hook, self.before_update = self.before_update, None
+            await hook()
+        doc = self._find(query)
+        if doc is None:
+            if not upsert:
+                return FakeResult()
+            doc = {field: value for field, value in query.items() if field != "version"}
+            doc.update({"hll": {}, "count": 0, "version": 0})
+            self.docs.append(doc)
+            upserted = True
+        else:
+            upserted = False
+        for path, rank in update["$max"].items():
+            index = path.split(".", 1)[1]
+            doc["hll"][index] = max(doc["hll"].get(index, 0), rank)
+        for field, amount in update["$inc"].items():
+            doc[field] = doc.get(field, 0) + amount
+        doc.update(update["$set"])
+        return FakeResult(0 if upserted else 1, "new" if upserted else None)
+
+
+class FakeDb:
+    def __init__(self):
+        self.survey_sketches = FakeSketchCollection()
+
+
+def test_hyperloglog_estimate_is_within_its_error_bound():
+    hll = HyperLogLog()
+    for n in range(100000):
+        hll.add(f"answer {n}")
+    assert abs(hll.estimate() - 100000) <= 3 * hll.relative_error * 100000
+
+    small = HyperLogLog()
+    for n in range(100):
+        small.add(f"answer {n % 50}")
+    assert abs(small.estimate() - 50) <= 2
+
+
+def test_hyperloglog_merge_estimates_the_union():
+    left, right, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for n in range(30000):
+        (left if n % 2 else right).add(str(n))
+        union.add(str(n))
+    for n in range(10000):
+        left.add(str(n))
+    assert left.merge(right).registers == union.registers
+
+
+def test_space_saving_counts_bound_the_true_counts_and_merge_keeps_the_bounds():
+    rng = random.Random(7)
+    values = [f"v{min(int(rng.paretovariate(1.2)), 500)}" for _ in range(20000)]
+    truth = Counter(values)
+
+    first, second = SpaceSaving(capacity=50), SpaceSaving(capacity=50)
+    for i, value in enumerate(values):
+        (first if i % 3 else second).add(value)
+    merged = first.merge(second)
+
+    assert merged.total == len(values)
+    assert len(merged.counters) <= 50
+    for value, (count, error) in merged.counters.items():
+        assert count - error <= truth[value] <= count
+    # The heaviest hitters survive the merge
+    assert {item["value"] for item in merged.top(3)} == {value for value, _ in truth.most_common(3)}
+
+
+def test_space_saving_replaces_the_smallest_counter():
+    summary = SpaceSaving(capacity=2)
+    for value in ["a", "a", "b", "c"]:
+        summary.add(value)
+    assert summary.counters == {"a": [2, 0], "c": [2, 1]}
+
+
+def test_write_merges_into_the_stored_bucket_and_retries_on_version_conflicts():
+    async def main():
+        db = FakeDb()
+        store = SketchStore(db)
+        key = ("survey", "question", "2024-01-01")
+
+        first = QuestionSketch()
+        for value in ["yes", "yes", "no"]:
+            first.add(value)
+        await store.write(key, first)
+
+        # Another process writes between our read and our conditional update
+        concurrent = QuestionSketch()
+        concurrent.add("maybe")
+
+        async def interleave():
+            await SketchStore(db).write(key, concurrent)
+
+        db.survey_sketches.before_update = interleave
+        second = QuestionSketch()
+        second.add("yes")
+        await store.write(key, second)
+
+        loaded = QuestionSketch.from_doc(db.survey_sketches.docs[0])
+        assert loaded.top.total == 5
+        assert {item["value"]: item["count"] for item in loaded.top.top()} == {"yes": 3, "no": 1, "maybe": 1}
+        assert db.survey_sketches.docs[0]["version"] == 3
+
+    asyncio.run(main())
+
+
+def test_failed_flushes_keep_their_updates_for_the_next_flush():
+    survey = {"id": "survey", "questions": [{"id": "question", "type": "text"}]}
+
+    def response(answer):
+        return {"responses": {"question": answer}, "submitted_at": datetime(2024, 1, 1)}
+
+    async def main():
+        db = FakeDb()
+        store = SketchStore(db)
+        store.observe(survey, response("Yes"))
+        db.survey_sketches.failures = 1
+        await store.flush()
+        assert db.survey_sketches.docs == []
+
+        store.observe(survey, response("no"))
+        await store.flush()
+        assert store.buffer == {}
+        doc = db.survey_sketches.docs[0]
+        assert doc["count"] == 2
+        assert {item["v"] for item in doc["topk"]} == {"yes", "no"}
+
+    asyncio.run(main())
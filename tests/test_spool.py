@@ -0,0 +1,190 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError, DocumentTooLarge
+
+import spool
+from metrics import metrics
+from spool import ResponseSpool, segment_numbers, segment_path
+
+
+class FakeResponses:
+    """insert_many with a unique index on ``id``, as the drainer sees it."""
+
+    def __init__(self, available=True):
+        self.available = available
+        self.docs = {}
+        # Failures by response id: MongoDB rejects these for good
+        self.invalid = set()
+        self.too_large = set()
+        # Number of upcoming calls failing with a transient per-document error
+        self.stepdowns = 0
+
+    async def insert_many(self, docs, ordered=True):
+        if not self.available:
+            raise ConnectionError("database unavailable")
+        if any(doc["id"] in self.too_large for doc in docs):
+            raise DocumentTooLarge("BSON document too large")
+        if self.stepdowns:
+            self.stepdowns -= 1
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 189, "errmsg": "primary stepped down"}]})
+        errors = []
+        for index, doc in enumerate(docs):
+            if doc["id"] in self.docs:
+                errors.append({"index": index, "code": 11000})
+            elif doc["id"] in self.invalid:
+                errors.append({"index": index, "code": 121, "errmsg": "Document failed validation"})
+            else:
+                self.docs[doc["id"]] = doc
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+class FakeDb:
+    def __init__(self, available=True):
+        self.responses = FakeResponses(available)
+
+
+def make_response(n):
+    return {
+        "id": f"response-{n}-{uuid.uuid4().hex[:6]}",
+        "survey_id": "survey",
+        "responses": {"name": f"Respondent {n}"},
+        "submitted_at": datetime(2024, 1, 1, 12, 0, n),
+    }
+
+
+async def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def make_spool(db, directory, stored=None, **options):
+    async def on_stored(responses):
+        stored.extend(response["id"] for response in responses)
+
+    options.setdefault("commit_interval", 0.001)
+    return ResponseSpool(db, on_stored=on_stored if stored is not None else None, directory=directory, **options)
+
+
+def test_restart_after_a_torn_write_drains_only_acknowledged_responses(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "RESPONSE_SPOOL_DRAIN_IDLE_SECONDS", 0.01)
+    responses = [make_response(n) for n in range(3)]
+
+    async def main():
+        # MongoDB is down, so everything stays spooled
+        offline = make_spool(FakeDb(available=False), tmp_path)
+        await offline.start(accept=True)
+        await asyncio.gather(*(offline.append(response) for response in responses))
+        assert offline.depth == 3
+        assert offline.lag_seconds() >= 0
+        await offline.stop()
+
+        # A crash in the middle of the next append
+        last = segment_path(tmp_path, segment_numbers(tmp_path)[-1])
+        with open(last, "ab") as f:
+            f.write(b'{"t": 1, "doc": {"id": "torn')
+
+        db, stored = FakeDb(), []
+        online = make_spool(db, tmp_path, stored)
+        await online.start(accept=True)
+        assert online.depth == 3
+        await wait_until(lambda: online.depth == 0)
+        await online.stop()
+        return db, stored, last
+
+    db, stored, last = asyncio.run(main())
+    assert sorted(db.responses.docs) == sorted(response["id"] for response in responses)
+    assert sorted(stored) == sorted(db.responses.docs)
+    # The torn line was cut off on recovery rather than replayed or left to break later appends
+    assert b"torn" not in last.read_bytes()
+
+
+def test_replay_from_an_older_checkpoint_stores_no_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "RESPONSE_SPOOL_DRAIN_IDLE_SECONDS", 0.01)
+    db = FakeDb()
+
+    async def main():
+        first = make_spool(db, tmp_path, [])
+        await first.start(accept=True)
+        for n in range(5):
+            await first.append(make_response(n))
+        await wait_until(lambda: first.depth == 0)
+        await first.stop()
+        assert len(db.responses.docs) == 5
+
+        # As if the process died after inserting but before saving its checkpoint
+        (tmp_path / "checkpoint.json").write_text(json.dumps({"segment": 0, "offset": 0}))
+        stored = []
+        replay = make_spool(db, tmp_path, stored)
+        await replay.start(accept=True)
+        assert replay.depth == 5
+        await wait_until(lambda: replay.depth == 0)
+        assert replay.lag_seconds() == 0.0
+        await replay.stop()
+        return stored
+
+    stored = asyncio.run(main())
+    assert len(db.responses.docs) == 5
+    # Duplicates are not reported as newly stored
+    assert stored == []
+
+
+def test_segments_roll_over_and_drained_ones_are_deleted(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "RESPONSE_SPOOL_DRAIN_IDLE_SECONDS", 0.01)
+    db = FakeDb()
+
+    async def main():
+        rolling = make_spool(db, tmp_path, [], segment_bytes=200, drain_batch=2)
+        await rolling.start(accept=True)
+        for n in range(6):
+            await rolling.append(make_response(n))
+        await wait_until(lambda: rolling.depth == 0 and len(db.responses.docs) == 6)
+        await rolling.stop()
+
+    asyncio.run(main())
+    # Writes rolled over to later segments, and only the active one is left once the rest are drained
+    numbers = segment_numbers(tmp_path)
+    assert len(numbers) == 1 and numbers[0] > 0
+    assert len(db.responses.docs) == 6
+
+
+def test_rejected_records_are_dead_lettered_without_blocking_the_spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "RESPONSE_SPOOL_DRAIN_IDLE_SECONDS", 0.01)
+    monkeypatch.setattr(spool, "RESPONSE_SPOOL_RETRY_SECONDS", 0.01)
+    responses = [make_response(n) for n in range(6)]
+    db = FakeDb()
+    db.responses.invalid.add(responses[1]["id"])
+    db.responses.too_large.add(responses[4]["id"])
+    # A transient error retries the batch rather than dead-lettering anything
+    db.responses.stepdowns = 1
+
+    dead_letters = metrics.counters["response_spool_dead_letters"]
+
+    async def main():
+        stored = []
+        draining = make_spool(db, tmp_path, stored)
+        await draining.start(accept=True)
+        for response in responses:
+            await draining.append(response)
+        await wait_until(lambda: draining.depth == 0)
+        await draining.stop()
+        return stored
+
+    stored = asyncio.run(main())
+    accepted = [r["id"] for n, r in enumerate(responses) if n not in (1, 4)]
+    assert sorted(db.responses.docs) == sorted(accepted)
+    assert sorted(stored) == sorted(accepted)
+
+    dead = [json.loads(line) for line in (tmp_path / "dead-letter.jsonl").read_text().splitlines()]
+    assert sorted(record["doc"]["id"] for record in dead) == sorted([responses[1]["id"], responses[4]["id"]])
+    assert any(record["error"].startswith("121:") for record in dead)
+    assert all(record["doc"]["responses"] for record in dead)
+    assert metrics.counters["response_spool_dead_letters"] - dead_letters == 2
+    # The checkpoint moved past them
+    assert json.loads((tmp_path / "checkpoint.json").read_text())["offset"] > 0
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from stats import StatsAccumulator, estimate_question_stats, finite_population_correction, proportion_interval
+
+QUESTIONS = [
+    {"id": "colour", "type": "multiple_choice", "title": "Colour"},
+    {"id": "score", "type": "rating", "title": "Score"},
+    {"id": "comment", "type": "text", "title": "Comment"},
+]
+COLOURS = ["red", "green", "blue"]
+
+
+def make_responses(count, seed=7):
+    rng = random.Random(seed)
+    responses = []
+    for _ in range(count):
+        answers = {"colour": rng.choices(COLOURS, weights=[5, 3, 2])[0], "score": rng.randint(1, 5)}
+        if rng.random() < 0.3:
+            answers["comment"] = "ok"
+        responses.append({"responses": answers})
+    return responses
+
+
+def test_wilson_interval_matches_known_values():
+    low, high = proportion_interval(50, 100)
+    assert low == pytest.approx(0.4038, abs=1e-4)
+    assert high == pytest.approx(0.5962, abs=1e-4)
+    # Unlike the normal approximation it stays inside [0, 1] and is not empty at the extremes
+    low, high = proportion_interval(0, 20)
+    assert low == 0.0 and high == pytest.approx(0.1611, abs=1e-4)
+    assert proportion_interval(0, 0) == (0.0, 1.0)
+
+
+def test_finite_population_correction_narrows_to_nothing_for_a_census():
+    assert finite_population_correction(100, 100) == 0.0
+    assert finite_population_correction(100, 10_000) == pytest.approx(0.995, abs=1e-3)
+    assert proportion_interval(30, 100, fpc=0.0) == (0.3, 0.3)
+
+
+def test_a_full_sample_gives_exact_counts_and_empty_intervals():
+    responses = make_responses(500)
+    exact = StatsAccumulator(QUESTIONS).add_all(responses).question_stats()
+    size, estimated = estimate_question_stats(QUESTIONS, responses, len(responses))
+    assert size == 500
+    for question_id in ("colour", "score", "comment"):
+        stats = estimated[question_id]
+        assert stats["answered_count"] == exact[question_id]["answered_count"]
+        assert stats["confidence_intervals"]["answered_count"] == [stats["answered_count"]] * 2
+    for colour, count in exact["colour"]["option_distribution"].items():
+        assert estimated["colour"]["confidence_intervals"]["option_distribution"][colour] == [count, count]
+    assert estimated["score"]["average_rating"] == pytest.approx(exact["score"]["average_rating"])
+
+
+def test_sampled_intervals_cover_the_true_counts():
+    population = make_responses(20_000)
+    truth = StatsAccumulator(QUESTIONS).add_all(population).question_stats()
+    rng = random.Random(1)
+    covered = trials = 0
+    for _ in range(40):
+        _, estimated = estimate_question_stats(QUESTIONS, rng.sample(population, 1000), len(population))
+        for colour in COLOURS:
+            low, high = estimated["colour"]["confidence_intervals"]["option_distribution"][colour]
+            assert low <= estimated["colour"]["option_distribution"][colour] <= high
+            covered += low <= truth["colour"]["option_distribution"][colour] <= high
+            trials += 1
+        low, high = estimated["comment"]["confidence_intervals"]["answered_count"]
+        covered += low <= truth["comment"]["answered_count"] <= high
+        trials += 1
+        low, high = estimated["score"]["confidence_intervals"]["average_rating"]
+        covered += low <= truth["score"]["average_rating"] <= high
+        trials += 1
+    # 95% intervals; a little slack for the fixed seed
+    assert covered / trials >= 0.9
+
+
+def test_exact_archived_stats_are_added_without_widening_intervals():
+    archived = StatsAccumulator(QUESTIONS).add_all(make_responses(300, seed=3))
+    sample = make_responses(200)
+    _, without = estimate_question_stats(QUESTIONS, sample, 2000)
+    _, with_archive = estimate_question_stats(QUESTIONS, sample, 2000, archived)
+
+    archived_stats = archived.question_stats()
+    for colour in COLOURS:
+        known = archived_stats["colour"]["option_distribution"].get(colour, 0)
+        low, high = without["colour"]["confidence_intervals"]["option_distribution"][colour]
+        assert with_archive["colour"]["confidence_intervals"]["option_distribution"][colour] == [low + known, high + known]
+    assert with_archive["comment"]["completion_rate"] == pytest.approx(
+        with_archive["comment"]["answered_count"] / 2300 * 100
+    )
@@ -0,0 +1,254 @@
+"""Behaviour every storage backend must share.
+
+The SQLite backend always runs; the MongoDB backend runs when TEST_MONGO_URL
+points at a server, against a throwaway database.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from stats import StatsAccumulator
+from storage import DuplicateResponse, SqliteStore
+
+QUESTIONS = [
+    {"id": "name", "type": "text", "title": "Name"},
+    {"id": "colour", "type": "multiple_choice", "title": "Colour"},
+    {"id": "score", "type": "rating", "title": "Score"},
+]
+
+
+def make_survey(title="Survey", is_template=False):
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    return {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "description": None,
+        "questions": QUESTIONS,
+        "is_template": is_template,
+        "template_category": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def make_response(survey_id, minutes, answers, idempotency_key=None):
+    response = {
+        "id": str(uuid.uuid4()),
+        "survey_id": survey_id,
+        "responses": answers,
+        "submitted_at": datetime(2024, 1, 1) + timedelta(minutes=minutes),
+    }
+    if idempotency_key is not None:
+        response["idempotency_key"] = idempotency_key
+    return response
+
+
+@pytest.fixture(params=["sqlite", "mongo"])
+def run_with_store(request, tmp_path):
+    """Run an async scenario against a fresh store of each backend."""
+    if request.param == "mongo":
+        mongo_url = os.environ.get("TEST_MONGO_URL")
+        if not mongo_url:
+            pytest.skip("TEST_MONGO_URL is not set")
+
+    def run(scenario):
+        async def main():
+            if request.param == "sqlite":
+                store = SqliteStore(tmp_path / "surveys.db")
+                cleanup = None
+            else:
+                from motor.motor_asyncio import AsyncIOMotorClient
+                from storage import MongoStore
+
+                client = AsyncIOMotorClient(mongo_url)
+                db = client[f"test_storage_{uuid.uuid4().hex[:8]}"]
+                store = MongoStore(db)
+
+                async def cleanup():
+                    await client.drop_database(db.name)
+                    client.close()
+
+            await store.ensure_indexes()
+            try:
+                await scenario(store)
+            finally:
+                await store.close()
+                if cleanup is not None:
+                    await cleanup()
+
+        asyncio.run(main())
+
+    return run
+
+
+def test_survey_crud(run_with_store):
+    async def scenario(store):
+        survey, other, template = make_survey("A"), make_survey("B"), make_survey("T", is_template=True)
+        await store.insert_surveys([survey, other, template])
+
+        fetched = await store.get_survey(survey["id"])
+        assert fetched["title"] == "A"
+        assert fetched["questions"] == QUESTIONS
+        assert fetched["created_at"] == survey["created_at"]
+        assert await store.get_survey(survey["id"], is_template=True) is None
+        assert (await store.get_survey(template["id"], is_template=True))["title"] == "T"
+
+        assert {s["id"] for s in await store.list_surveys(is_template=False)} == {survey["id"], other["id"]}
+        assert [s["id"] for s in await store.list_surveys(is_template=True)] == [template["id"]]
+        chosen = await store.list_surveys(is_template=False, ids=[other["id"], template["id"], "missing"])
+        assert [s["id"] for s in chosen] == [other["id"]]
+
+        updated_at = datetime(2024, 2, 1)
+        replaced = await store.replace_survey(survey["id"], {"title": "A2", "updated_at": updated_at})
+        assert replaced["title"] == "A2" and replaced["updated_at"] == updated_at
+        assert (await store.get_survey(survey["id"]))["title"] == "A2"
+        assert await store.replace_survey("missing", {"title": "x"}) is None
+
+        assert await store.delete_survey(other["id"]) is True
+        assert await store.delete_survey(other["id"]) is False
+        assert await store.get_survey(other["id"]) is None
+
+    run_with_store(scenario)
+
+
+def test_responses_and_idempotency(run_with_store):
+    async def scenario(store):
+        survey = make_survey()
+        await store.insert_surveys([survey])
+        first = make_response(survey["id"], 1, {"name": "Ann"}, idempotency_key="key-1")
+        await store.insert_response(first)
+        await store.insert_response(make_response(survey["id"], 2, {"name": "Bob"}))
+        await store.insert_response(make_response(survey["id"], 3, {"name": "Cy"}))
+
+        with pytest.raises(DuplicateResponse):
+            await store.insert_response(make_response(survey["id"], 4, {"name": "Ann"}, idempotency_key="key-1"))
+        original = await store.find_response(survey["id"], "key-1")
+        assert original["id"] == first["id"]
+        assert original["submitted_at"] == first["submitted_at"]
+        assert await store.find_response(survey["id"], "key-2") is None
+
+        assert await store.count_responses(survey["id"]) == 3
+        newest = await store.list_responses(survey["id"], 0, 2)
+        assert [r["responses"]["name"] for r in newest] == ["Cy", "Bob"]
+        oldest = await store.list_responses(survey["id"], 1, 5, direction=1)
+        assert [r["responses"]["name"] for r in oldest] == ["Bob", "Cy"]
+        by_answer = await store.list_responses(survey["id"], 0, 3, sort_by="responses.name", direction=1)
+        assert [r["responses"]["name"] for r in by_answer] == ["Ann", "Bob", "Cy"]
+
+    run_with_store(scenario)
+
+
+def test_recently_active_survey_ids(run_with_store):
+    async def scenario(store):
+        first, second, quiet = make_survey("A"), make_survey("B"), make_survey("C")
+        await store.insert_surveys([first, second, quiet])
+        for minutes, survey in enumerate([quiet, first, second, first]):
+            await store.insert_response(make_response(survey["id"], minutes, {"name": "Ann"}))
+
+        assert await store.recently_active_survey_ids(limit=2, scan=100) == [first["id"], second["id"]]
+        assert await store.recently_active_survey_ids(limit=10, scan=2) == [first["id"], second["id"]]
+
+    run_with_store(scenario)
+
+
+def test_response_stats(run_with_store):
+    async def scenario(store):
+        survey = make_survey()
+        other = make_survey()
+        await store.insert_surveys([survey, other])
+        answers = [
+            {"colour": "red", "score": 4},
+            {"colour": "red", "score": 2},
+            {"colour": "blue"},
+            {"name": "Dee"},
+        ]
+        for minutes, answer in enumerate(answers):
+            await store.insert_response(make_response(survey["id"], minutes, answer))
+        await store.insert_response(make_response(other["id"], 0, {"colour": "green", "score": 5}))
+
+        stats = await store.response_stats(survey, StatsAccumulator(QUESTIONS))
+        result = stats.question_stats(4)
+        assert stats.total_responses == 4
+        assert result["colour"]["option_distribution"] == {"red": 2, "blue": 1}
+        assert result["colour"]["completion_rate"] == 75
+        assert result["score"]["average_rating"] == 3
+        assert result["name"]["answered_count"] == 1
+
+    run_with_store(scenario)
+
+
+def test_deleting_a_sqlite_survey_removes_its_responses(tmp_path):
+    # MongoDB purges responses in the background, so this only holds for SQLite
+    async def main():
+        store = SqliteStore(tmp_path / "surveys.db")
+        await store.ensure_indexes()
+        try:
+            survey = make_survey()
+            await store.insert_surveys([survey])
+            await store.insert_response(make_response(survey["id"], 0, {"name": "Ann"}))
+            assert await store.delete_survey(survey["id"])
+            assert await store.count_responses(survey["id"]) == 0
+        finally:
+            await store.close()
+
+    asyncio.run(main())
+
+
+def test_sqlite_uses_wal(tmp_path):
+    async def main():
+        store = SqliteStore(tmp_path / "surveys.db")
+        await store.ensure_indexes()
+        try:
+            mode = await store._run(lambda connection: connection.execute("PRAGMA journal_mode").fetchone()[0])
+            plan = await store._run(lambda connection: connection.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM responses WHERE survey_id = ? ORDER BY submitted_at DESC", ("x",)
+            ).fetchall())
+        finally:
+            await store.close()
+        assert mode == "wal"
+        assert any("responses_survey_submitted" in row[3] for row in plan)
+
+    asyncio.run(main())
+
+
+def test_analytics_client_reads_through_its_own_pool(monkeypatch):
+    """Point TEST_MONGO_URL at a replica set (a single node started with --replSet will do)."""
+    mongo_url = os.environ.get("TEST_MONGO_URL")
+    if not mongo_url:
+        pytest.skip("TEST_MONGO_URL is not set")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import ReadPreference
+
+    import storage
+    from storage import MongoStore, mongo_client_options
+
+    monkeypatch.setattr(storage, "ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+    monkeypatch.setattr(storage, "ANALYTICS_MAX_POOL_SIZE", 2)
+
+    async def main():
+        ingest_client = AsyncIOMotorClient(mongo_url, **mongo_client_options("ingest"))
+        analytics_client = AsyncIOMotorClient(mongo_url, **mongo_client_options("analytics"))
+        name = f"test_workloads_{uuid.uuid4().hex[:8]}"
+        try:
+            ingest, analytics = MongoStore(ingest_client[name]), MongoStore(analytics_client[name])
+            assert analytics.db.read_preference == ReadPreference.SECONDARY_PREFERRED
+            survey = make_survey()
+            await ingest.insert_surveys([survey])
+            await ingest.insert_response(make_response(survey["id"], 0, {"name": "Ann"}))
+            # A secondary may lag behind the primary for a moment
+            for _ in range(50):
+                if await analytics.count_responses(survey["id"]) == 1:
+                    break
+                await asyncio.sleep(0.1)
+            assert await analytics.count_responses(survey["id"]) == 1
+            assert analytics_client.options.pool_options.max_pool_size == 2
+        finally:
+            await ingest_client.drop_database(name)
+            ingest_client.close()
+            analytics_client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def make_patch(**fields):
+    return server.SurveyPatch(**fields)
+
+
+def question(question_id, title="Question"):
+    return {"question": {"id": question_id, "type": "text", "title": title}}
+
+
+def test_single_kind_of_change_becomes_an_operator_update():
+    update, array_filters = server.build_survey_patch_update(make_patch(
+        title="Renamed",
+        update_questions=[{"id": "a", "title": "First"}, {"id": "b", "required": True}]
+    ))
+    assert update["$set"]["title"] == "Renamed"
+    assert update["$set"]["questions.$[q0].title"] == "First"
+    assert update["$set"]["questions.$[q1].required"] is True
+    assert array_filters == [{"q0.id": "a"}, {"q1.id": "b"}]
+
+    update, array_filters = server.build_survey_patch_update(make_patch(add_questions=[{**question("c"), "position": 0}]))
+    assert update["$push"]["questions"]["$position"] == 0
+    assert [q["id"] for q in update["$push"]["questions"]["$each"]] == ["c"]
+    assert array_filters is None
+
+    update, _ = server.build_survey_patch_update(make_patch(remove_questions=["a"]))
+    assert update["$pull"] == {"questions": {"id": {"$in": ["a"]}}}
+
+
+def test_repeated_edits_of_one_question_are_merged_into_one_filter():
+    update, array_filters = server.build_survey_patch_update(make_patch(update_questions=[
+        {"id": "a", "title": "First"},
+        {"id": "a", "title": "Second", "required": True},
+    ]))
+    assert array_filters == [{"q0.id": "a"}]
+    assert update["$set"]["questions.$[q0].title"] == "Second"
+    assert update["$set"]["questions.$[q0].required"] is True
+
+
+def test_mixed_changes_become_a_pipeline_with_literal_values():
+    pipeline, array_filters = server.build_survey_patch_update(make_patch(
+        description="$5 off",
+        update_questions=[{"id": "a", "title": "$price"}, {"id": "a", "required": True}],
+        add_questions=[question("c")],
+        remove_questions=["b"],
+        question_order=["c", "a"]
+    ))
+    assert array_filters is None
+    assert [list(stage["$set"]) for stage in pipeline][:4] == [["questions"]] * 4
+    branches = pipeline[1]["$set"]["questions"]["$map"]["in"]["$mergeObjects"][1]["$switch"]["branches"]
+    assert branches == [
+        {"case": {"$eq": ["$$q.id", {"$literal": "a"}]}, "then": {"$literal": {"title": "$price", "required": True}}}
+    ]
+    assert pipeline[-1]["$set"]["description"] == {"$literal": "$5 off"}
@@ -0,0 +1,71 @@
+import asyncio
+
+from warmup import WarmUp
+
+
+def test_ready_only_after_every_step_succeeds_and_failed_steps_are_retried():
+    calls = []
+
+    async def main():
+        warm_up = WarmUp(retry_seconds=0.01)
+
+        @warm_up.step("connections")
+        async def connections():
+            calls.append("connections")
+
+        @warm_up.step("templates")
+        async def templates():
+            calls.append("templates")
+            if calls.count("templates") == 1:
+                raise ConnectionError("database still starting")
+
+        warm_up.start()
+        assert warm_up.status() == {"ready": False, "draining": False, "steps": {"connections": None, "templates": None}}
+        await warm_up._task
+        assert warm_up.status()["ready"]
+        assert set(warm_up.status()["steps"]) == {"connections", "templates"}
+
+        await warm_up.stop()
+        assert warm_up.status()["ready"] is False
+
+    asyncio.run(main())
+    assert calls == ["connections", "templates", "templates"]
+
+
+def test_disabled_warm_up_is_ready_at_once():
+    async def main():
+        warm_up = WarmUp(enabled=False)
+
+        @warm_up.step("never")
+        async def never():
+            raise AssertionError("warm-up is disabled")
+
+        warm_up.start()
+        assert warm_up.status()["ready"]
+
+    asyncio.run(main())
+
+
+def test_required_steps_run_and_gate_readiness_even_when_disabled():
+    calls = []
+
+    async def main():
+        warm_up = WarmUp(enabled=False, retry_seconds=0.01)
+
+        @warm_up.step("indexes", required=True)
+        async def indexes():
+            calls.append("indexes")
+            if len(calls) == 1:
+                raise ConnectionError("database still starting")
+
+        @warm_up.step("templates")
+        async def templates():
+            raise AssertionError("warm-up is disabled")
+
+        warm_up.start()
+        assert not warm_up.status()["ready"]
+        await warm_up._task
+        assert warm_up.status()["ready"]
+
+    asyncio.run(main())
+    assert calls == ["indexes", "indexes"]